@@ -0,0 +1,207 @@
+# Module that times every stage of the pipeline over synthetic datasets of increasing size and saves the results as json
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+try:
+    import resource # not available on windows, peak RSS is then left empty
+except ImportError:
+    resource = None
+
+sys.path.append(os.path.abspath(os.path.dirname(__file__) + "/../src"))
+
+from synthetic_data import SyntheticCollisionData
+from data_cleansing.data_loader import CollisionDataLoader, collision_data, SOURCE_FILES
+from data_cleansing.data_pre_processing import CrashLocationData, LiscenseStatusCollisionData, CrashByPeriodData
+from visualizations.crash_by_period_vis import CrashByPeriodTrends
+from visualizations.cyc_ped__accidents_vis import PedestriansAccidents, PedestriansAccidentsGraphs
+from visualizations.liscense_status_vis import LiscenseStatusTrends
+from visualizations.position_lethality_vis import CarSeatDangers
+from visualizations.seasonal_alcohol import SeasonalAlcoholColissions
+from visualizations.rendering import figure_renderer
+
+BENCHMARK_DIRECTORY = os.path.abspath(os.path.dirname(__file__))
+DATASET_SIZES = [100_000, 1_000_000, 10_000_000] # rows of each table in the standard runs
+
+
+class PreparedDataSource:
+    """Data source over a loader whose cleaned dataframes are built once and then handed out as copies,
+    so the stages after cleaning time only their own work
+    """
+    def __init__(self, loader: CollisionDataLoader):
+        self.loader = loader
+        self.cleaned = {} # output of each cleaning class, by name
+
+    def get_table(self, source: str, columns: list, filters: list = None) -> pd.DataFrame:
+        """Collects the requested columns from the loader, see CollisionDataLoader.get_table
+        """
+        return self.loader.get_table(source, columns, filters)
+
+    def get_cleaned(self, name: str, sources: list, build_function) -> pd.DataFrame:
+        """Builds a cleaned dataframe the first time it is asked for, later calls get a copy of it
+        """
+        if name not in self.cleaned:
+            self.cleaned[name] = build_function()
+        return self.cleaned[name].copy()
+
+
+class StageTimer:
+    """Class responsible for running each stage of the pipeline and recording its wall time, throughput and memory
+    """
+    def __init__(self, trace_allocations: bool = False):
+        self.trace_allocations = trace_allocations # tracemalloc gives exact peaks per stage but slows the stages down
+        self.results = []
+
+    def measure(self, stage: str, rows: int, function, *args):
+        """Runs one stage and records its measurements
+
+        Args:
+            stage (str): name of the stage, e.g. 'clean/CrashLocationData'
+            rows (int): rows going into the stage, used for the throughput - None for the rows the stage produces
+            function (callable): work done by the stage
+            *args: arguments passed to function
+
+        Returns:
+            output of function, None if it raised an error
+        """
+        gc.collect() # garbage of the previous stage isn't charged to this one
+        if self.trace_allocations:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            output = function(*args)
+            status = output if isinstance(output, str) else 'ok' # the analyses return error messages instead of raising
+        except Exception as error:
+            output = None
+            status = type(error).__name__ + ': ' + str(error)
+        wall_seconds = time.perf_counter() - start
+        rows_out = len(output) if isinstance(output, pd.DataFrame) else None
+        rows = (rows_out or 0) if rows is None else rows
+        result = {'stage': stage,
+                  'status': status,
+                  'wall_seconds': wall_seconds,
+                  'rows_in': rows,
+                  'rows_out': rows_out,
+                  'rows_per_second': rows / wall_seconds if wall_seconds > 0 else None,
+                  # high-water mark of the whole process up to the end of the stage
+                  'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource is not None else None,
+                  'peak_allocated_mb': None}
+        if self.trace_allocations:
+            result['peak_allocated_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+        self.results.append(result)
+        return output
+
+
+def run_stages(data_directory: str, timer: StageTimer, render: bool = True):
+    """Runs every stage over one dataset: loading, each cleaning class, each aggregation and each figure
+
+    Args:
+        data_directory (str): folder with the three csv files
+        timer (StageTimer): timer collecting the measurements
+        render (bool, optional): whether the figures are rendered too
+    """
+    loader = CollisionDataLoader(data_directory, use_cache=False) # the parquet cache would hide the parsing cost
+    loader.required_columns = {source: list(columns) for source, columns in collision_data.required_columns.items()}
+    data_source = PreparedDataSource(loader)
+
+    rows = {}
+    for source in SOURCE_FILES:
+        table = timer.measure('load/' + source, None, loader.get_table, source, loader.required_columns[source])
+        rows[source] = len(table) if isinstance(table, pd.DataFrame) else 0
+
+    timer.measure('clean/CrashLocationData', rows['crashes'], lambda: CrashLocationData(data_source).full_geo_data)
+    timer.measure('clean/LiscenseStatusCollisionData', rows['crashes'] + rows['vehicles'],
+                  lambda: LiscenseStatusCollisionData(data_source).complete_liscense_status_df)
+    timer.measure('clean/CrashByPeriodData', rows['crashes'], lambda: CrashByPeriodData(data_source).complete_crash_period_data)
+    car_seat_dangers = CarSeatDangers(data_source)
+    timer.measure('clean/CarSeatDangers', rows['person'], car_seat_dangers.replace_values)
+
+    def cleaned_rows(name):
+        return len(data_source.cleaned[name]) if isinstance(data_source.cleaned.get(name), pd.DataFrame) else 0
+
+    timer.measure('aggregate/CrashByPeriodTrends', cleaned_rows('crash_by_period_data'),
+                  lambda: CrashByPeriodTrends(data_source=data_source).related_to_factors()[0])
+    timer.measure('aggregate/PedestriansAccidentsGraphs', cleaned_rows('crash_location_data'),
+                  lambda: PedestriansAccidentsGraphs(data_source).streets_accidents())
+    timer.measure('aggregate/IntersectionHotspots', cleaned_rows('crash_location_data'),
+                  lambda: PedestriansAccidentsGraphs(data_source).intersection_hotspots())
+
+    def license_compositions():
+        license_trends = LiscenseStatusTrends(data_source)
+        license_trends.get_population_collision_composition()
+        license_trends.get_borough_liscense_composition()
+        license_trends.get_population_liscense_composition()
+        return license_trends.get_borough_collision_composition()
+
+    timer.measure('aggregate/LiscenseStatusTrends', cleaned_rows('liscense_status_collision_data'), license_compositions)
+    timer.measure('aggregate/CarSeatDangers', len(car_seat_dangers.clean_df) if isinstance(car_seat_dangers.clean_df, pd.DataFrame) else 0,
+                  lambda: pd.DataFrame(car_seat_dangers.data_processing()))
+    timer.measure('aggregate/SeasonalAlcoholColissions', rows['crashes'], lambda: SeasonalAlcoholColissions(data_source).data_processing())
+
+    if render: # each figure recomputes the aggregation it shows, as it does when the report is produced
+        timer.measure('render/crash_by_period', cleaned_rows('crash_by_period_data'),
+                      CrashByPeriodTrends(data_source=data_source).crash_by_period_plot)
+        timer.measure('render/pedestrian_accidents_by_street', cleaned_rows('crash_location_data'),
+                      PedestriansAccidentsGraphs(data_source).accidents_graphs_plot)
+        timer.measure('render/pedestrian_accidents_by_intersection', cleaned_rows('crash_location_data'),
+                      PedestriansAccidentsGraphs(data_source).hotspots_graphs_plot)
+        timer.measure('render/pedestrian_accidents_map', cleaned_rows('crash_location_data'), PedestriansAccidents(data_source).plot_accidents)
+        for method in ['pie_chart_borough_collision_composition', 'pie_chart_borough_license_composition', 'scatter_plot']:
+            timer.measure('render/' + method, cleaned_rows('liscense_status_collision_data'), getattr(LiscenseStatusTrends(data_source), method))
+        timer.measure('render/seat_position_severity', rows['person'], CarSeatDangers(data_source).show_graph)
+        timer.measure('render/seasonal_alcohol', rows['crashes'], SeasonalAlcoholColissions(data_source).graph_plotting)
+
+
+def run_environment() -> dict:
+    """Collects what is needed to compare runs made on different versions or machines
+
+    Returns:
+        dict: commit, library versions and machine of the run
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BENCHMARK_DIRECTORY, capture_output=True, text=True).stdout.strip() or None
+    except OSError as error:
+        commit = None
+    return {'commit': commit,
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'machine': platform.platform(),
+            'cpus': os.cpu_count()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Times every stage of the pipeline over seeded synthetic datasets')
+    parser.add_argument('--rows', type=int, nargs='+', default=DATASET_SIZES[:1], help='rows of each table, one run per size')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data')
+    parser.add_argument('--data-dir', default=os.path.join(BENCHMARK_DIRECTORY, 'data'), help='folder the synthetic datasets are kept in')
+    parser.add_argument('--output', default=None, help='json file the results are written to')
+    parser.add_argument('--skip-render', action='store_true', help="don't time the figures")
+    parser.add_argument('--trace-allocations', action='store_true', help='record the peak allocated memory of each stage (slower)')
+    arguments = parser.parse_args()
+
+    figure_renderer.configure(tempfile.mkdtemp(prefix='benchmark_figures_'))
+    report = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'seed': arguments.seed, 'environment': run_environment(), 'runs': []}
+    for rows in arguments.rows:
+        data_directory = os.path.join(arguments.data_dir, str(rows) + '_rows_seed_' + str(arguments.seed))
+        SyntheticCollisionData(rows, arguments.seed).write(data_directory) # reused if it was already generated
+        timer = StageTimer(arguments.trace_allocations)
+        run_stages(data_directory, timer, render=not arguments.skip_render)
+        report['runs'].append({'rows': rows, 'stages': timer.results})
+        for result in timer.results:
+            print(f"{rows:>10} {result['stage']:<48} {result['wall_seconds']:>9.3f}s {result['status']}")
+
+    output_path = arguments.output or os.path.join(BENCHMARK_DIRECTORY, 'results', 'benchmark_' + time.strftime('%Y%m%d_%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w') as output_file:
+        json.dump(report, output_file, indent=2)
+    print('results written to', output_path)
@@ -0,0 +1,195 @@
+# Module that generates synthetic collision datasets with the same layout as the NYC Open Data files, used by the benchmarks
+import os
+import sys
+import json
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.dirname(__file__) + "/../src"))
+
+from data_cleansing.data_loader import SOURCE_FILES
+
+BLOCK_ROWS = 1_000_000 # rows generated and written at a time, so even the largest datasets never sit fully in memory
+FIRST_DAY = pd.Timestamp('2012-07-01') # first day covered by the real crashes dataset
+DAYS_COVERED = 4500
+
+BOROUGHS = ['BROOKLYN', 'QUEENS', 'MANHATTAN', 'BRONX', 'STATEN ISLAND']
+ZIP_CODES = ['10001', '10002', '10003', '10016', '10019', '10025', '10451', '10456', '10467', '11101', '11201', '11207',
+             '11208', '11212', '11226', '11234', '11368', '11385', '11434', '10301', '10306', '10314']
+STREETS = ['BROADWAY', '3 AVENUE', '5 AVENUE', '2 AVENUE', 'ATLANTIC AVENUE', 'QUEENS BOULEVARD', 'NORTHERN BOULEVARD',
+           'FLATBUSH AVENUE', 'GRAND CONCOURSE', 'LINDEN BOULEVARD', 'BELT PARKWAY', 'LONG ISLAND EXPRESSWAY',
+           'BROOKLYN QUEENS EXPRESSWAY', 'FDR DRIVE', 'JAMAICA AVENUE', 'EASTERN PARKWAY', 'OCEAN PARKWAY', 'HYLAN BOULEVARD']
+# listed from the most to the least common, weights follow the same order
+CONTRIBUTING_FACTORS = ['Unspecified', 'Driver Inattention/Distraction', 'Failure to Yield Right-of-Way', 'Following Too Closely',
+                        'Backing Unsafely', 'Other Vehicular', 'Passing or Lane Usage Improper', 'Passing Too Closely',
+                        'Turning Improperly', 'Fatigued/Drowsy', 'Unsafe Lane Changing', 'Traffic Control Disregarded',
+                        'Driver Inexperience', 'Lost Consciousness', 'Pavement Slippery', 'Alcohol Involvement',
+                        'Reaction to Uninvolved Vehicle', 'Unsafe Speed', 'View Obstructed/Limited', 'Aggressive Driving/Road Rage',
+                        'Pedestrian/Bicyclist/Other Pedestrian Error/Confusion', 'Brakes Defective', 'Glare',
+                        'Passenger Distraction', 'Cell Phone (hand-Held)', 'Drugs (illegal)', 'Drugs (Illegal)']
+VEHICLE_TYPES = ['Sedan', 'Station Wagon/Sport Utility Vehicle', 'PASSENGER VEHICLE', 'Taxi', 'Pick-up Truck', 'Box Truck', 'Bus', 'Bike']
+LICENSE_STATUSES = ['Licensed', 'Unlicensed', 'Permit']
+PERSON_TYPES = ['Occupant', 'Pedestrian', 'Bicyclist', 'Other Motorized']
+PERSON_INJURIES = ['Unspecified', 'Injured', 'Killed']
+POSITIONS = ['Driver',
+             'Front passenger, if two or more persons, including the driver, are in the front seat',
+             'Right rear passenger or motorcycle sidecar passenger',
+             'Left rear passenger, or rear passenger on a bicycle, motorcycle, snowmobile',
+             'Middle rear seat, or passenger lying across a seat',
+             'Any person in the rear of a station wagon, pick-up truck, all passengers on a bus, etc',
+             'Riding/Hanging on Outside', 'Unknown', 'Does Not Apply']
+SAFETY_EQUIPMENT = ['Lap Belt & Harness', 'Lap Belt', 'None', 'Unknown', 'Air Bag Deployed', 'Helmet (Motorcycle Only)', 'Other']
+COMPLAINTS = ['Complaint of Pain or Nausea', 'None Visible', 'Does Not Apply', 'Unknown', 'Contusion - Bruise', 'Abrasion',
+              'Minor Bleeding', 'Whiplash', 'Fracture - Dislocation', 'Severe Bleeding', 'Concussion', 'Internal',
+              'Crush Injuries', 'Minor Burn', 'Moderate Burn', 'Severe Burn', 'Amputation', 'Paralysis']
+
+
+class SyntheticCollisionData:
+    """Class responsible for writing seeded synthetic Crashes, Vehicles and Person csv files with the columns,
+    value vocabularies and missing value rates of the real datasets - the same seed always gives the same files
+    """
+    def __init__(self, rows: int, seed: int = 0, block_rows: int = BLOCK_ROWS):
+        self.rows = rows # rows of each of the three tables
+        self.seed = seed
+        self.block_rows = block_rows
+
+    def skewed_choice(self, rng: np.random.Generator, values: list, size: int, missing_rate: float = 0) -> np.ndarray:
+        """Draws values with a long tailed distribution, the first ones being the most common
+
+        Args:
+            rng (np.random.Generator): generator of the block being written
+            values (list): possible values, from the most to the least common
+            size (int): number of values drawn
+            missing_rate (float, optional): share of the values left empty
+
+        Returns:
+            np.ndarray: object array with the drawn values, NaN where empty
+        """
+        weights = 1 / np.arange(1, len(values) + 1)
+        drawn = np.array(values, dtype=object)[rng.choice(len(values), size, p=weights / weights.sum())]
+        drawn[rng.random(size) < missing_rate] = np.nan
+        return drawn
+
+    def victim_counts(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        """Draws numbers of injured/killed people, most crashes having none
+
+        Args:
+            rng (np.random.Generator): generator of the block being written
+            size (int): number of values drawn
+
+        Returns:
+            np.ndarray: counts, with a few missing values
+        """
+        counts = rng.choice([0, 1, 2], size, p=[0.93, 0.06, 0.01]).astype(float)
+        counts[rng.random(size) < 0.001] = np.nan
+        return counts
+
+    def crashes_block(self, rng: np.random.Generator, first_id: int, size: int) -> pd.DataFrame:
+        """Generates a block of the crashes table
+
+        Args:
+            rng (np.random.Generator): generator of the block
+            first_id (int): COLLISION_ID of the first crash of the block
+            size (int): number of crashes
+
+        Returns:
+            pd.DataFrame: block with every column of the crashes csv
+        """
+        crash_days = FIRST_DAY + pd.to_timedelta(rng.integers(0, DAYS_COVERED, size), unit='D')
+        minutes = rng.integers(0, 24 * 60, size)
+        latitudes = 40.5 + rng.random(size) * 0.4 # bounding box of New York City
+        longitudes = -74.25 + rng.random(size) * 0.55
+        missing_location = rng.random(size) < 0.08
+        latitudes[missing_location] = np.nan
+        longitudes[missing_location] = np.nan
+        latitudes[rng.random(size) < 0.002] = 0 # the real data has a few points at latitude 0
+        longitudes[latitudes == 0] = 0
+        crashes = {'CRASH DATE': crash_days.strftime('%m/%d/%Y'),
+                   'CRASH TIME': pd.Series(minutes // 60).astype(str) + ':' + pd.Series(minutes % 60).astype(str).str.zfill(2),
+                   'BOROUGH': self.skewed_choice(rng, BOROUGHS, size, 0.3),
+                   'ZIP CODE': self.skewed_choice(rng, ZIP_CODES, size, 0.3),
+                   'LATITUDE': latitudes,
+                   'LONGITUDE': longitudes,
+                   'LOCATION': np.nan,
+                   'ON STREET NAME': self.skewed_choice(rng, STREETS, size, 0.2),
+                   'CROSS STREET NAME': self.skewed_choice(rng, STREETS, size, 0.4),
+                   'OFF STREET NAME': self.skewed_choice(rng, STREETS, size, 0.8)}
+        for victim in ['PERSONS', 'PEDESTRIANS', 'CYCLIST', 'MOTORIST']:
+            crashes['NUMBER OF ' + victim + ' INJURED'] = self.victim_counts(rng, size)
+            crashes['NUMBER OF ' + victim + ' KILLED'] = self.victim_counts(rng, size) * (rng.random(size) < 0.01)
+        for vehicle, missing_rate in enumerate([0.003, 0.15, 0.93, 0.98, 0.995], start=1):
+            crashes['CONTRIBUTING FACTOR VEHICLE ' + str(vehicle)] = self.skewed_choice(rng, CONTRIBUTING_FACTORS, size, missing_rate)
+        crashes['COLLISION_ID'] = np.arange(first_id, first_id + size)
+        for vehicle, missing_rate in enumerate([0.01, 0.2, 0.93, 0.98, 0.995], start=1):
+            crashes['VEHICLE TYPE CODE ' + str(vehicle)] = self.skewed_choice(rng, VEHICLE_TYPES, size, missing_rate)
+        return pd.DataFrame(crashes)
+
+    def vehicles_block(self, rng: np.random.Generator, first_id: int, size: int) -> pd.DataFrame:
+        """Generates a block of the vehicles table, every vehicle belonging to a crash of the crashes table
+
+        Args:
+            rng (np.random.Generator): generator of the block
+            first_id (int): UNIQUE_ID of the first vehicle of the block
+            size (int): number of vehicles
+
+        Returns:
+            pd.DataFrame: block with the columns of the vehicles csv
+        """
+        return pd.DataFrame({'UNIQUE_ID': np.arange(first_id, first_id + size),
+                             'COLLISION_ID': rng.integers(1, self.rows + 1, size),
+                             'VEHICLE_ID': rng.integers(1, 10 ** 6, size).astype(str),
+                             'STATE_REGISTRATION': self.skewed_choice(rng, ['NY', 'NJ', 'PA', 'FL'], size, 0.05),
+                             'VEHICLE_TYPE': self.skewed_choice(rng, VEHICLE_TYPES, size, 0.05),
+                             'VEHICLE_YEAR': rng.integers(1990, 2025, size).astype(float),
+                             'DRIVER_SEX': self.skewed_choice(rng, ['M', 'F', 'U'], size, 0.4),
+                             'DRIVER_LICENSE_STATUS': self.skewed_choice(rng, LICENSE_STATUSES, size, 0.45),
+                             'PRE_CRASH': self.skewed_choice(rng, ['Going Straight Ahead', 'Parked', 'Stopped in Traffic', 'Making Left Turn'], size, 0.05),
+                             'CONTRIBUTING_FACTOR_1': self.skewed_choice(rng, CONTRIBUTING_FACTORS, size, 0.05),
+                             'CONTRIBUTING_FACTOR_2': self.skewed_choice(rng, CONTRIBUTING_FACTORS, size, 0.1)})
+
+    def person_block(self, rng: np.random.Generator, first_id: int, size: int) -> pd.DataFrame:
+        """Generates a block of the person table, every person belonging to a crash of the crashes table
+
+        Args:
+            rng (np.random.Generator): generator of the block
+            first_id (int): UNIQUE_ID of the first person of the block
+            size (int): number of people
+
+        Returns:
+            pd.DataFrame: block with the columns of the person csv
+        """
+        return pd.DataFrame({'UNIQUE_ID': np.arange(first_id, first_id + size),
+                             'COLLISION_ID': rng.integers(1, self.rows + 1, size),
+                             'PERSON_TYPE': self.skewed_choice(rng, PERSON_TYPES, size),
+                             'PERSON_INJURY': np.array(PERSON_INJURIES, dtype=object)[rng.choice(3, size, p=[0.75, 0.245, 0.005])],
+                             'PERSON_AGE': rng.integers(0, 90, size).astype(float),
+                             'EJECTION': self.skewed_choice(rng, ['Not Ejected', 'Ejected', 'Partially Ejected'], size, 0.5),
+                             'POSITION_IN_VEHICLE': self.skewed_choice(rng, POSITIONS, size, 0.1),
+                             'SAFETY_EQUIPMENT': self.skewed_choice(rng, SAFETY_EQUIPMENT, size, 0.5),
+                             'COMPLAINT': self.skewed_choice(rng, COMPLAINTS, size, 0.1),
+                             'PERSON_SEX': self.skewed_choice(rng, ['M', 'F', 'U'], size, 0.1)})
+
+    def write(self, data_directory: str):
+        """Writes the three csv files block by block, skipping the work if the same dataset is already there
+
+        Args:
+            data_directory (str): folder the csv files are written to, read later through CollisionDataLoader
+        """
+        description = {'rows': self.rows, 'seed': self.seed}
+        description_path = os.path.join(data_directory, 'synthetic.json')
+        if os.path.exists(description_path):
+            with open(description_path) as description_file:
+                if json.load(description_file) == description:
+                    return
+        os.makedirs(data_directory, exist_ok=True)
+        if os.path.exists(description_path):
+            os.remove(description_path) # files are about to change, a run interrupted now must not look complete
+        block_builders = {'crashes': self.crashes_block, 'vehicles': self.vehicles_block, 'person': self.person_block}
+        for source_index, (source, build_block) in enumerate(block_builders.items()):
+            rng = np.random.default_rng([self.seed, source_index]) # one stream per table, so each table is reproducible on its own
+            source_path = os.path.join(data_directory, SOURCE_FILES[source])
+            for block_start in range(0, self.rows, self.block_rows):
+                block = build_block(rng, block_start + 1, min(self.block_rows, self.rows - block_start))
+                block.to_csv(source_path, mode='w' if block_start == 0 else 'a', header=block_start == 0, index=False)
+        with open(description_path, 'w') as description_file: # only written once every file is complete
+            json.dump(description, description_file)
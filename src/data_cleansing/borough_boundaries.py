@@ -0,0 +1,105 @@
+# MODULE RESPONSIBLE FOR FINDING THE BOROUGH OF COLLISIONS THAT HAVE COORDINATES BUT NO BOROUGH, FROM THE BOROUGH BOUNDARIES
+import os
+import json
+import functools
+import numpy as np
+import pandas as pd
+import shapely
+
+from instrumentation import trace_class
+from data_cleansing.data_loader import DATA_DIRECTORY, DEPENDENCY_FILES
+
+BOROUGH_BOUNDARIES_PATH = os.path.join(DATA_DIRECTORY, DEPENDENCY_FILES['borough_boundaries'])
+BOROUGH_NAME_PROPERTIES = ['boro_name', 'BoroName', 'BOROUGH'] # property holding the name, depending on the export of the file
+LOCATE_BATCH_SIZE = 1_000_000 # points tested against the polygons at a time, bounding the memory of the point geometries
+
+
+@trace_class
+class BoroughBoundaryIndex:
+    """Class responsible for locating points inside the borough boundary polygons, through an STRtree over the polygons
+
+    Only the distinct coordinates are located, in batches of vectorized point-in-polygon queries
+    """
+    def __init__(self, boundaries_path: str = BOROUGH_BOUNDARIES_PATH):
+        with open(boundaries_path) as boundaries_file:
+            features = json.load(boundaries_file)['features']
+        self.boroughs = [] # borough name of each polygon, as written in the collision data
+        polygons = []
+        for feature in features:
+            properties = feature['properties']
+            name_property = next(name for name in BOROUGH_NAME_PROPERTIES if name in properties)
+            self.boroughs.append(str(properties[name_property]).upper())
+            polygons.append(shapely.geometry.shape(feature['geometry']))
+        self.polygons = np.array(polygons, dtype=object)
+        self.tree = shapely.STRtree(self.polygons)
+
+    def locate(self, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+        """Finds the polygon each point falls in
+
+        Args:
+            latitudes (np.ndarray): latitude of each point
+            longitudes (np.ndarray): longitude of each point
+
+        Returns:
+            np.ndarray: position in self.boroughs of the polygon of each point, -1 for points outside all of them or without coordinates
+        """
+        polygon_of_point = np.full(len(latitudes), -1, dtype=np.int64)
+        valid_points = np.flatnonzero(np.isfinite(latitudes) & np.isfinite(longitudes))
+        for batch_start in range(0, len(valid_points), LOCATE_BATCH_SIZE):
+            batch = valid_points[batch_start:batch_start + LOCATE_BATCH_SIZE]
+            points = shapely.points(longitudes[batch], latitudes[batch])
+            point_positions, polygon_positions = self.tree.query(points, predicate='intersects')
+            # a point on the border of two boroughs is given to the first one
+            polygon_of_point[batch[point_positions[::-1]]] = polygon_positions[::-1]
+        return polygon_of_point
+
+
+def borough_boundaries(boundaries_path: str = BOROUGH_BOUNDARIES_PATH) -> BoroughBoundaryIndex:
+    """Index of the borough boundaries of a file, built once per process and version of the file
+
+    Args:
+        boundaries_path (str): geojson with one polygon per borough
+
+    Returns:
+        BoroughBoundaryIndex: index of the boundaries, None if the file is missing
+    """
+    if not os.path.exists(boundaries_path):
+        return None
+    file_status = os.stat(boundaries_path)
+    return load_borough_boundaries(boundaries_path, file_status.st_size, file_status.st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=4)
+def load_borough_boundaries(boundaries_path: str, file_size: int, file_mtime: int) -> BoroughBoundaryIndex:
+    """Builds the index of a version of the boundaries file - size and modification time only key the cache"""
+    return BoroughBoundaryIndex(boundaries_path)
+
+
+def fill_missing_boroughs(crashes: pd.DataFrame, data_source=None) -> pd.Series:
+    """Fills the borough of crashes without one from their coordinates, leaving them missing if the boundaries file isn't there
+
+    Args:
+        crashes (pd.DataFrame): crashes with BOROUGH, LATITUDE and LONGITUDE columns
+        data_source (optional): loader the crashes came from, whose data directory holds the boundaries file
+
+    Returns:
+        pd.Series: borough of each crash, with the same dtype as the BOROUGH column
+    """
+    boroughs = crashes['BOROUGH']
+    boundaries_path = data_source.source_path('borough_boundaries') if hasattr(data_source, 'source_path') else BOROUGH_BOUNDARIES_PATH
+    boundary_index = borough_boundaries(boundaries_path)
+    missing = boroughs.isna().to_numpy()
+    if boundary_index is None or not missing.any():
+        return boroughs
+    # crashes at the same spot are located once
+    coordinates = crashes.loc[missing, ['LATITUDE', 'LONGITUDE']].to_numpy(dtype=np.float64)
+    distinct_coordinates, coordinate_codes = np.unique(coordinates, axis=0, return_inverse=True)
+    polygon_codes = boundary_index.locate(distinct_coordinates[:, 0], distinct_coordinates[:, 1])[coordinate_codes.ravel()]
+    located_names = np.append(np.array(boundary_index.boroughs, dtype=object), None)[polygon_codes] # slot at the end for -1
+    if isinstance(boroughs.dtype, pd.CategoricalDtype): # names outside the shared categories are added, not turned into missing
+        new_names = [name for name in boundary_index.boroughs if name not in boroughs.cat.categories]
+        boroughs = boroughs.cat.add_categories(list(dict.fromkeys(new_names))) if new_names else boroughs.copy()
+    else:
+        boroughs = boroughs.copy()
+    boroughs[missing] = located_names
+    return boroughs
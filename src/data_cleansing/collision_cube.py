@@ -0,0 +1,352 @@
+# MODULE RESPONSIBLE FOR COUNTING COLLISIONS ONCE OVER A FEW SMALL DIMENSIONS, SO ANALYSES ARE ANSWERED WITHOUT SCANNING THE ROWS AGAIN
+import os
+import numpy as np
+import pandas as pd
+
+from instrumentation import trace_class
+from data_cleansing.data_loader import collision_data, DATA_DIRECTORY
+from data_cleansing.data_cache import CACHE_VERSION
+from data_cleansing.data_pre_processing import (CrashByPeriodData, LiscenseStatusCollisionData, CrashLocationData,
+                                                CRASH_LOCATION_COLUMNS, CRASH_PERIOD_COLUMNS,
+                                                LISCENSE_STATUS_CRASH_COLUMNS, LISCENSE_STATUS_VEHICLE_COLUMNS)
+from data_cleansing.factor_counting import ContributingFactorCounter
+from data_cleansing.borough_boundaries import fill_missing_boroughs
+
+CUBE_PATH = os.path.join(DATA_DIRECTORY, "cache", "collision_cube.npz")
+CUBE_VERSION = 3 # must be increased whenever the arrays of the cube change, so old cube files are rebuilt
+CUBE_SOURCES = ['crashes', 'vehicles'] # the cube is rebuilt when one of them changes
+VICTIM_COLUMNS = ['NUMBER OF PEDESTRIANS INJURED', 'NUMBER OF PEDESTRIANS KILLED',
+                  'NUMBER OF CYCLIST INJURED', 'NUMBER OF CYCLIST KILLED',
+                  'NUMBER OF MOTORIST INJURED', 'NUMBER OF MOTORIST KILLED']
+CRASH_MEASURES = ['COLLISIONS'] + VICTIM_COLUMNS # additive measures of every cell of the crash counts
+CRASH_DIMENSIONS = ['MONTH', 'HOUR', 'BOROUGH', 'CONTRIBUTING FACTOR VEHICLE 1']
+CUBE_CRASH_COLUMNS = ['CRASH DATE', 'CRASH TIME', 'BOROUGH', 'LATITUDE', 'LONGITUDE', 'CONTRIBUTING FACTOR VEHICLE 1'] + VICTIM_COLUMNS
+STREET_INCIDENT_COLUMNS = ['GENERAL INCIDENTS',
+                           'NUMBER OF CYCLIST INJURED',
+                           'NUMBER OF CYCLIST KILLED',
+                           'NUMBER OF PEDESTRIANS INJURED',
+                           'NUMBER OF PEDESTRIANS KILLED']
+collision_data.register_columns('crashes', CUBE_CRASH_COLUMNS)
+# every column the cube is counted from, so a subset of the rows can be counted on its own
+CUBE_COLUMNS = {'crashes': list(dict.fromkeys(['COLLISION_ID'] + CUBE_CRASH_COLUMNS + CRASH_PERIOD_COLUMNS + CRASH_LOCATION_COLUMNS + LISCENSE_STATUS_CRASH_COLUMNS)),
+                'vehicles': LISCENSE_STATUS_VEHICLE_COLUMNS}
+# labels of each axis of each array of counts, None for axes with fixed positions (months, hours, measures)
+CUBE_AXES = {'crash_counts': [None, None, 'boroughs', 'crash_factors', None],
+             'period_counts': [None, 'period_factors'],
+             'vehicle_counts': ['vehicle_boroughs', 'license_statuses', 'vehicle_factors_1', 'vehicle_factors_2'],
+             'street_counts': ['streets', None]}
+
+
+def month_codes(crash_dates: pd.Series) -> np.ndarray:
+    """Month of each crash date, parsing each distinct date only once
+
+    Args:
+        crash_dates (pd.Series): dates formatted as month/day/year
+
+    Returns:
+        np.ndarray: month from 0 (January) to 11, -1 where the date is missing or invalid
+    """
+    date_codes, distinct_dates = pd.factorize(crash_dates)
+    distinct_months = pd.to_datetime(pd.Series(distinct_dates, dtype=object), format="%m/%d/%Y", errors='coerce').dt.month
+    distinct_months = np.append(distinct_months.fillna(0).to_numpy(dtype=np.int64) - 1, -1) # slot at the end for missing dates (code -1)
+    return distinct_months[date_codes]
+
+
+def hour_codes(crash_times: pd.Series) -> np.ndarray:
+    """Hour of each crash time, parsing each distinct time only once
+
+    Args:
+        crash_times (pd.Series): times formatted as hour:minute
+
+    Returns:
+        np.ndarray: hour from 0 to 23, -1 where the time is missing or invalid
+    """
+    time_codes, distinct_times = pd.factorize(crash_times)
+    distinct_hours = pd.to_numeric(pd.Series(distinct_times, dtype=object).str.split(':', n=1).str[0], errors='coerce')
+    distinct_hours = distinct_hours.where((distinct_hours >= 0) & (distinct_hours < 24)) # anything else is not an hour
+    distinct_hours = np.append(distinct_hours.fillna(-1).to_numpy(dtype=np.int64), -1)
+    return distinct_hours[time_codes]
+
+
+def combine_counts(arrays: dict, other_arrays: dict, sign: int = 1) -> dict:
+    """Adds (or subtracts) the counts of two cubes, aligning every labelled axis by its labels
+
+    Labels only found in the other cube are appended, and an axis that holds missing values keeps them in its last position
+
+    Args:
+        arrays (dict): arrays of the first cube
+        other_arrays (dict): arrays of the cube added to it
+        sign (int, optional): 1 to add the other cube, -1 to retract it
+
+    Returns:
+        dict: arrays of the combined cube
+    """
+    label_names = {name for axes in CUBE_AXES.values() for name in axes if name is not None}
+    labels = {}
+    for name in label_names:
+        new_labels = other_arrays[name][~np.isin(other_arrays[name], arrays[name])]
+        labels[name] = np.concatenate([arrays[name], new_labels]).astype(str)
+    combined = dict(labels)
+    for count_name, axes in CUBE_AXES.items():
+        # axes with labels may have one extra position for missing values, the same in both cubes
+        shape = [arrays[count_name].shape[axis] if name is None else len(labels[name]) + arrays[count_name].shape[axis] - len(arrays[name])
+                 for axis, name in enumerate(axes)]
+        counts = np.zeros(shape, dtype=np.int64)
+        for part, part_sign in [(arrays, 1), (other_arrays, sign)]:
+            positions = []
+            for axis, name in enumerate(axes):
+                if name is None:
+                    positions.append(np.arange(shape[axis]))
+                    continue
+                label_positions = pd.Index(labels[name]).get_indexer(part[name])
+                missing_position = [shape[axis] - 1] if part[count_name].shape[axis] > len(part[name]) else []
+                positions.append(np.append(label_positions, missing_position).astype(np.int64))
+            counts[np.ix_(*positions)] += part_sign * part[count_name]
+        combined[count_name] = counts
+    return combined
+
+
+@trace_class
+class CollisionCube:
+    """Class responsible for the collision counts every hypothesis is made of, computed in a single pass and stored in
+    a small compressed file: crashes by month x hour x borough x first contributing factor (with victims as extra
+    measures), contributing factor occurrences by hour, vehicles by borough x license status x contributing factors
+    and pedestrian/cyclist victims by street
+
+    Every dimension has one last position for missing values, so all the counts add up to the whole data. Counts are
+    additive, so a change of the data is applied by retracting the old rows and adding the new ones
+    """
+    def __init__(self, data_source=collision_data, cube_path: str = CUBE_PATH):
+        self.data_source = data_source
+        self.cube_path = cube_path # None keeps the cube only in memory
+        self.arrays = self.load_cube()
+
+    def source_fingerprint(self) -> np.ndarray:
+        """Versions of the cleaning and of the cube, and size and modification time of every source the cube is made of
+
+        Returns:
+            np.ndarray: fingerprint stored with the cube, None if the data source has no files
+        """
+        if not hasattr(self.data_source, 'source_path'):
+            return None
+        fingerprint = [CACHE_VERSION, CUBE_VERSION]
+        for source in CUBE_SOURCES:
+            source_status = os.stat(self.data_source.source_path(source))
+            fingerprint += [source_status.st_size, source_status.st_mtime_ns]
+        boundaries_path = self.data_source.source_path('borough_boundaries') # boroughs filled from it change the counts too
+        boundaries_status = os.stat(boundaries_path) if os.path.exists(boundaries_path) else None
+        fingerprint += [boundaries_status.st_size, boundaries_status.st_mtime_ns] if boundaries_status is not None else [-1, -1]
+        return np.array(fingerprint, dtype=np.int64)
+
+    def load_cube(self) -> dict:
+        """Loads the cube from its file, building it from the data if the sources changed since
+
+        Returns:
+            dict: arrays of the cube
+        """
+        fingerprint = self.source_fingerprint() if self.cube_path is not None else None
+        if fingerprint is not None and os.path.exists(self.cube_path):
+            with np.load(self.cube_path) as stored_cube:
+                if np.array_equal(stored_cube['fingerprint'], fingerprint):
+                    return {name: stored_cube[name] for name in stored_cube.files if name != 'fingerprint'}
+        self.arrays = self.count_arrays(self.data_source)
+        self.save_cube()
+        return self.arrays
+
+    def save_cube(self):
+        """Stores the cube in its file, tied to the current fingerprint of the sources - does nothing for data kept in memory
+        """
+        fingerprint = self.source_fingerprint() if self.cube_path is not None else None
+        if fingerprint is None:
+            return
+        os.makedirs(os.path.dirname(self.cube_path), exist_ok=True)
+        with open(self.cube_path + '.tmp', 'wb') as cube_file: # file object so numpy doesn't append its own extension
+            np.savez_compressed(cube_file, fingerprint=fingerprint, **self.arrays)
+        os.replace(self.cube_path + '.tmp', self.cube_path) # written aside and then moved, like the parquet cache
+
+    def apply_delta(self, retracted_source, added_source):
+        """Updates the counts with a change of the data, without counting the rest of it again: the old version of the
+        changed rows is retracted and the new version added
+
+        Args:
+            retracted_source: data source with the rows as they were counted (e.g. an InMemoryDataSource), None if every row is new
+            added_source: data source with the new and updated rows
+        """
+        self.arrays = combine_counts(self.arrays, self.count_arrays(added_source))
+        if retracted_source is not None:
+            self.arrays = combine_counts(self.arrays, self.count_arrays(retracted_source), sign=-1)
+
+    def dimension_codes(self, values: pd.Series) -> tuple:
+        """Codes and labels of a text dimension
+
+        Args:
+            values (pd.Series): categorical column
+
+        Returns:
+            tuple: code of each row (-1 for missing values) and label of each code
+        """
+        categorical = pd.Categorical(values)
+        return np.asarray(categorical.codes, dtype=np.int64), categorical.categories.to_numpy(dtype=str)
+
+    def count_cells(self, codes: list, sizes: list, weights: list) -> np.ndarray:
+        """Counts rows (and sums weights) in every cell of a dense array
+
+        Args:
+            codes (list): code of each row in each dimension, -1 for missing values
+            sizes (list): number of values of each dimension, without the missing position
+            weights (list): None to count rows, or an array of values summed in each cell - one measure each
+
+        Returns:
+            np.ndarray: array with one axis per dimension (each one position longer) and one last axis per measure
+        """
+        shape = [size + 1 for size in sizes]
+        cells = np.ravel_multi_index([np.where(code < 0, size, code) for code, size in zip(codes, sizes)], shape)
+        measures = [np.bincount(cells, weights=weight, minlength=int(np.prod(shape))) for weight in weights]
+        return np.stack(measures, axis=-1).reshape(shape + [len(weights)]).round().astype(np.int64)
+
+    def count_arrays(self, data_source) -> dict:
+        """Counts every cell of the cube from the crashes and vehicles of a data source
+
+        Args:
+            data_source: loader or in-memory data source the rows are taken from
+
+        Returns:
+            dict: arrays of the cube
+        """
+        crashes = data_source.get_table('crashes', CUBE_CRASH_COLUMNS)
+        crashes['BOROUGH'] = fill_missing_boroughs(crashes, data_source)
+        borough_codes, boroughs = self.dimension_codes(crashes['BOROUGH'])
+        factor_codes, crash_factors = self.dimension_codes(crashes['CONTRIBUTING FACTOR VEHICLE 1'])
+        victims = [np.nan_to_num(crashes[column].to_numpy(dtype=np.float64)) for column in VICTIM_COLUMNS] # missing counts add nothing
+        crash_counts = self.count_cells([month_codes(crashes['CRASH DATE']), hour_codes(crashes['CRASH TIME']), borough_codes, factor_codes],
+                                        [12, 24, len(boroughs), len(crash_factors)], [None] + victims)
+
+        # contributing factor occurrences of the crashes the period analysis keeps, by hour
+        period_data = CrashByPeriodData(data_source).complete_crash_period_data
+        hours = pd.Series(pd.Categorical.from_codes(hour_codes(period_data['CRASH TIME']), categories=range(24)), name='HOUR')
+        period_counts = ContributingFactorCounter(period_data).count_by_group(hours)
+
+        vehicles = LiscenseStatusCollisionData(data_source).complete_liscense_status_df
+        vehicle_dimensions = [self.dimension_codes(vehicles[column]) for column in ['BOROUGH', 'DRIVER_LICENSE_STATUS', 'CONTRIBUTING_FACTOR_1', 'CONTRIBUTING_FACTOR_2']]
+        vehicle_counts = self.count_cells([codes for codes, _ in vehicle_dimensions], [len(labels) for _, labels in vehicle_dimensions], [None])
+        streets, street_counts = self.count_streets(data_source)
+        return {'crash_counts': crash_counts,
+                'boroughs': boroughs,
+                'crash_factors': crash_factors,
+                'period_counts': period_counts.to_numpy(dtype=np.int64),
+                'period_factors': period_counts.columns.to_numpy(dtype=str),
+                'vehicle_counts': vehicle_counts[..., 0],
+                'vehicle_boroughs': vehicle_dimensions[0][1],
+                'license_statuses': vehicle_dimensions[1][1],
+                'vehicle_factors_1': vehicle_dimensions[2][1],
+                'vehicle_factors_2': vehicle_dimensions[3][1],
+                'street_counts': street_counts,
+                'streets': streets}
+
+    def count_streets(self, data_source) -> tuple:
+        """Counts the pedestrian and cyclist victims of each street, keeping the same crashes as PedestriansAccidents.clean_df
+        and PedestriansAccidentsGraphs.streets_accidents
+
+        Args:
+            data_source: loader or in-memory data source the crashes are taken from
+
+        Returns:
+            tuple: street names, and crashes kept plus each incident column of every street
+        """
+        geo_data = CrashLocationData(data_source).full_geo_data
+        victims = geo_data[VICTIM_COLUMNS[:4]]
+        geo_data = geo_data[victims.notna().any(axis=1) & (victims != 0).any(axis=1)] # crashes with pedestrian or cyclist victims
+        geo_data = geo_data[(geo_data['LATITUDE'] != 0).to_numpy() & geo_data['ON STREET NAME'].notna().to_numpy()]
+        general_incidents = (geo_data['NUMBER OF PEDESTRIANS INJURED'] + geo_data['NUMBER OF PEDESTRIANS KILLED']
+                             + geo_data['NUMBER OF CYCLIST INJURED'] + geo_data['NUMBER OF CYCLIST KILLED'])
+        incidents = [np.nan_to_num(general_incidents.to_numpy(dtype=np.float64))]
+        incidents += [np.nan_to_num(geo_data[column].to_numpy(dtype=np.float64)) for column in STREET_INCIDENT_COLUMNS[1:]]
+        street_codes, streets = self.dimension_codes(geo_data['ON STREET NAME'])
+        street_counts = self.count_cells([street_codes], [len(streets)], [None] + incidents)
+        return streets, street_counts[:-1] # every crash kept has a street, so the missing position is dropped
+
+    def count_by(self, dimensions: list, measures: list = CRASH_MEASURES) -> pd.DataFrame:
+        """Re-slices the crash counts by any of their dimensions, summing over the others
+
+        Args:
+            dimensions (list): dimensions kept, among 'MONTH', 'HOUR', 'BOROUGH' and 'CONTRIBUTING FACTOR VEHICLE 1'
+            measures (list, optional): measures returned, every one by default
+
+        Returns:
+            pd.DataFrame: one row per combination of the kept dimensions (missing values as NaN) and one column per measure
+        """
+        labels = {'MONTH': pd.array(list(range(1, 13)) + [None], dtype='Int64'),
+                  'HOUR': pd.array(list(range(24)) + [None], dtype='Int64'),
+                  'BOROUGH': np.append(self.arrays['boroughs'].astype(object), np.nan),
+                  'CONTRIBUTING FACTOR VEHICLE 1': np.append(self.arrays['crash_factors'].astype(object), np.nan)}
+        summed_axes = tuple(axis for axis, dimension in enumerate(CRASH_DIMENSIONS) if dimension not in dimensions)
+        counts = self.arrays['crash_counts'].sum(axis=summed_axes, dtype=np.int64)
+        kept = [dimension for dimension in CRASH_DIMENSIONS if dimension in dimensions]
+        if len(kept) == 1:
+            index = pd.Index(labels[kept[0]], name=kept[0])
+        else:
+            index = pd.MultiIndex.from_product([labels[dimension] for dimension in kept], names=kept)
+        table = pd.DataFrame(counts.reshape(len(index), len(CRASH_MEASURES)), index=index, columns=CRASH_MEASURES)[measures]
+        return table.reorder_levels(dimensions) if len(kept) > 1 else table
+
+    def monthly_counts(self, drug_factors: list, alcohol_factors: list) -> pd.DataFrame:
+        """Collisions whose first contributing factor is drug or alcohol related, by month
+
+        Args:
+            drug_factors (list): contributing factors of drug related collisions
+            alcohol_factors (list): contributing factors of alcohol related collisions
+
+        Returns:
+            pd.DataFrame: same layout as SeasonalAlcoholColissions.count_by_month
+        """
+        collisions = self.arrays['crash_counts'][:12, ..., 0].sum(axis=(1, 2), dtype=np.int64) # months x first factor, missing months left out
+        factors = np.append(self.arrays['crash_factors'], '') # missing factor position never matches
+        return pd.DataFrame({'Drug Accidents': collisions[:, np.isin(factors, drug_factors)].sum(axis=1),
+                             'Alcohol Accidents': collisions[:, np.isin(factors, alcohol_factors)].sum(axis=1)}, index=range(1, 13))
+
+    def factor_counts_by_period(self, period_of_hour: np.ndarray, period_names: list) -> pd.DataFrame:
+        """Contributing factor occurrences by period of the day, from the counts by hour
+
+        Args:
+            period_of_hour (np.ndarray): code of the period each of the 24 hours belongs to
+            period_names (list): name of each period, in order
+
+        Returns:
+            pd.DataFrame: same layout as CrashByPeriodTrends.get_contributing_factor_counts
+        """
+        period_counts = np.zeros((len(period_names), len(self.arrays['period_factors'])), dtype=np.int64)
+        np.add.at(period_counts, period_of_hour, self.arrays['period_counts'])
+        # factors in alphabetical order, leaving out the ones every occurrence of was retracted by a delta
+        factor_order = [position for position in np.argsort(self.arrays['period_factors'], kind='stable') if period_counts[:, position].any()]
+        return pd.DataFrame(period_counts[:, factor_order],
+                            index=pd.CategoricalIndex(period_names, categories=period_names, ordered=True, name='TIME OF DAY'),
+                            columns=pd.Index(self.arrays['period_factors'][factor_order].astype(object)))
+
+    def vehicle_counts(self) -> pd.DataFrame:
+        """Vehicles of each combination of borough, driver license status and contributing factors that happened
+
+        Returns:
+            pd.DataFrame: one row per combination with the columns of LiscenseStatusCollisionData and a 'VEHICLES' count
+        """
+        counts = self.arrays['vehicle_counts']
+        positions = np.nonzero(counts)
+        columns = {}
+        for axis, (column, labels) in enumerate([('BOROUGH', 'vehicle_boroughs'), ('DRIVER_LICENSE_STATUS', 'license_statuses'),
+                                                  ('CONTRIBUTING_FACTOR_1', 'vehicle_factors_1'), ('CONTRIBUTING_FACTOR_2', 'vehicle_factors_2')]):
+            categories = self.arrays[labels].astype(object)
+            codes = np.where(positions[axis] == len(categories), -1, positions[axis]) # last position holds missing values
+            columns[column] = pd.Categorical.from_codes(codes, categories=categories)
+        columns['VEHICLES'] = counts[positions].astype(np.int64)
+        return pd.DataFrame(columns)
+
+    def street_totals(self) -> pd.DataFrame:
+        """Pedestrian and cyclist victims of each street with crashes that had any
+
+        Returns:
+            pd.DataFrame: same layout as PedestriansAccidentsGraphs.streets_accidents
+        """
+        street_counts = self.arrays['street_counts']
+        kept = street_counts[:, 0] > 0 # streets whose crashes were all retracted by a delta are left out
+        totals = pd.DataFrame(street_counts[kept, 1:], index=pd.Index(self.arrays['streets'][kept].astype(object), name='ON STREET NAME'),
+                              columns=STREET_INCIDENT_COLUMNS)
+        return totals.sort_values(by='GENERAL INCIDENTS', ascending=False)
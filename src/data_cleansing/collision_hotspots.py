@@ -0,0 +1,116 @@
+# MODULE RESPONSIBLE FOR RANKING THE MOST DANGEROUS SPOTS OF THE CITY FOR PEDESTRIANS AND CYCLISTS ON A FIXED METRIC GRID
+import numpy as np
+import pandas as pd
+
+from instrumentation import trace_class
+from data_cleansing.collision_cube import STREET_INCIDENT_COLUMNS
+from data_cleansing.data_pre_processing import ZIP_FILLED_COLUMN
+
+HOTSPOT_CELL_METERS = 150 # side of each grid cell, about an intersection and the first meters of its streets
+# bounding box of the city - points outside of it (e.g. misplaced coordinates) belong to no cell
+NYC_BOUNDS = {'LATITUDE': (40.45, 40.95), 'LONGITUDE': (-74.30, -73.65)}
+METERS_PER_DEGREE_LATITUDE = 111_132.0
+METERS_PER_DEGREE_LONGITUDE = 111_320.0 * np.cos(np.radians(40.7)) # at the latitude of the city, good enough for cells of this size
+
+
+@trace_class
+class IntersectionHotspots:
+    """Class responsible for snapping crash points onto a fixed grid of square cells and summing their victims per cell
+
+    Every column is summed in a single bincount over the cell of each point, so the ranking is one pass over the points;
+    only the points of the top cells are looked at again, to name the pair of streets most of their crashes happened at.
+    Crashes located at the centroid of their zip code belong to no cell, or every centroid would be ranked as a hotspot
+    """
+    def __init__(self, crash_data: pd.DataFrame, cell_meters: float = HOTSPOT_CELL_METERS):
+        self.crash_data = crash_data # cleaned crashes with coordinates, victims, and on and cross street names
+        self.cell_meters = cell_meters
+        (self.south, north), (self.west, east) = NYC_BOUNDS['LATITUDE'], NYC_BOUNDS['LONGITUDE']
+        self.rows = int(np.ceil((north - self.south) * METERS_PER_DEGREE_LATITUDE / cell_meters))
+        self.columns = int(np.ceil((east - self.west) * METERS_PER_DEGREE_LONGITUDE / cell_meters))
+        self.cells = self.cell_codes(crash_data['LATITUDE'].to_numpy(dtype=np.float64), crash_data['LONGITUDE'].to_numpy(dtype=np.float64))
+        if ZIP_FILLED_COLUMN in crash_data.columns: # only coordinates recorded at the crash are snapped onto the grid
+            self.cells[crash_data[ZIP_FILLED_COLUMN].to_numpy(dtype=bool)] = -1
+
+    def cell_codes(self, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+        """Finds the grid cell of each point
+
+        Args:
+            latitudes (np.ndarray): latitude of each point
+            longitudes (np.ndarray): longitude of each point
+
+        Returns:
+            np.ndarray: row * number of columns + column of the cell of each point, -1 outside the grid or without coordinates
+        """
+        with np.errstate(invalid='ignore'): # NaN coordinates fall outside the grid below
+            cell_rows = np.floor((latitudes - self.south) * METERS_PER_DEGREE_LATITUDE / self.cell_meters)
+            cell_columns = np.floor((longitudes - self.west) * METERS_PER_DEGREE_LONGITUDE / self.cell_meters)
+        inside = (cell_rows >= 0) & (cell_rows < self.rows) & (cell_columns >= 0) & (cell_columns < self.columns)
+        return np.where(inside, cell_rows * self.columns + cell_columns, -1).astype(np.int64)
+
+    def cell_center(self, cells: np.ndarray) -> tuple:
+        """Coordinates of the center of some cells
+
+        Args:
+            cells (np.ndarray): cell codes
+
+        Returns:
+            tuple: latitude and longitude of the center of each cell
+        """
+        cell_rows, cell_columns = np.divmod(cells, self.columns)
+        latitudes = self.south + (cell_rows + 0.5) * self.cell_meters / METERS_PER_DEGREE_LATITUDE
+        longitudes = self.west + (cell_columns + 0.5) * self.cell_meters / METERS_PER_DEGREE_LONGITUDE
+        return latitudes, longitudes
+
+    def cell_totals(self) -> np.ndarray:
+        """Sums the victims of every cell of the grid
+
+        Returns:
+            np.ndarray: one row per cell, with the crashes and then each of STREET_INCIDENT_COLUMNS
+        """
+        inside = self.cells >= 0
+        cells = self.cells[inside]
+        victims = [np.nan_to_num(self.crash_data[column].to_numpy(dtype=np.float64)[inside]) for column in STREET_INCIDENT_COLUMNS[1:]]
+        weights = [np.ones(len(cells)), victims[0] + victims[1] + victims[2] + victims[3]] + victims
+        return np.stack([np.bincount(cells, weights=column_weights, minlength=self.rows * self.columns) for column_weights in weights], axis=1)
+
+    def street_pairs(self, cells: np.ndarray) -> pd.DataFrame:
+        """Names the pair of streets most crashes of each cell happened at, ignoring the order of the two streets
+
+        Args:
+            cells (np.ndarray): cell codes
+
+        Returns:
+            pd.DataFrame: on and cross street of each cell, indexed by cell code
+        """
+        in_cells = np.flatnonzero(np.isin(self.cells, cells)) # only these rows are turned into street names
+        pairs = pd.DataFrame({'CELL': self.cells[in_cells],
+                              'ON': self.crash_data['ON STREET NAME'].iloc[in_cells].to_numpy(dtype=object),
+                              'CROSS': self.crash_data['CROSS STREET NAME'].iloc[in_cells].to_numpy(dtype=object)})
+        pairs = pairs.fillna('') # a crash named by a single street still counts for it
+        swapped = (pairs['CROSS'] != '') & ((pairs['ON'] == '') | (pairs['CROSS'] < pairs['ON'])) # A & B is the same spot as B & A
+        pairs['ON'], pairs['CROSS'] = np.where(swapped, pairs['CROSS'], pairs['ON']), np.where(swapped, pairs['ON'], pairs['CROSS'])
+        pair_counts = pairs.groupby(['CELL', 'ON', 'CROSS']).size().sort_values(ascending=False, kind='stable')
+        dominant_pairs = pair_counts[~pair_counts.index.get_level_values('CELL').duplicated()].reset_index(['ON', 'CROSS'])
+        dominant_pairs = dominant_pairs.rename(columns={'ON': 'ON STREET NAME', 'CROSS': 'CROSS STREET NAME'})
+        return dominant_pairs[['ON STREET NAME', 'CROSS STREET NAME']].replace('', np.nan)
+
+    def top_cells(self, top: int = 10) -> pd.DataFrame:
+        """Ranks the cells with most pedestrian and cyclist victims
+
+        Args:
+            top (int, optional): number of cells returned
+
+        Returns:
+            pd.DataFrame: center, dominant street pair, crashes and victims of each cell, from the most dangerous one
+        """
+        totals = self.cell_totals()
+        top = min(top, int((totals[:, 1] > 0).sum())) # cells without victims are never hotspots
+        cells = np.argpartition(-totals[:, 1], top - 1)[:top] if top > 0 else np.array([], dtype=np.int64)
+        cells = cells[np.lexsort((cells, -totals[cells, 1]))] # most victims first, ties by cell so the order is stable
+        latitudes, longitudes = self.cell_center(cells)
+        hotspots = pd.DataFrame({'LATITUDE': latitudes, 'LONGITUDE': longitudes})
+        hotspots = hotspots.join(self.street_pairs(cells).reindex(cells).reset_index(drop=True))
+        hotspots['CRASHES'] = totals[cells, 0].astype(np.int64)
+        for position, column in enumerate(STREET_INCIDENT_COLUMNS):
+            hotspots[column] = totals[cells, position + 1]
+        return hotspots
@@ -0,0 +1,84 @@
+# MODULE RESPONSIBLE FOR PLACING VEHICLE AND PERSON ROWS ON THE ROW OF THEIR CRASH, SO CRASH ATTRIBUTES ARE GATHERED INSTEAD OF MERGED
+import numpy as np
+import pandas as pd
+
+from instrumentation import trace_class
+
+SPARSE_ID_RATIO = 4 # ids spread over more than this many times the number of crashes are looked up by binary search instead
+
+
+@trace_class(skip=['rows_of'])
+class CollisionRowIndex:
+    """Class responsible for finding the crash row of any COLLISION_ID with one vectorized lookup
+
+    COLLISION_IDs are dense integers, so the index is an array with the row of each id between the smallest and the
+    largest one (-1 for ids without a crash); ids too spread out for that are kept sorted and binary searched
+    """
+    def __init__(self, crash_ids: pd.Series):
+        crash_ids = np.asarray(crash_ids, dtype=np.int64)
+        self.crash_count = len(crash_ids)
+        self.first_id = int(crash_ids.min()) if len(crash_ids) else 0
+        id_range = int(crash_ids.max()) - self.first_id + 1 if len(crash_ids) else 0
+        self.dense = id_range <= SPARSE_ID_RATIO * len(crash_ids) + 1024
+        if self.dense:
+            self.row_of_id = np.full(id_range, -1, dtype=np.int32 if len(crash_ids) < 2 ** 31 else np.int64)
+            self.row_of_id[(crash_ids - self.first_id)[::-1]] = np.arange(len(crash_ids))[::-1] # repeated ids keep their first row
+        else:
+            self.id_order = np.argsort(crash_ids, kind='stable')
+            self.sorted_ids = crash_ids[self.id_order]
+
+    def rows_of(self, collision_ids) -> np.ndarray:
+        """Finds the crash row of each COLLISION_ID
+
+        Args:
+            collision_ids (pd.Series | np.ndarray): ids of vehicle or person rows
+
+        Returns:
+            np.ndarray: row of the crash of each id, -1 where there is no crash with that id
+        """
+        collision_ids = np.asarray(collision_ids, dtype=np.int64)
+        rows = np.full(len(collision_ids), -1, dtype=np.int64)
+        if self.dense:
+            offsets = collision_ids - self.first_id
+            inside = (offsets >= 0) & (offsets < len(self.row_of_id))
+            rows[inside] = self.row_of_id[offsets[inside]]
+            return rows
+        found = np.searchsorted(self.sorted_ids, collision_ids)
+        matched = found < len(self.sorted_ids)
+        matched[matched] = self.sorted_ids[found[matched]] == collision_ids[matched]
+        rows[matched] = self.id_order[found[matched]]
+        return rows
+
+    def gather(self, crash_column: pd.Series, collision_ids) -> pd.Series:
+        """Copies a crash attribute onto other rows, through the crash of each one
+
+        Args:
+            crash_column (pd.Series): column of the crashes, in the row order the index was built with
+            collision_ids (pd.Series | np.ndarray): ids of the rows receiving the attribute
+
+        Returns:
+            pd.Series: attribute of the crash of each row, missing where there is no crash
+        """
+        rows = self.rows_of(collision_ids)
+        index = collision_ids.index if isinstance(collision_ids, pd.Series) else None
+        if isinstance(crash_column.dtype, pd.CategoricalDtype): # only the codes are gathered, -1 already means missing
+            codes = np.append(crash_column.cat.codes.to_numpy(), -1)[rows]
+            values = pd.Categorical.from_codes(codes, dtype=crash_column.dtype)
+        else:
+            values = crash_column.reset_index(drop=True).reindex(rows).to_numpy() # row -1 isn't a label, so it comes back missing
+        return pd.Series(values, index=index, name=crash_column.name)
+
+
+def crash_row_index(data_source, crashes: pd.DataFrame) -> CollisionRowIndex:
+    """Index of the crashes of a data source, reusing the one the data source keeps if it keeps one
+
+    Args:
+        data_source: loader or in-memory data source the crashes came from
+        crashes (pd.DataFrame): crashes with a COLLISION_ID column, in the row order of the data source
+
+    Returns:
+        CollisionRowIndex: index of the crash rows
+    """
+    if hasattr(data_source, 'get_crash_index'):
+        return data_source.get_crash_index()
+    return CollisionRowIndex(crashes['COLLISION_ID'])
@@ -0,0 +1,206 @@
+# MODULE RESPONSIBLE FOR SELECTING THE COLLISIONS OF A DATE WINDOW AND OF SOME BOROUGHS WITHOUT SCANNING ALL THE ROWS
+import numpy as np
+import pandas as pd
+
+from instrumentation import trace_class
+from data_cleansing.data_loader import collision_data
+from data_cleansing.row_filters import filter_columns, row_mask
+
+INDEX_CRASH_COLUMNS = ['COLLISION_ID', 'CRASH DATE', 'BOROUGH']
+collision_data.register_columns('crashes', INDEX_CRASH_COLUMNS)
+collision_data.register_columns('vehicles', ['COLLISION_ID'])
+collision_data.register_columns('person', ['COLLISION_ID']) # vehicles and people are placed through the crash they belong to
+MISSING_DAY = np.iinfo(np.int64).max # crashes without a valid date are kept after every date
+
+
+def crash_days(crash_dates: pd.Series) -> np.ndarray:
+    """Day of each crash date, parsing each distinct date only once
+
+    Args:
+        crash_dates (pd.Series): dates formatted as month/day/year
+
+    Returns:
+        np.ndarray: days since 1970-01-01, MISSING_DAY where the date is missing or invalid
+    """
+    date_codes, distinct_dates = pd.factorize(crash_dates)
+    distinct_days = pd.to_datetime(pd.Series(distinct_dates, dtype=object), format="%m/%d/%Y", errors='coerce').to_numpy(dtype='datetime64[D]')
+    distinct_days = np.where(np.isnat(distinct_days), MISSING_DAY, distinct_days.astype(np.int64))
+    return np.append(distinct_days, MISSING_DAY)[date_codes] # slot at the end for missing dates (code -1)
+
+
+def day_of(date) -> int:
+    """Day of a date given as text or timestamp
+
+    Args:
+        date (str | pd.Timestamp): date, e.g. '2021-06-01'
+
+    Returns:
+        int: days since 1970-01-01
+    """
+    return int(np.datetime64(pd.Timestamp(date).date(), 'D').astype(np.int64))
+
+
+@trace_class(skip=['sorted_table', 'crash_ranges', 'source_ranges'])
+class CollisionIndex:
+    """Class responsible for ordering the crashes by borough and then by date, once, so the crashes of any date window
+    and set of boroughs are a few contiguous slices found by binary search. Vehicles and people are ordered by the
+    position of their crash, so their slices are found the same way
+
+    Columns are only reordered the first time they are requested and then kept, so later queries only copy the rows selected
+    """
+    def __init__(self, data_source=collision_data):
+        self.data_source = data_source # loader the rows are taken from
+        crashes = data_source.get_table('crashes', INDEX_CRASH_COLUMNS)
+        boroughs = pd.Categorical(crashes['BOROUGH'])
+        self.boroughs = list(boroughs.categories)
+        borough_codes = np.where(boroughs.codes < 0, len(self.boroughs), boroughs.codes) # crashes without borough form the last block
+        days = crash_days(crashes['CRASH DATE'])
+        crash_order = np.lexsort((days, borough_codes)) # by borough, then by date
+        self.days = days[crash_order]
+        # first position of each borough block, and the end of the last one
+        self.borough_offsets = np.searchsorted(borough_codes[crash_order], np.arange(len(self.boroughs) + 2))
+        self.crash_ids = crashes['COLLISION_ID'].to_numpy()[crash_order]
+        self.orders = {'crashes': crash_order} # row of the source at each sorted position
+        self.crash_positions = {} # sorted position of the crash of each sorted row of the related sources
+        self.tables = {} # columns already reordered, by source
+
+    def order_related_source(self, source: str):
+        """Orders the rows of a source with a COLLISION_ID by the position of their crash - rows without a crash go last
+
+        Args:
+            source (str): name of the data source ('vehicles' or 'person')
+        """
+        row_ids = self.data_source.get_table(source, ['COLLISION_ID'])['COLLISION_ID']
+        crash_lookup = pd.Series(np.arange(len(self.crash_ids)), index=self.crash_ids) # sorted position of each crash
+        crash_lookup = crash_lookup[~crash_lookup.index.duplicated()]
+        positions = crash_lookup.reindex(row_ids).fillna(len(self.crash_ids)).to_numpy(dtype=np.int64)
+        row_order = np.argsort(positions, kind='stable')
+        self.orders[source] = row_order
+        self.crash_positions[source] = positions[row_order]
+
+    def sorted_table(self, source: str, columns: list) -> pd.DataFrame:
+        """Collects the requested columns of a source in the order of the index, reordering the ones not used before
+
+        Args:
+            source (str): name of the data source
+            columns (list): columns needed from the data source
+
+        Returns:
+            pd.DataFrame: every reordered column of the source, shared - never modified by the callers
+        """
+        if source != 'crashes' and source not in self.orders:
+            self.order_related_source(source)
+        reordered = self.tables.get(source, pd.DataFrame(index=pd.RangeIndex(len(self.orders[source]))))
+        missing_columns = [column for column in columns if column not in reordered.columns]
+        if missing_columns:
+            new_columns = self.data_source.get_table(source, missing_columns)
+            if isinstance(new_columns, str): # error message from the loader
+                return new_columns
+            new_columns = new_columns.take(self.orders[source]).reset_index(drop=True)
+            self.tables[source] = reordered = pd.concat([reordered, new_columns], axis=1)
+        return reordered
+
+    def crash_ranges(self, start=None, end=None, boroughs: list = None) -> list:
+        """Finds the sorted positions of the crashes of a date window in some boroughs, by binary search in each borough block
+
+        Args:
+            start (str | pd.Timestamp, optional): first day of the window, no lower bound if None
+            end (str | pd.Timestamp, optional): day after the last one of the window, no upper bound if None - crashes
+                without a valid date are only included when there is no upper bound
+            boroughs (list, optional): boroughs selected, in any case, every crash (also the ones without borough) if None
+
+        Returns:
+            list: (first, last + 1) sorted positions of each slice of crashes selected
+        """
+        if boroughs is None:
+            blocks = range(len(self.boroughs) + 1)
+        else:
+            boroughs = [borough.upper().strip() for borough in boroughs] # spelled as the collision schema encodes the column
+            unknown_boroughs = [borough for borough in boroughs if borough not in self.boroughs]
+            if unknown_boroughs: # a typo would otherwise select no crash at all
+                raise KeyError('Unknown boroughs: ' + ', '.join(unknown_boroughs))
+            blocks = [self.boroughs.index(borough) for borough in boroughs]
+        ranges = []
+        for block in blocks:
+            block_start, block_end = self.borough_offsets[block], self.borough_offsets[block + 1]
+            block_days = self.days[block_start:block_end] # already sorted
+            first = block_start + (np.searchsorted(block_days, day_of(start), 'left') if start is not None else 0)
+            last = block_start + (np.searchsorted(block_days, day_of(end), 'left') if end is not None else len(block_days))
+            if last > first:
+                ranges.append((int(first), int(last)))
+        return ranges
+
+    def source_ranges(self, source: str, crash_ranges: list) -> list:
+        """Translates slices of crashes into the slices of a source holding their rows
+
+        Args:
+            source (str): name of the data source
+            crash_ranges (list): slices of sorted crash positions
+
+        Returns:
+            list: (first, last + 1) sorted positions of each slice of the source
+        """
+        if source == 'crashes':
+            return crash_ranges
+        if source not in self.crash_positions:
+            self.order_related_source(source)
+        positions = self.crash_positions[source]
+        return [(int(np.searchsorted(positions, first, 'left')), int(np.searchsorted(positions, last, 'left'))) for first, last in crash_ranges]
+
+    def query(self, start=None, end=None, boroughs: list = None):
+        """Selects the collisions of a date window [start, end) in some boroughs
+
+        Args:
+            start (str | pd.Timestamp, optional): first day of the window, e.g. '2021-01-01'
+            end (str | pd.Timestamp, optional): day after the last one of the window
+            boroughs (list, optional): boroughs selected, e.g. ['BROOKLYN', 'QUEENS'], all of them if None
+
+        Returns:
+            SlicedDataSource: data source any analysis class can be built with
+        """
+        return SlicedDataSource(self, self.crash_ranges(start, end, boroughs))
+
+
+class SlicedDataSource:
+    """Data source over the collisions selected by a query of a CollisionIndex - nothing is read or cached, rows are copied from slices
+    """
+    def __init__(self, collision_index: CollisionIndex, crash_ranges: list):
+        self.collision_index = collision_index
+        self.crash_ranges = crash_ranges # slices of sorted crash positions selected
+
+    def get_table(self, source: str, columns: list, filters: list = None) -> pd.DataFrame:
+        """Collects the requested columns of the selected rows of a data source
+
+        Args:
+            source (str): name of the data source
+            columns (list): columns needed from the data source
+            filters (list, optional): filters of data_cleansing.row_filters the rows must pass
+
+        Returns:
+            pd.DataFrame: new dataframe with only the requested columns, safe to be modified by the caller
+        """
+        try:
+            read_columns = list(dict.fromkeys(columns + filter_columns(filters)))
+            table = self.collision_index.sorted_table(source, read_columns)
+            if isinstance(table, str):
+                return table
+            slices = [table.iloc[first:last] for first, last in self.collision_index.source_ranges(source, self.crash_ranges)]
+            selected = pd.concat(slices or [table.iloc[0:0]], ignore_index=True)
+            if filters:
+                return selected.loc[row_mask(selected, filters), columns] # only the rows of the window are checked
+            return selected[columns].copy()
+        except KeyError as error:
+            return 'Data source passed has inconsistent/unaccounted keys'
+
+    def get_cleaned(self, name: str, sources: list, build_function) -> pd.DataFrame:
+        """Builds the output of a cleaning class, a selection of the data is never cached
+
+        Args:
+            name (str): name the cleaned dataframe would be stored under
+            sources (list): data sources the cleaning depends on
+            build_function (callable): function that produces the cleaned dataframe
+
+        Returns:
+            pd.DataFrame: cleaned dataframe
+        """
+        return build_function()
@@ -0,0 +1,157 @@
+# MODULE RESPONSIBLE FOR THE CATEGORIES OF THE TEXT COLUMNS OF THE COLLISION DATASETS, SHARED BY THE LOADER AND EVERY ANALYSIS
+import numpy as np
+import pandas as pd
+from pandas.api.types import CategoricalDtype
+
+# values documented by NYC Open Data for each column - the position of a value is its code in every dataframe
+BOROUGHS = ['BRONX', 'BROOKLYN', 'MANHATTAN', 'QUEENS', 'STATEN ISLAND']
+CONTRIBUTING_FACTORS = ['Accelerator Defective', 'Aggressive Driving/Road Rage', 'Alcohol Involvement', 'Animals Action',
+                        'Backing Unsafely', 'Brakes Defective', 'Cell Phone (hand-Held)', 'Cell Phone (hands-free)',
+                        'Driver Inattention/Distraction', 'Driver Inexperience', 'Driverless/Runaway Vehicle', 'Drugs (illegal)',
+                        'Eating or Drinking', 'Failure to Keep Right', 'Failure to Yield Right-of-Way', 'Fatigued/Drowsy',
+                        'Fell Asleep', 'Following Too Closely', 'Glare', 'Headlights Defective', 'Illness',
+                        'Lane Marking Improper/Inadequate', 'Listening/Using Headphones', 'Lost Consciousness',
+                        'Obstruction/Debris', 'Other Electronic Device', 'Other Lighting Defects', 'Other Vehicular',
+                        'Outside Car Distraction', 'Oversized Vehicle', 'Passenger Distraction', 'Passing or Lane Usage Improper',
+                        'Passing Too Closely', 'Pavement Defective', 'Pavement Slippery',
+                        'Pedestrian/Bicyclist/Other Pedestrian Error/Confusion', 'Physical Disability', 'Prescription Medication',
+                        'Reaction to Uninvolved Vehicle', 'Shoulders Defective/Improper', 'Steering Failure', 'Texting',
+                        'Tinted Windows', 'Tire Failure/Inadequate', 'Tow Hitch Defective',
+                        'Traffic Control Device Improper/Non-Working', 'Traffic Control Disregarded', 'Turning Improperly',
+                        'Unsafe Lane Changing', 'Unsafe Speed', 'Unspecified', 'Using On Board Navigation Device',
+                        'Vehicle Vandalism', 'View Obstructed/Limited', 'Windshield Inadequate']
+LICENSE_STATUSES = ['Licensed', 'Permit', 'Unlicensed']
+PERSON_TYPES = ['Bicyclist', 'Occupant', 'Other Motorized', 'Pedestrian']
+PERSON_INJURIES = ['Injured', 'Killed', 'Unspecified']
+POSITIONS_IN_VEHICLE = ['Any person in the rear of a station wagon, pick-up truck, all passengers on a bus, etc',
+                        'Does Not Apply',
+                        'Driver',
+                        'Front passenger, if two or more persons, including the driver, are in the front seat',
+                        'If one person is seated on another person&apos;s lap',
+                        'Left rear passenger, or rear passenger on a bicycle, motorcycle, snowmobile',
+                        'Middle front seat, or passenger lying across a seat',
+                        'Middle rear seat, or passenger lying across a seat',
+                        'Riding/Hanging on Outside',
+                        'Right rear passenger or motorcycle sidecar passenger',
+                        'Unknown']
+SAFETY_EQUIPMENT = ['Air Bag Deployed', 'Air Bag Deployed/Child Restraint', 'Air Bag Deployed/Lap Belt',
+                    'Air Bag Deployed/Lap Belt/Harness', 'Child Restraint Only', 'Harness', 'Helmet (Motorcycle Only)',
+                    'Helmet Only (In-Line Skater/Bicyclist)', 'Helmet/Other (In-Line Skater/Bicyclist)', 'Lap Belt',
+                    'Lap Belt & Harness', 'None', 'Other', 'Pads Only (In-Line Skater/Bicyclist)',
+                    'Stoppers Only (In-Line Skater/Bicyclist)', 'Unknown']
+COMPLAINTS = ['Abrasion', 'Amputation', 'Complaint of Pain', 'Complaint of Pain or Nausea', 'Concussion', 'Contusion - Bruise',
+              'Crush Injuries', 'Does Not Apply', 'Fracture - Distorted - Dislocation', 'Fracture - Dislocation', 'Internal',
+              'Minor Bleeding', 'Minor Burn', 'Moderate Burn', 'Nausea', 'None Visible', 'Paralysis', 'Severe Bleeding',
+              'Severe Burn', 'Severe Lacerations', 'Unknown', 'Whiplash']
+
+# spellings used in some years of the data that mean the same as a documented value - differences of case are handled apart
+SPELLING_ALIASES = {'Illnes': 'Illness'}
+
+# categorical columns of each data source: documented values, or None for open vocabularies (kept in upper case)
+CATEGORICAL_COLUMNS = {
+    'crashes': {
+        'BOROUGH': BOROUGHS,
+        'ON STREET NAME': None,
+        'CROSS STREET NAME': None,
+        'CONTRIBUTING FACTOR VEHICLE 1': CONTRIBUTING_FACTORS,
+        'CONTRIBUTING FACTOR VEHICLE 2': CONTRIBUTING_FACTORS,
+        'CONTRIBUTING FACTOR VEHICLE 3': CONTRIBUTING_FACTORS,
+        'CONTRIBUTING FACTOR VEHICLE 4': CONTRIBUTING_FACTORS,
+        'CONTRIBUTING FACTOR VEHICLE 5': CONTRIBUTING_FACTORS,
+    },
+    'vehicles': {
+        'DRIVER_LICENSE_STATUS': LICENSE_STATUSES,
+        'CONTRIBUTING_FACTOR_1': CONTRIBUTING_FACTORS,
+        'CONTRIBUTING_FACTOR_2': CONTRIBUTING_FACTORS,
+    },
+    'person': {
+        'PERSON_TYPE': PERSON_TYPES,
+        'PERSON_INJURY': PERSON_INJURIES,
+        'POSITION_IN_VEHICLE': POSITIONS_IN_VEHICLE,
+        'SAFETY_EQUIPMENT': SAFETY_EQUIPMENT,
+        'COMPLAINT': COMPLAINTS,
+    },
+}
+
+
+def normalize_spelling(value: str, known_values: dict) -> str:
+    """Finds the documented spelling of a raw value
+
+    Args:
+        value (str): value as written in the csv
+        known_values (dict): documented values (and aliases) by their lower case form, None for open vocabularies
+
+    Returns:
+        str: documented spelling, or the raw value with its spaces tidied if it isn't documented
+    """
+    tidy_value = ' '.join(str(value).split()) # leading, trailing and repeated spaces are never meaningful
+    if known_values is None:
+        return tidy_value.upper()
+    return known_values.get(tidy_value.lower(), tidy_value)
+
+
+def encode_column(values: pd.Series, vocabulary: list) -> pd.Series:
+    """Turns a text column into a categorical one with the documented categories, normalizing each distinct
+    spelling only once
+
+    Documented values keep the same code in every dataframe; values that aren't documented are kept,
+    as extra categories after the documented ones
+
+    Args:
+        values (pd.Series): text column, already categorical or not
+        vocabulary (list): documented values of the column, None for open vocabularies
+
+    Returns:
+        pd.Series: categorical column with normalized categories
+    """
+    raw_values = values if isinstance(values.dtype, CategoricalDtype) else values.astype('category')
+    raw_categories = raw_values.cat.categories
+    known_values = None
+    if vocabulary is not None:
+        known_values = {value.lower(): value for value in vocabulary}
+        known_values.update({alias.lower(): value for alias, value in SPELLING_ALIASES.items() if value in vocabulary})
+    normalized = [normalize_spelling(category, known_values) for category in raw_categories]
+    documented = vocabulary if vocabulary is not None else []
+    categories = pd.Index(documented + sorted(set(normalized).difference(documented)))
+    # code of each raw category in the final categories, one extra slot for missing values (code -1)
+    new_code_of_raw = np.append(categories.get_indexer(normalized), -1)
+    codes = new_code_of_raw[raw_values.cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(codes, dtype=CategoricalDtype(categories)), index=values.index, name=values.name)
+
+
+def encode_table(source: str, data: pd.DataFrame) -> pd.DataFrame:
+    """Encodes every categorical column of a data source found in a dataframe
+
+    Args:
+        source (str): name of the data source ('crashes', 'vehicles' or 'person')
+        data (pd.DataFrame): columns of the data source
+
+    Returns:
+        pd.DataFrame: same dataframe, with the categorical columns encoded
+    """
+    for column, vocabulary in CATEGORICAL_COLUMNS.get(source, {}).items():
+        if column in data.columns:
+            data[column] = encode_column(data[column], vocabulary)
+    return data
+
+
+def replace_labels(values: pd.Series, replacements: dict) -> pd.Series:
+    """Replaces some values of a column by shorter labels, renaming categories instead of rows when it is categorical
+
+    Args:
+        values (pd.Series): column to be relabelled
+        replacements (dict): new label of each value
+
+    Returns:
+        pd.Series: relabelled column
+    """
+    if not isinstance(values.dtype, CategoricalDtype):
+        return values.replace(replacements)
+    categories = values.cat.categories
+    labels = pd.Index([replacements.get(category, category) for category in categories])
+    if labels.is_unique:
+        return values.cat.rename_categories(labels)
+    # two values got the same label: codes are merged through the distinct labels
+    merged_codes, merged_labels = pd.factorize(labels)
+    codes = np.append(merged_codes, -1)[values.cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(codes, categories=merged_labels), index=values.index, name=values.name)
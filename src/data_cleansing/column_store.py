@@ -0,0 +1,160 @@
+# MODULE RESPONSIBLE FOR KEEPING THE PARSED COLUMNS OF EACH DATA SOURCE ON DISK AS FIXED WIDTH ARRAYS THAT ANY PROCESS CAN MAP READ-ONLY
+import os
+import numpy as np
+import pandas as pd
+
+from data_cleansing.data_cache import ParquetCache, CACHE_VERSION
+
+
+class ColumnStore(ParquetCache):
+    """Class responsible for storing the parsed columns of a data source as one .npy file per column, tied to the
+    fingerprint of the csv they came from
+
+    Numeric columns are stored as they are and categorical ones as their integer codes, with the categories kept in
+    the metadata. Reading maps the files read-only instead of copying them, so every process (the parallel workers,
+    a notebook, a later run) reading the same columns shares one physical copy of them through the page cache.
+    Text columns are stored as codes too, and read back as categoricals over the mapped codes
+    """
+    def entry_paths(self, name: str) -> tuple:
+        """Paths of the folder with the column files and of the metadata file of an entry
+
+        Args:
+            name (str): name of the entry, the data source
+
+        Returns:
+            tuple: column folder path and metadata file path
+        """
+        return os.path.join(self.cache_directory, name), os.path.join(self.cache_directory, name + '.json')
+
+    def column_path(self, name: str, column_file: str) -> str:
+        """Path of the file of a column
+
+        Args:
+            name (str): name of the entry
+            column_file (str): file name of the column, from the layout of the entry
+
+        Returns:
+            str: path of the .npy file
+        """
+        return os.path.join(self.entry_paths(name)[0], column_file)
+
+    def save_column(self, name: str, column: str, values: pd.Series) -> dict:
+        """Writes a column as a fixed width array
+
+        Args:
+            name (str): name of the entry
+            column (str): name of the column
+            values (pd.Series): values of the column
+
+        Returns:
+            dict: file of the column and, for categorical and text columns, their categories
+        """
+        layout = {'file': column.replace(' ', '_').replace('/', '_') + '.npy'}
+        if isinstance(values.dtype, pd.CategoricalDtype): # already encoded by the collision schema, codes are stored as they are
+            array = values.cat.codes.to_numpy()
+            layout.update(categories=values.cat.categories.tolist(), categorical=True)
+        elif isinstance(values.dtype, np.dtype) and values.dtype != object:
+            array = values.to_numpy()
+        else: # text, stored as the code of each distinct value (-1 for missing ones)
+            codes, categories = pd.factorize(values)
+            array = codes.astype(np.int32)
+            layout.update(categories=categories.tolist(), categorical=False)
+        column_path = self.column_path(name, layout['file'])
+        with open(column_path + '.tmp', 'wb') as column_file: # file object so numpy doesn't append its own extension
+            np.save(column_file, array)
+        # replaced instead of overwritten, processes that still map the old file keep reading it unchanged
+        os.replace(column_path + '.tmp', column_path)
+        return layout
+
+    def map_columns(self, name: str, layout: dict, rows: int) -> pd.DataFrame:
+        """Builds a dataframe over the files of some columns, numeric and categorical ones read straight from the mapped files
+
+        Args:
+            name (str): name of the entry
+            layout (dict): file and categories of each column to be read
+            rows (int): number of rows of the entry
+
+        Returns:
+            pd.DataFrame: read-only columns, in the order of the layout
+        """
+        columns = {}
+        for column, column_layout in layout.items():
+            # an empty file can't be mapped, so empty columns are simply read
+            values = np.load(self.column_path(name, column_layout['file']), mmap_mode='r' if rows else None)
+            values = values.view(np.ndarray) # plain array over the same mapped pages, so results of operations aren't memmaps
+            if 'categories' in column_layout: # categorical and text columns alike, the codes stay mapped
+                values = pd.Categorical.from_codes(values, categories=pd.Index(column_layout['categories'], dtype=object))
+            columns[column] = values
+        return pd.DataFrame(columns, index=pd.RangeIndex(rows), copy=False)
+
+    def read(self, name: str, source_paths: list, columns: list = None) -> pd.DataFrame:
+        """Maps the stored columns of a data source if they are still valid and include all the requested ones
+
+        Args:
+            name (str): name of the entry
+            source_paths (list): paths of the csv files the entry depends on
+            columns (list, optional): columns to be read, all of them if None
+
+        Returns:
+            pd.DataFrame: read-only columns, or None if they have to be parsed again
+        """
+        try:
+            metadata = self.read_metadata(name, source_paths)
+            if metadata is None:
+                return None
+            columns = metadata['columns'] if columns is None else columns
+            if not set(columns).issubset(metadata['columns']):
+                return None
+            return self.map_columns(name, {column: metadata['layout'][column] for column in columns}, metadata['rows'])
+        except (OSError, ValueError, KeyError) as error: # unreadable or corrupted entries are simply rebuilt
+            return None
+
+    def write(self, name: str, source_paths: list, data: pd.DataFrame):
+        """Stores every column of a data source, replacing the ones stored before
+
+        Args:
+            name (str): name of the entry
+            source_paths (list): paths of the csv files the entry depends on
+            data (pd.DataFrame): parsed columns
+        """
+        self.store_columns(name, source_paths, data, {})
+
+    def add_columns(self, name: str, source_paths: list, new_columns: pd.DataFrame):
+        """Stores newly parsed columns of a data source, only writing their files - the columns already stored are kept
+
+        Args:
+            name (str): name of the entry
+            source_paths (list): paths of the csv files the entry depends on
+            new_columns (pd.DataFrame): columns just parsed from the csv
+        """
+        metadata = self.read_metadata(name, source_paths)
+        kept_layout = {}
+        if metadata is not None and metadata['rows'] == len(new_columns):
+            kept_layout = {column: layout for column, layout in metadata['layout'].items() if column not in new_columns.columns}
+        self.store_columns(name, source_paths, new_columns, kept_layout)
+
+    def store_columns(self, name: str, source_paths: list, data: pd.DataFrame, kept_layout: dict):
+        """Writes the files of some columns and the metadata of the entry, removing the files no column uses anymore
+
+        Args:
+            name (str): name of the entry
+            source_paths (list): paths of the csv files the entry depends on
+            data (pd.DataFrame): columns to be written
+            kept_layout (dict): layout of the stored columns that stay in the entry
+        """
+        entry_directory, metadata_path = self.entry_paths(name)
+        os.makedirs(entry_directory, exist_ok=True)
+        if os.path.exists(metadata_path):
+            os.remove(metadata_path) # the entry is invalid until its metadata is written again, so half an update is never read
+        layout = dict(kept_layout)
+        for column in data.columns:
+            layout[str(column)] = self.save_column(name, str(column), data[column])
+        used_files = {column_layout['file'] for column_layout in layout.values()}
+        for stored_file in os.listdir(entry_directory):
+            if stored_file not in used_files:
+                os.remove(os.path.join(entry_directory, stored_file))
+        self.write_metadata(name, {'version': CACHE_VERSION,
+                                   'sources': {path: self.source_fingerprint(path) for path in source_paths},
+                                   'columns': list(layout),
+                                   'rows': len(data),
+                                   'layout': layout})
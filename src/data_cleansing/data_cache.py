@@ -0,0 +1,169 @@
+# MODULE RESPONSIBLE FOR KEEPING PARSED AND CLEANED DATAFRAMES ON DISK SO LATER RUNS DON'T HAVE TO REDO THEM
+import os
+import json
+import hashlib
+import pandas as pd
+
+CACHE_VERSION = 6 # must be increased whenever the cleaning logic changes, so old cached outputs are discarded
+HASH_BLOCK_SIZE = 2 ** 20 # bytes read at a time when hashing a source file
+
+
+class ParquetCache:
+    """Class responsible for storing dataframes as parquet files, tied to the fingerprint of the csv files they came from
+    """
+    def __init__(self, cache_directory: str):
+        self.cache_directory = cache_directory
+
+    def entry_paths(self, name: str) -> tuple:
+        """Paths of the parquet file and of the metadata file of a cache entry
+
+        Args:
+            name (str): name of the cache entry
+
+        Returns:
+            tuple: parquet file path and metadata file path
+        """
+        return os.path.join(self.cache_directory, name + '.parquet'), os.path.join(self.cache_directory, name + '.json')
+
+    def source_fingerprint(self, source_path: str) -> dict:
+        """Collects size, modification time and content hash of a source file
+
+        Args:
+            source_path (str): path of the source csv
+
+        Returns:
+            dict: fingerprint of the file, all None for an optional file that is missing
+        """
+        if not os.path.exists(source_path):
+            return {'size': None, 'mtime': None, 'hash': None}
+        file_status = os.stat(source_path)
+        return {'size': file_status.st_size, 'mtime': file_status.st_mtime_ns, 'hash': self.file_hash(source_path)}
+
+    def file_hash(self, source_path: str) -> str:
+        """Hashes the full content of a file, block by block so it never has to be in memory
+
+        Args:
+            source_path (str): path of the file
+
+        Returns:
+            str: hexadecimal blake2b digest of the file
+        """
+        digest = hashlib.blake2b()
+        with open(source_path, 'rb') as source_file:
+            for block in iter(lambda: source_file.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def fingerprint_matches(self, stored_fingerprint: dict, source_path: str) -> bool:
+        """Checks if a source file is still the one a cache entry was built from
+
+        The content hash is only recomputed when the size is the same but the modification time changed,
+        so an untouched file is validated by a single stat call
+
+        Args:
+            stored_fingerprint (dict): fingerprint saved with the cache entry
+            source_path (str): path of the source csv
+
+        Returns:
+            bool: True if the file didn't change
+        """
+        if not os.path.exists(source_path) or stored_fingerprint['size'] is None: # optional file added or removed since
+            return not os.path.exists(source_path) and stored_fingerprint['size'] is None
+        file_status = os.stat(source_path)
+        if file_status.st_size != stored_fingerprint['size']:
+            return False
+        if file_status.st_mtime_ns == stored_fingerprint['mtime']:
+            return True
+        if self.file_hash(source_path) != stored_fingerprint['hash']:
+            return False
+        stored_fingerprint['mtime'] = file_status.st_mtime_ns # same content, only touched - avoid hashing it again
+        return True
+
+    def read_metadata(self, name: str, source_paths: list) -> dict:
+        """Collects the metadata of a cache entry, if it is still valid for the given sources
+
+        Args:
+            name (str): name of the cache entry
+            source_paths (list): paths of the csv files the entry depends on
+
+        Returns:
+            dict: metadata of the entry, or None if it is missing or stale
+        """
+        parquet_path, metadata_path = self.entry_paths(name)
+        if not os.path.exists(parquet_path) or not os.path.exists(metadata_path):
+            return None
+        with open(metadata_path) as metadata_file:
+            metadata = json.load(metadata_file)
+        if metadata.get('version') != CACHE_VERSION or sorted(metadata['sources']) != sorted(source_paths):
+            return None
+        stored_mtimes = [metadata['sources'][path]['mtime'] for path in source_paths]
+        if not all(self.fingerprint_matches(metadata['sources'][path], path) for path in source_paths):
+            return None
+        if stored_mtimes != [metadata['sources'][path]['mtime'] for path in source_paths]:
+            self.write_metadata(name, metadata) # keep refreshed modification times so the hash isn't redone
+        return metadata
+
+    def write_metadata(self, name: str, metadata: dict):
+        """Saves the metadata of a cache entry
+
+        Args:
+            name (str): name of the cache entry
+            metadata (dict): version, source fingerprints and columns of the entry
+        """
+        _, metadata_path = self.entry_paths(name)
+        with open(metadata_path + '.tmp', 'w') as metadata_file:
+            json.dump(metadata, metadata_file)
+        os.replace(metadata_path + '.tmp', metadata_path)
+
+    def read(self, name: str, source_paths: list, columns: list = None) -> pd.DataFrame:
+        """Reads a cached dataframe if it is still valid and has all the requested columns
+
+        Args:
+            name (str): name of the cache entry
+            source_paths (list): paths of the csv files the entry depends on
+            columns (list, optional): columns to be read, all of them if None
+
+        Returns:
+            pd.DataFrame: cached dataframe, or None if it has to be rebuilt
+        """
+        try:
+            metadata = self.read_metadata(name, source_paths)
+            if metadata is None:
+                return None
+            if columns is not None and not set(columns).issubset(metadata['columns']):
+                return None
+            parquet_path, _ = self.entry_paths(name)
+            return pd.read_parquet(parquet_path, columns=columns)
+        except (OSError, ValueError, KeyError) as error: # unreadable or corrupted entries are simply rebuilt
+            return None
+
+    def write(self, name: str, source_paths: list, data: pd.DataFrame):
+        """Stores a dataframe together with the fingerprint of the sources it depends on
+
+        Args:
+            name (str): name of the cache entry
+            source_paths (list): paths of the csv files the entry depends on
+            data (pd.DataFrame): dataframe to be stored
+        """
+        os.makedirs(self.cache_directory, exist_ok=True)
+        parquet_path, _ = self.entry_paths(name)
+        metadata = {'version': CACHE_VERSION,
+                    'sources': {path: self.source_fingerprint(path) for path in source_paths},
+                    'columns': [str(column) for column in data.columns]}
+        data.to_parquet(parquet_path + '.tmp') # written aside and then moved, so an interrupted run never leaves half a file
+        os.replace(parquet_path + '.tmp', parquet_path)
+        self.write_metadata(name, metadata)
+
+    def add_columns(self, name: str, source_paths: list, new_columns: pd.DataFrame):
+        """Stores newly parsed columns of a source, keeping the columns already cached for it
+
+        Args:
+            name (str): name of the cache entry
+            source_paths (list): paths of the csv files the entry depends on
+            new_columns (pd.DataFrame): columns just parsed from the csv
+        """
+        cached_data = self.read(name, source_paths)
+        if cached_data is not None and len(cached_data) == len(new_columns):
+            kept_columns = [column for column in cached_data.columns if column not in new_columns.columns]
+            new_columns = pd.concat([cached_data[kept_columns], new_columns], axis=1)
+        self.write(name, source_paths, new_columns)
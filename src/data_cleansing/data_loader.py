@@ -0,0 +1,310 @@
+# MODULE RESPONSIBLE FOR READING THE RAW COLLISION DATASETS A SINGLE TIME AND SHARING THEM BETWEEN ALL ANALYSES
+import os
+import pandas as pd
+
+from instrumentation import trace_class
+from data_cleansing.data_cache import ParquetCache
+from data_cleansing.column_store import ColumnStore
+from data_cleansing.collision_schema import encode_table
+from data_cleansing.collision_join import CollisionRowIndex
+from data_cleansing.row_filters import filter_columns, row_mask
+
+DATA_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dados")) # 'dados' folder inside 'src'
+
+# csv file of each data source inside the data directory
+SOURCE_FILES = {
+    'crashes': 'Motor_Vehicle_Collisions_-_Crashes.csv',
+    'vehicles': 'Motor_Vehicle_Collisions_-_Vehicles.csv',
+    'person': 'Motor_Vehicle_Collisions_-_Person.csv',
+}
+# optional files some cleanings also depend on, inside the data directory - cleaned data is rebuilt when one is added, changed or removed
+DEPENDENCY_FILES = {
+    'borough_boundaries': 'Borough_Boundaries.geojson', # NYC Open Data borough boundaries, used to fill missing boroughs
+}
+
+# explicit dtypes of every column used by the analyses, so pandas doesn't have to infer them over the whole file -
+# text columns with few distinct values are parsed as categories and then encoded by the collision schema
+SOURCE_DTYPES = {
+    'crashes': {
+        'CRASH DATE': str,
+        'CRASH TIME': str,
+        'BOROUGH': 'category',
+        'ZIP CODE': str,
+        'LATITUDE': 'float64',
+        'LONGITUDE': 'float64',
+        'ON STREET NAME': 'category',
+        'NUMBER OF PEDESTRIANS INJURED': 'float32',
+        'NUMBER OF PEDESTRIANS KILLED': 'float32',
+        'NUMBER OF CYCLIST INJURED': 'float32',
+        'NUMBER OF CYCLIST KILLED': 'float32',
+        'NUMBER OF MOTORIST INJURED': 'float32',
+        'NUMBER OF MOTORIST KILLED': 'float32',
+        'CONTRIBUTING FACTOR VEHICLE 1': 'category',
+        'CONTRIBUTING FACTOR VEHICLE 2': 'category',
+        'CONTRIBUTING FACTOR VEHICLE 3': 'category',
+        'CONTRIBUTING FACTOR VEHICLE 4': 'category',
+        'CONTRIBUTING FACTOR VEHICLE 5': 'category',
+        'COLLISION_ID': 'int64',
+    },
+    'vehicles': {
+        'COLLISION_ID': 'int64',
+        'DRIVER_LICENSE_STATUS': 'category',
+        'CONTRIBUTING_FACTOR_1': 'category',
+        'CONTRIBUTING_FACTOR_2': 'category',
+    },
+    'person': {
+        'PERSON_TYPE': 'category',
+        'PERSON_INJURY': 'category',
+        'POSITION_IN_VEHICLE': 'category',
+        'SAFETY_EQUIPMENT': 'category',
+        'COMPLAINT': 'category',
+    },
+}
+
+
+@trace_class(skip=['source_path', 'register_columns', 'use_backend', 'is_memory_mapped'])
+class CollisionDataLoader:
+    """Registry that reads each collision data source once, keeping only the columns the analyses registered
+    """
+    def __init__(self, data_directory: str = DATA_DIRECTORY, use_cache: bool = True):
+        self.data_directory = data_directory
+        self.required_columns = {source: [] for source in SOURCE_FILES} # columns each analysis declared it needs
+        self.tables = {} # data sources already read, by name
+        self.crash_index = None # COLLISION_ID index of the crash rows, built the first time a join needs it
+        # parsed and cleaned data is kept on disk next to the csv files, unless disabled - parsed columns as files
+        # that are mapped instead of read, so the loaded tables of every process share the same memory
+        self.cache = ParquetCache(os.path.join(data_directory, 'cache')) if use_cache else None
+        self.column_store = ColumnStore(os.path.join(data_directory, 'cache', 'columns')) if use_cache else None
+        self.backend = None # engine of data_cleansing.query_backends the tables are read with, None for pandas
+
+    def source_path(self, source: str) -> str:
+        """Path of the csv file of a data source
+
+        Args:
+            source (str): name of the data source, or of one of the dependency files
+
+        Returns:
+            str: path of the file inside the data directory
+        """
+        return os.path.join(self.data_directory, SOURCE_FILES[source] if source in SOURCE_FILES else DEPENDENCY_FILES[source])
+
+    def register_columns(self, source: str, columns: list):
+        """Declares the columns an analysis needs from a data source, so the first read already includes them
+
+        Args:
+            source (str): name of the data source ('crashes', 'vehicles' or 'person')
+            columns (list): columns needed from the data source
+        """
+        for column in columns:
+            if column not in self.required_columns[source]:
+                self.required_columns[source].append(column)
+
+    def use_backend(self, backend):
+        """Reads the data sources with a query engine from now on, dropping the tables already read with pandas
+
+        Args:
+            backend: engine of data_cleansing.query_backends (e.g. DuckDBBackend()), None to go back to pandas
+        """
+        self.backend = backend
+        self.tables = {}
+        self.crash_index = None
+
+    def get_table(self, source: str, columns: list, filters: list = None) -> pd.DataFrame:
+        """Collects the requested columns of a data source, reading the csv only if they weren't loaded yet
+
+        Args:
+            source (str): name of the data source ('crashes', 'vehicles' or 'person')
+            columns (list): columns needed from the data source
+            filters (list, optional): filters of data_cleansing.row_filters the rows must pass - applied by the
+                query engine where it reads the data, if the loader uses one
+
+        Returns:
+            pd.DataFrame: new dataframe with only the requested columns of the rows kept, labelled by their
+            position in the csv, safe to be modified by the caller
+        """
+        try:
+            self.register_columns(source, columns + filter_columns(filters))
+            if self.backend is not None:
+                # the engine reads the registered columns once and only hands over the rows and columns requested
+                rows = self.backend.scan(source, self.source_path(source), self.required_columns[source], columns, filters)
+                return encode_table(source, rows)
+            table = self.load_table(source)
+            if isinstance(table, str):
+                return table
+            if filters:
+                return table.loc[row_mask(table, filters), columns] # boolean selection is a copy
+            return table.reindex(columns=columns) # reindex gives an independent frame, not a slice of the shared one
+        except FileNotFoundError as error:
+            return 'File path passed for data sources is invalid'
+        except (KeyError, ValueError) as error: # read_csv raises ValueError for columns missing from the file
+            return 'Data source passed has inconsistent/unaccounted keys'
+
+    def load_table(self, source: str) -> pd.DataFrame:
+        """Collects every registered column of a data source, reading the ones that weren't loaded yet - with the query engine if the loader uses one
+
+        Args:
+            source (str): name of the data source ('crashes', 'vehicles' or 'person')
+
+        Returns:
+            pd.DataFrame: table shared by every analysis, read-only where it is mapped from the column store - never modified by the callers
+        """
+        try:
+            loaded_columns = self.tables[source].columns if source in self.tables else []
+            # every registered column not yet in memory is read now, all at once
+            missing_columns = [column for column in self.required_columns[source] if column not in loaded_columns]
+            if missing_columns and self.backend is not None:
+                # the engine reads the csv, every registered column of every row is handed over
+                required_columns = self.required_columns[source]
+                rows = self.backend.scan(source, self.source_path(source), required_columns, required_columns)
+                self.tables[source] = encode_table(source, rows)
+            elif missing_columns:
+                self.tables[source] = self.read_columns(source, missing_columns)
+            return self.tables[source]
+        except FileNotFoundError as error:
+            return 'File path passed for data sources is invalid'
+        except (KeyError, ValueError) as error: # read_csv raises ValueError for columns missing from the file
+            return 'Data source passed has inconsistent/unaccounted keys'
+
+    def is_memory_mapped(self, source: str) -> bool:
+        """Checks if every registered column of a data source is in the column store, so another process can map
+        them itself instead of receiving a copy
+
+        Args:
+            source (str): name of the data source
+
+        Returns:
+            bool: True if the column store holds all the registered columns, as parsed from the current csv
+        """
+        if self.column_store is None or self.backend is not None:
+            return False
+        metadata = self.column_store.read_metadata(source, [self.source_path(source)])
+        return metadata is not None and set(self.required_columns[source]).issubset(metadata['columns'])
+
+    def get_crash_index(self):
+        """Collects the COLLISION_ID index of the crash rows, building it only the first time it is needed
+
+        Returns:
+            CollisionRowIndex: index shared by every join with the crashes of this loader
+        """
+        if self.crash_index is None: # reset whenever the crash rows are dropped from memory
+            self.crash_index = CollisionRowIndex(self.get_table('crashes', ['COLLISION_ID'])['COLLISION_ID'])
+        return self.crash_index
+
+    def read_columns(self, source: str, columns: list) -> pd.DataFrame:
+        """Reads a set of columns from the csv of a data source and adds them to the ones already loaded
+
+        Args:
+            source (str): name of the data source
+            columns (list): columns to be read from the csv
+
+        Returns:
+            pd.DataFrame: every loaded column of the data source
+        """
+        source_path = self.source_path(source)
+        new_columns = self.column_store.read(source, [source_path], columns) if self.column_store is not None else None
+        if new_columns is None: # not stored yet or csv changed since - parse it and store the parsed columns
+            column_dtypes = {column: SOURCE_DTYPES[source][column] for column in columns if column in SOURCE_DTYPES[source]}
+            new_columns = pd.read_csv(source_path, usecols=columns, dtype=column_dtypes)[columns] # usecols doesn't keep the requested order
+            new_columns = encode_table(source, new_columns) # same categories and spellings in every analysis
+            if self.column_store is not None:
+                self.column_store.add_columns(source, [source_path], new_columns)
+                # the parsed copy is dropped for the stored files, which other processes map too
+                stored_columns = self.column_store.read(source, [source_path], columns)
+                new_columns = stored_columns if stored_columns is not None else new_columns
+        if source not in self.tables:
+            return new_columns
+        # same file read again, so rows are aligned with the columns already in memory - joined without copying them
+        return pd.DataFrame({**dict(self.tables[source].items()), **dict(new_columns.items())}, copy=False)
+
+    def iter_chunks(self, source: str, columns: list, chunk_size: int):
+        """Reads the requested columns of a data source in chunks of a fixed number of rows, never keeping the whole file in memory
+
+        Args:
+            source (str): name of the data source
+            columns (list): columns needed from the data source
+            chunk_size (int): number of rows of each chunk
+
+        Yields:
+            pd.DataFrame: next chunk of the data source
+        """
+        column_dtypes = {column: SOURCE_DTYPES[source][column] for column in columns if column in SOURCE_DTYPES[source]}
+        for chunk in pd.read_csv(self.source_path(source), usecols=columns, dtype=column_dtypes, chunksize=chunk_size):
+            yield encode_table(source, chunk[columns])
+
+    def get_cleaned(self, name: str, sources: list, build_function) -> pd.DataFrame:
+        """Collects the output of a cleaning class from the cache, building it only if the sources changed
+
+        Args:
+            name (str): name the cleaned dataframe is stored under
+            sources (list): data sources the cleaning depends on
+            build_function (callable): function that produces the cleaned dataframe
+
+        Returns:
+            pd.DataFrame: cleaned dataframe
+        """
+        if self.cache is None:
+            return build_function()
+        try:
+            source_paths = [self.source_path(source) for source in sources]
+            cleaned_data = self.cache.read(name, source_paths)
+            if cleaned_data is None:
+                cleaned_data = build_function()
+                if isinstance(cleaned_data, pd.DataFrame): # error messages are never cached
+                    self.cache.write(name, source_paths, cleaned_data)
+            return cleaned_data
+        except FileNotFoundError as error:
+            return 'File path passed for data sources is invalid'
+
+
+class InMemoryDataSource:
+    """Data source over dataframes that are already in memory (e.g. a chunk of a csv), nothing is read or cached
+    """
+    def __init__(self, tables: dict):
+        self.tables = tables # dataframe of each data source, by name
+        self.crash_index = None # COLLISION_ID index of the crash rows, built the first time a join needs it
+
+    def get_table(self, source: str, columns: list, filters: list = None) -> pd.DataFrame:
+        """Collects the requested columns of one of the dataframes
+
+        Args:
+            source (str): name of the data source
+            columns (list): columns needed from the data source
+            filters (list, optional): filters of data_cleansing.row_filters the rows must pass
+
+        Returns:
+            pd.DataFrame: new dataframe with only the requested columns of the rows kept, encoded as the loader does, safe to be modified by the caller
+        """
+        try:
+            if filters:
+                # filtered after encoding, so values are compared with the spellings the loader gives them
+                table = encode_table(source, self.tables[source][list(dict.fromkeys(columns + filter_columns(filters)))].copy())
+                return table.loc[row_mask(table, filters), columns]
+            return encode_table(source, self.tables[source][columns].copy())
+        except KeyError as error:
+            return 'Data source passed has inconsistent/unaccounted keys'
+
+    def get_crash_index(self):
+        """Collects the COLLISION_ID index of the crash rows, building it only the first time it is needed
+
+        Returns:
+            CollisionRowIndex: index shared by every join with the crashes of this data source
+        """
+        if self.crash_index is None:
+            self.crash_index = CollisionRowIndex(self.tables['crashes']['COLLISION_ID'])
+        return self.crash_index
+
+    def get_cleaned(self, name: str, sources: list, build_function) -> pd.DataFrame:
+        """Builds the output of a cleaning class, data in memory is never cached
+
+        Args:
+            name (str): name the cleaned dataframe would be stored under
+            sources (list): data sources the cleaning depends on
+            build_function (callable): function that produces the cleaned dataframe
+
+        Returns:
+            pd.DataFrame: cleaned dataframe
+        """
+        return build_function()
+
+
+collision_data = CollisionDataLoader() # single loader shared by every analysis
@@ -1,17 +1,33 @@
 # MODULE RESPONSIBLE FOR CLEANSING AND SELECTING DATA FOR LATER VISUALIZATION
+import os
 import pandas as pd
-import pgeocode
 
-try:
-    crashes = pd.read_csv("src/dados/Motor_Vehicle_Collisions_-_Crashes.csv") # collect info from crashes csv to df 
-    vehicle = pd.read_csv("src/dados/Motor_Vehicle_Collisions_-_Vehicles.csv") # collect info from vehicles csv to df
-except FileNotFoundError as error:
-    return 'File path passed for data sources is invalid"
+from instrumentation import trace_class
+from data_cleansing.data_loader import collision_data
+from data_cleansing.factor_counting import CONTRIBUTING_FACTOR_COLUMNS
+from data_cleansing.zip_centroids import ZipCentroidIndex
+from data_cleansing.collision_join import crash_row_index
+from data_cleansing.borough_boundaries import fill_missing_boroughs
+from data_cleansing.row_filters import not_null, not_equal
+
+# columns each class needs from the data sources - registered at import so every source is read only once
+CRASH_LOCATION_COLUMNS = ['ZIP CODE', 'LATITUDE', 'LONGITUDE', 'ON STREET NAME',
+                          'NUMBER OF PEDESTRIANS INJURED', 'NUMBER OF PEDESTRIANS KILLED',
+                          'NUMBER OF CYCLIST INJURED', 'NUMBER OF CYCLIST KILLED', 'BOROUGH', 'CROSS STREET NAME']
+LISCENSE_STATUS_CRASH_COLUMNS = ['COLLISION_ID', 'BOROUGH', 'LATITUDE', 'LONGITUDE']
+LISCENSE_STATUS_VEHICLE_COLUMNS = ['COLLISION_ID', 'DRIVER_LICENSE_STATUS', 'CONTRIBUTING_FACTOR_1', 'CONTRIBUTING_FACTOR_2']
+CRASH_PERIOD_COLUMNS = ['CRASH TIME'] + CONTRIBUTING_FACTOR_COLUMNS
+ZIP_FILLED_COLUMN = 'COORDINATES FROM ZIP' # True for the crashes located at the centroid of their zip code, not where they happened
+collision_data.register_columns('crashes', CRASH_LOCATION_COLUMNS + LISCENSE_STATUS_CRASH_COLUMNS + CRASH_PERIOD_COLUMNS)
+collision_data.register_columns('vehicles', LISCENSE_STATUS_VEHICLE_COLUMNS)
+
+@trace_class
 class CrashLocationData:
     """Class responsible for creating a dataframe of collisions with complete geographical data
     """
-    def __init__(self):
-        self.full_geo_data = self.get_geo_data()
+    def __init__(self, data_source=collision_data):
+        self.data_source = data_source # shared loader by default, any object with get_table and get_cleaned works
+        self.full_geo_data = data_source.get_cleaned('crash_location_data', ['crashes', 'borough_boundaries'], self.get_geo_data)
 
     def get_geo_data(self) -> pd.DataFrame:
         """
@@ -23,10 +39,12 @@ class CrashLocationData:
             A complete dataframe with all the geographic info available
         """
         try:
-            geo_data_df = crashes.copy(deep=True) # initially we make a copy of the large unfiltered dataframe
-            geo_data_df.dropna(inplace=True,axis=0,subset=["LATITUDE", "LONGITUDE", "ZIP CODE"],how='all') # we then drop all unusable rows
+            # initially we collect a copy of the needed location columns, without the unusable rows - dropped where the data is read
+            geo_data_df = self.data_source.get_table('crashes', CRASH_LOCATION_COLUMNS, [not_null(["LATITUDE", "LONGITUDE", "ZIP CODE"], how='all')])
             geo_data_df.reset_index(inplace=True) # after drop we reset index to make dataframe more manageable and allow for fill of empty calues
             full_geo_data_df = self.fill_lat_long_by_zip(geo_data_df) # fill empty geographical data through aproximations made by zip-code
+            if isinstance(full_geo_data_df, pd.DataFrame):
+                full_geo_data_df['BOROUGH'] = fill_missing_boroughs(full_geo_data_df, self.data_source) # borough from the (filled) coordinates
             return full_geo_data_df # return dataframe of collisions with complete geographical data
         except KeyError as error:
             return 'Dataframe passed has inconsistent/unaccounted keys'
@@ -34,7 +52,7 @@ class CrashLocationData:
 
     def fill_lat_long_by_zip(self,data:pd.DataFrame) -> pd.DataFrame:
         """
-        Fills latitude and longitude of rows that only have zipcode info
+        Fills latitude and longitude of rows that only have zipcode info, flagging them in the ZIP_FILLED_COLUMN
 
         Returns
         -------
@@ -42,28 +60,32 @@ class CrashLocationData:
             A complete dataframe with all the geographic info available
         """
         try:
-            data_with_zip = data[data["ZIP CODE"].isna() == False] # DataFrame of salvageable rows 
-            missing_geo_df = data_with_zip[data_with_zip["LATITUDE"].isna() == True] # select all rows with missing geographical data
-            nomi = pgeocode.Nominatim('us') # realtional database of american zipcodes and latitude and longitude
-
-            # lambda function takes all values before "." i.e.: original_zip = xxx.z new_zip = xxx
-            formatted_postal_codes = missing_geo_df["ZIP CODE"].astype('str').apply(func=lambda row: row.split(".")[0]).to_list() # Reformatting to be in accordance to database postal codes
-
-            coordinates = nomi.query_postal_code(formatted_postal_codes) # map all formatted postal codes to their respective lat/lon
-            coordinates.dropna(axis=0, inplace=True, subset=["latitude", "longitude"], how="any") # Dropping zip codes not recorded in database
-            data.loc[coordinates.index, "LONGITUDE"] = coordinates["longitude"] # fill missing lat
-            data.loc[coordinates.index, "LATITUDE"] = coordinates["latitude"] # fill missing lon
+            missing_geo = data["ZIP CODE"].notna() & data["LATITUDE"].isna() # salvageable rows: zip code but no coordinates
+            # the index is cached with the other cached data of the loader - data sources without a cache never write it
+            cache = getattr(self.data_source, 'cache', None)
+            zip_index_path = os.path.join(cache.cache_directory, 'zip_centroids.npz') if cache is not None else None
+            zip_index = ZipCentroidIndex(cache_path=zip_index_path) # local index of american zipcodes and their mean latitude and longitude - no download needed
+            # each distinct zip code is looked up once and the coordinates are spread back to every row with it
+            latitudes, longitudes = zip_index.query(data.loc[missing_geo, "ZIP CODE"])
+            data.loc[missing_geo, "LATITUDE"] = latitudes # fill missing lat - zip codes not recorded stay empty
+            data.loc[missing_geo, "LONGITUDE"] = longitudes # fill missing lon
+            # an approximation is fine for boroughs and the map, but analyses of exact spots must leave these rows out
+            data[ZIP_FILLED_COLUMN] = missing_geo & data["LATITUDE"].notna()
             return data # return completed dataset
         except TypeError as error:
             return 'Paramater passed was not a pandas.DataFrame'
         except KeyError as error:
             return 'Dataframe passed has inconsistent/unaccounted keys'
+        except FileNotFoundError as error:
+            return 'File path passed for data sources is invalid'
+@trace_class
 class LiscenseStatusCollisionData:
     """Class responsible for cleaning a selecting collision data to be used to asses composition and distribuition of 
     specfic collisions by Driver liscense status of those involved
     """
-    def __init__(self):
-        self.complete_liscense_status_df = self.get_liscense_and_collision_info()
+    def __init__(self, data_source=collision_data):
+        self.data_source = data_source # shared loader by default, any object with get_table and get_cleaned works
+        self.complete_liscense_status_df = data_source.get_cleaned('liscense_status_collision_data', ['crashes', 'vehicles', 'borough_boundaries'], self.get_liscense_and_collision_info)
     def get_liscense_and_collision_info(self) -> pd.DataFrame:
         """cleans crashes & vehicle df mergin both and segments into 4 essential collumns
 
@@ -71,37 +93,31 @@ class LiscenseStatusCollisionData:
             pd.DataFrame: Dataframe of collisions with driver liscese status CF1 & CF2, with no NaN values
         """
         try:
-            collision_data = crashes.copy(deep=True)[['COLLISION_ID','BOROUGH']] # select unique key and location info from crashes
-            vehicle_data = vehicle.copy(deep=True) # copy all vehicle df
-            liscense_data_df = vehicle_data[['COLLISION_ID','DRIVER_LICENSE_STATUS','CONTRIBUTING_FACTOR_1','CONTRIBUTING_FACTOR_2']] # Select 4 essential collumns from vehicle data
-            liscense_data_df = pd.merge(liscense_data_df, collision_data, on='COLLISION_ID', how='left') # merge liscense data and collision data give unique key identifies COLLISION ID to be able to identify each collision by Borough
-            liscense_data_df.dropna(how='any',subset=['DRIVER_LICENSE_STATUS','BOROUGH'],inplace=True) # rows without info on borough cannot be used
+            crash_location_df = self.data_source.get_table('crashes', LISCENSE_STATUS_CRASH_COLUMNS) # select unique key and location info from crashes
+            crash_location_df['BOROUGH'] = fill_missing_boroughs(crash_location_df, self.data_source) # crashes with coordinates but no borough are kept
+            # Select 4 essential collumns from vehicle data - vehicles without license status are dropped where the data is read, before the join
+            liscense_data_df = self.data_source.get_table('vehicles', LISCENSE_STATUS_VEHICLE_COLUMNS, [not_null(['DRIVER_LICENSE_STATUS'])])
+            # the borough of each vehicle is gathered from the row of its crash, found through the COLLISION_ID index - no merge of the two tables
+            crash_index = crash_row_index(self.data_source, crash_location_df)
+            liscense_data_df['BOROUGH'] = crash_index.gather(crash_location_df['BOROUGH'], liscense_data_df['COLLISION_ID'])
+            liscense_data_df = liscense_data_df[liscense_data_df['BOROUGH'].notna()] # rows without info on borough cannot be used
             return liscense_data_df
         except KeyError as error:
             return 'Dataframe passed has inconsistent/unaccounted keys'
     
+@trace_class
 class CrashByPeriodData:
     """Class responsible for creating and cleaning dataframe with all accident data encompassing all CF and the time of the collision
     """
-    def __init__(self):
-        self.complete_crash_period_data = self.get_crash_data()
+    def __init__(self, data_source=collision_data):
+        self.data_source = data_source # shared loader by default, any object with get_table and get_cleaned works
+        self.complete_crash_period_data = data_source.get_cleaned('crash_by_period_data', ['crashes'], self.get_crash_data)
     def get_crash_data(self) -> pd.DataFrame:
         try:
-            accidents_data = crashes.copy(deep=True)[[
-                                                    'CRASH TIME', 
-                                                    'CONTRIBUTING FACTOR VEHICLE 1',
-                                                    'CONTRIBUTING FACTOR VEHICLE 2',
-                                                    'CONTRIBUTING FACTOR VEHICLE 3',
-                                                    'CONTRIBUTING FACTOR VEHICLE 4',
-                                                    'CONTRIBUTING FACTOR VEHICLE 5']] # collect all contributiing factor and the time they happened
-            accidents_data.dropna(how='any', subset=['CRASH TIME', 'CONTRIBUTING FACTOR VEHICLE 1'], inplace=True) #Any row without date-time cannot be anlysed - if CFV 1 doesn't exist, others don't too'
-
-            # ignore all rows with unspecified CF
-            accidents_data = accidents_data[accidents_data['CONTRIBUTING FACTOR VEHICLE 1'] != 'Unspecified']
-            accidents_data = accidents_data[accidents_data['CONTRIBUTING FACTOR VEHICLE 2'] != 'Unspecified']
-            accidents_data = accidents_data[accidents_data['CONTRIBUTING FACTOR VEHICLE 3'] != 'Unspecified']
-            accidents_data = accidents_data[accidents_data['CONTRIBUTING FACTOR VEHICLE 4'] != 'Unspecified']
-            accidents_data = accidents_data[accidents_data['CONTRIBUTING FACTOR VEHICLE 5'] != 'Unspecified']
+            # collect all contributiing factor and the time they happened - both filters are applied where the data is read
+            accidents_data = self.data_source.get_table('crashes', CRASH_PERIOD_COLUMNS,
+                                                        [not_null(['CRASH TIME', 'CONTRIBUTING FACTOR VEHICLE 1']), #Any row without date-time cannot be anlysed - if CFV 1 doesn't exist, others don't too'
+                                                         not_equal(CONTRIBUTING_FACTOR_COLUMNS, 'Unspecified')]) # ignore all rows with unspecified CF
             
             return accidents_data
         except KeyError as error:
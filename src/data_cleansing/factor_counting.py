@@ -0,0 +1,86 @@
+# MODULE RESPONSIBLE FOR COUNTING CONTRIBUTING FACTORS OF ALL VEHICLES OF A COLLISION IN A SINGLE PASS
+import pandas as pd
+import numpy as np
+
+from instrumentation import trace_class
+
+CONTRIBUTING_FACTOR_COLUMNS = ['CONTRIBUTING FACTOR VEHICLE 1',
+                               'CONTRIBUTING FACTOR VEHICLE 2',
+                               'CONTRIBUTING FACTOR VEHICLE 3',
+                               'CONTRIBUTING FACTOR VEHICLE 4',
+                               'CONTRIBUTING FACTOR VEHICLE 5']
+
+
+@trace_class
+class ContributingFactorCounter:
+    """Class responsible for turning the contributing factor columns of a dataframe into a single long array of
+    factor codes, which can then be counted by any grouping of the collisions in one pass
+    """
+    def __init__(self, factor_data: pd.DataFrame, factor_columns: list = CONTRIBUTING_FACTOR_COLUMNS):
+        self.column_count = len(factor_columns)
+        self.factors = pd.Index([], dtype=object) # every factor found, position in the index is the factor code
+        column_codes = []
+        for column in factor_columns:
+            codes, column_factors = pd.factorize(factor_data[column]) # missing factors get code -1
+            new_factors = column_factors[self.factors.get_indexer(column_factors) == -1]
+            self.factors = self.factors.append(pd.Index(new_factors, dtype=object))
+            # translate the codes of this column into the codes shared by all columns, keeping -1 for missing values
+            shared_codes = np.append(self.factors.get_indexer(column_factors), -1)
+            column_codes.append(shared_codes[codes])
+        # factors are kept in alphabetical order, so counts of different parts of the data line up in the same order
+        alphabetical_order = np.argsort(self.factors.to_numpy(dtype=str), kind='stable')
+        code_of_factor = np.append(np.argsort(alphabetical_order), -1) # new code of each old code, missing values keep -1
+        self.factors = self.factors[alphabetical_order]
+        # long format: the factors of vehicle 1 of all rows, then of vehicle 2, and so on
+        self.factor_codes = code_of_factor[np.concatenate(column_codes)].astype(np.int32) if column_codes else np.empty(0, dtype=np.int32)
+
+    def count_by_group(self, groups: pd.Series) -> pd.DataFrame:
+        """Counts the occurrences of each contributing factor in each group of collisions
+
+        Args:
+            groups (pd.Series): group of each row of the original dataframe, missing values are ignored
+
+        Returns:
+            pd.DataFrame: table of counts with one row per group and one column per contributing factor
+        """
+        group_name = getattr(groups, 'name', None)
+        groups = pd.Categorical(groups)
+        group_codes = np.tile(np.asarray(groups.codes, dtype=np.int64), self.column_count) # group of each long format entry
+        valid = (group_codes >= 0) & (self.factor_codes >= 0)
+        combined_codes = group_codes[valid] * len(self.factors) + self.factor_codes[valid]
+        counts = np.bincount(combined_codes, minlength=len(groups.categories) * len(self.factors))
+        return pd.DataFrame(counts.reshape(len(groups.categories), len(self.factors)),
+                            index=pd.CategoricalIndex(groups.categories, categories=groups.categories, ordered=groups.ordered, name=group_name),
+                            columns=self.factors)
+
+    @staticmethod
+    def to_long_format(factor_counts: pd.DataFrame) -> pd.DataFrame:
+        """Turns a table of counts into a dataframe with one row per group and factor that occurred
+
+        Args:
+            factor_counts (pd.DataFrame): table of counts produced by count_by_group, or the sum of several of them
+
+        Returns:
+            pd.DataFrame: 'CONTRIBUTING FACTOR', group and 'Number of occurrences' columns, ordered by group
+        """
+        counts = factor_counts.to_numpy()
+        group_positions, factor_positions = np.nonzero(counts)
+        return pd.DataFrame({'CONTRIBUTING FACTOR': factor_counts.columns[factor_positions],
+                             factor_counts.index.name: factor_counts.index[group_positions],
+                             'Number of occurrences': counts[group_positions, factor_positions]})
+
+    @staticmethod
+    def top_factors(factor_counts: pd.DataFrame, k: int = 5) -> dict:
+        """Selects the k most frequent contributing factors of each group
+
+        Args:
+            factor_counts (pd.DataFrame): table of counts produced by count_by_group, or the sum of several of them
+            k (int, optional): number of factors per group. Defaults to 5.
+
+        Returns:
+            dict: list of the most frequent factors of each group, from most to least frequent
+        """
+        counts = factor_counts.to_numpy()
+        ranking = np.argsort(-counts, axis=1, kind='stable')[:, :k]
+        return {group: [factor_counts.columns[position] for position in ranking[index] if counts[index, position] > 0]
+                for index, group in enumerate(factor_counts.index)}
@@ -0,0 +1,172 @@
+# MODULE RESPONSIBLE FOR RUNNING THE PROJECTIONS AND ROW FILTERS OF THE CLEANING CLASSES ON A MULTI-THREADED COLUMNAR ENGINE
+import pandas as pd
+
+from data_cleansing.data_loader import SOURCE_DTYPES
+from data_cleansing.row_filters import NOT_NULL, NOT_EQUAL
+
+# type of each loader dtype in each engine - columns without an explicit dtype are read as text
+DUCKDB_TYPES = {str: 'VARCHAR', 'category': 'VARCHAR', 'float64': 'DOUBLE', 'float32': 'FLOAT', 'int64': 'BIGINT'}
+POLARS_TYPES = {str: 'Utf8', 'category': 'Utf8', 'float64': 'Float64', 'float32': 'Float32', 'int64': 'Int64'}
+# text pandas.read_csv reads as a missing value by default (its na_values), so the engines leave out the same values
+PANDAS_NA_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN', '<NA>',
+                    'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+ROW_COLUMN = '__row__' # position of each row in the csv, returned as the index so rows keep the labels pandas gives them
+
+
+def quote_name(name: str) -> str:
+    """Quotes a table or column name for SQL, e.g. CRASH DATE -> "CRASH DATE"
+    """
+    return '"' + name.replace('"', '""') + '"'
+
+
+class DuckDBBackend:
+    """Backend that copies the registered columns of each csv into an in-memory DuckDB table once, parsed on every core,
+    and answers each request with a query that only reads the requested columns and filters the rows in the engine
+    """
+    def __init__(self):
+        import duckdb # optional, only needed when this backend is chosen
+        self.engine_error = duckdb.Error
+        self.connection = duckdb.connect() # in-memory database, every query runs on all cores
+        self.loaded_columns = {} # columns already in the table of each source
+
+    def load_columns(self, source: str, source_path: str, columns: list):
+        """Reads columns of a csv into the table of a source, with the types the pandas loader parses them with
+
+        Args:
+            source (str): name of the data source
+            source_path (str): path of the csv
+            columns (list): every column the table must have
+        """
+        selected = ', '.join('CAST({0} AS {1}) AS {0}'.format(quote_name(column), DUCKDB_TYPES[SOURCE_DTYPES[source].get(column, str)])
+                             for column in columns)
+        csv_path = "'" + source_path.replace("'", "''") + "'"
+        null_values = '[' + ', '.join("'" + value.replace("'", "''") + "'" for value in PANDAS_NA_VALUES) + ']'
+        # every field is read as text and cast afterwards, so the same fields as with pandas become missing values
+        self.connection.execute(f'CREATE OR REPLACE TABLE {quote_name(source)} AS SELECT {selected} '
+                                f'FROM read_csv({csv_path}, header = true, all_varchar = true, nullstr = {null_values})')
+        self.loaded_columns[source] = list(columns)
+
+    def condition(self, filters: list) -> tuple:
+        """Translates filters into a WHERE condition
+
+        Args:
+            filters (list): filters of data_cleansing.row_filters
+
+        Returns:
+            tuple: SQL condition (None without filters) and the values it is run with
+        """
+        conditions, parameters = [], []
+        for kind, columns, argument in filters or []:
+            if kind == NOT_NULL:
+                present = [quote_name(column) + ' IS NOT NULL' for column in columns]
+                conditions.append('(' + (' AND ' if argument == 'any' else ' OR ').join(present) + ')')
+            elif kind == NOT_EQUAL:
+                # the loader normalizes spacing and case of text afterwards, so the comparison ignores them too
+                for column in columns:
+                    conditions.append(f'({quote_name(column)} IS NULL OR lower(trim({quote_name(column)})) <> lower(?))')
+                    parameters.append(argument)
+            else:
+                raise KeyError(kind)
+        return (' AND '.join(conditions) if conditions else None), parameters
+
+    def scan(self, source: str, source_path: str, loaded_columns: list, columns: list, filters: list = None) -> pd.DataFrame:
+        """Collects the requested columns of the rows that pass the filters
+
+        Args:
+            source (str): name of the data source
+            source_path (str): path of the csv
+            loaded_columns (list): every column registered for the source, all read at once the first time
+            columns (list): columns returned
+            filters (list, optional): filters of data_cleansing.row_filters
+
+        Returns:
+            pd.DataFrame: rows kept, in the order of the csv and labelled by their position in it
+        """
+        try:
+            if any(column not in self.loaded_columns.get(source, []) for column in loaded_columns):
+                self.load_columns(source, source_path, list(dict.fromkeys(self.loaded_columns.get(source, []) + loaded_columns)))
+            condition, parameters = self.condition(filters)
+            # rowid is the position of each row in the table, which keeps the order of the csv
+            query = f'SELECT rowid AS {quote_name(ROW_COLUMN)}, ' + ', '.join(quote_name(column) for column in columns) + ' FROM ' + quote_name(source)
+            rows = self.connection.execute(query + (' WHERE ' + condition if condition else '') + ' ORDER BY rowid', parameters).df()
+            return rows.set_index(ROW_COLUMN).rename_axis(None)
+        except self.engine_error as error: # e.g. a column missing from the csv
+            raise KeyError(str(error))
+
+
+class PolarsBackend:
+    """Backend that reads the registered columns of each csv into a Polars frame once, parsed on every core, and answers
+    each request with a lazy query that filters and projects in the engine before anything is turned into pandas
+    """
+    def __init__(self):
+        import polars # optional, only needed when this backend is chosen
+        self.polars = polars
+        self.engine_error = polars.exceptions.PolarsError
+        self.frames = {} # columns already read of each source
+
+    def load_columns(self, source: str, source_path: str, columns: list):
+        """Reads columns of a csv into the frame of a source, with the types the pandas loader parses them with
+
+        Args:
+            source (str): name of the data source
+            source_path (str): path of the csv
+            columns (list): every column the frame must have
+        """
+        column_types = {column: getattr(self.polars, POLARS_TYPES[SOURCE_DTYPES[source].get(column, str)]) for column in columns}
+        frame = self.polars.read_csv(source_path, columns=columns, schema_overrides=column_types,
+                                     null_values=PANDAS_NA_VALUES).select(columns) # same missing values as with pandas
+        self.frames[source] = frame.with_row_index(ROW_COLUMN)
+
+    def condition(self, filters: list):
+        """Translates filters into a Polars expression
+
+        Args:
+            filters (list): filters of data_cleansing.row_filters
+
+        Returns:
+            polars.Expr: True for the rows kept, None without filters
+        """
+        polars = self.polars
+        conditions = []
+        for kind, columns, argument in filters or []:
+            if kind == NOT_NULL:
+                present = [polars.col(column).is_not_null() for column in columns]
+                conditions.append(polars.all_horizontal(present) if argument == 'any' else polars.any_horizontal(present))
+            elif kind == NOT_EQUAL:
+                for column in columns: # spacing and case are normalized by the loader afterwards, so they are ignored here too
+                    text = polars.col(column).cast(polars.Utf8).str.strip_chars().str.to_lowercase()
+                    conditions.append(polars.col(column).is_null() | (text != str(argument).lower()))
+            else:
+                raise KeyError(kind)
+        return polars.all_horizontal(conditions) if conditions else None
+
+    def scan(self, source: str, source_path: str, loaded_columns: list, columns: list, filters: list = None) -> pd.DataFrame:
+        """Collects the requested columns of the rows that pass the filters
+
+        Args:
+            source (str): name of the data source
+            source_path (str): path of the csv
+            loaded_columns (list): every column registered for the source, all read at once the first time
+            columns (list): columns returned
+            filters (list, optional): filters of data_cleansing.row_filters
+
+        Returns:
+            pd.DataFrame: rows kept, in the order of the csv and labelled by their position in it
+        """
+        try:
+            frame = self.frames.get(source)
+            frame_columns = [column for column in frame.columns if column != ROW_COLUMN] if frame is not None else []
+            if any(column not in frame_columns for column in loaded_columns):
+                self.load_columns(source, source_path, list(dict.fromkeys(frame_columns + loaded_columns)))
+            query = self.frames[source].lazy()
+            condition = self.condition(filters)
+            if condition is not None:
+                query = query.filter(condition)
+            rows = query.select([self.polars.col(ROW_COLUMN).cast(self.polars.Int64)] + columns).collect().to_pandas()
+            return rows.set_index(ROW_COLUMN).rename_axis(None)
+        except self.engine_error as error: # e.g. a column missing from the csv
+            raise KeyError(str(error))
+
+
+# engines the loader can read the data with - pandas, the reference, needs no backend
+QUERY_BACKENDS = {'pandas': None, 'duckdb': DuckDBBackend, 'polars': PolarsBackend}
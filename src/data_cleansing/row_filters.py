@@ -0,0 +1,67 @@
+# MODULE RESPONSIBLE FOR DESCRIBING THE ROW FILTERS OF THE CLEANING CLASSES, SO EACH QUERY BACKEND CAN APPLY THEM WHERE IT READS THE DATA
+import numpy as np
+import pandas as pd
+
+# a filter is a tuple (kind, columns, argument) - plain data, so it can be translated by any backend
+NOT_NULL = 'not_null'
+NOT_EQUAL = 'not_equal'
+
+
+def not_null(columns: list, how: str = 'any') -> tuple:
+    """Keeps the rows pandas.DataFrame.dropna(subset=columns, how=how) would keep
+
+    Args:
+        columns (list): columns checked for missing values
+        how (str, optional): 'any' drops rows missing any of the columns, 'all' only rows missing all of them
+
+    Returns:
+        tuple: filter
+    """
+    return (NOT_NULL, list(columns), how)
+
+
+def not_equal(columns: list, value: str) -> tuple:
+    """Keeps the rows where none of the columns holds a value - missing values are kept, as pandas compares them
+
+    Args:
+        columns (list): columns compared
+        value (str): value rejected, e.g. 'Unspecified'
+
+    Returns:
+        tuple: filter
+    """
+    return (NOT_EQUAL, list(columns), value)
+
+
+def filter_columns(filters: list) -> list:
+    """Columns the filters read
+
+    Args:
+        filters (list): filters, None for no filter
+
+    Returns:
+        list: columns in the order they first appear
+    """
+    return list(dict.fromkeys(column for _, columns, _ in filters or [] for column in columns))
+
+
+def row_mask(table: pd.DataFrame, filters: list) -> np.ndarray:
+    """Applies the filters to a dataframe in memory - the reference every other backend has to match
+
+    Args:
+        table (pd.DataFrame): rows with every column the filters read
+        filters (list): filters, None for no filter
+
+    Returns:
+        np.ndarray: True for the rows kept
+    """
+    mask = np.ones(len(table), dtype=bool)
+    for kind, columns, argument in filters or []:
+        if kind == NOT_NULL:
+            present = table[columns].notna()
+            mask &= (present.all(axis=1) if argument == 'any' else present.any(axis=1)).to_numpy()
+        elif kind == NOT_EQUAL:
+            mask &= (table[columns] != argument).all(axis=1).to_numpy()
+        else:
+            raise KeyError(kind)
+    return mask
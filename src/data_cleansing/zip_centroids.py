@@ -0,0 +1,84 @@
+# MODULE RESPONSIBLE FOR APPROXIMATING COORDINATES OF COLLISIONS BY THEIR ZIP CODE WITHOUT ANY NETWORK ACCESS
+import os
+import zipfile
+import pandas as pd
+import numpy as np
+
+from instrumentation import trace_class
+from data_cleansing.data_loader import DATA_DIRECTORY
+
+ZIP_TABLE_PATH = os.path.join(os.path.dirname(__file__), "US.txt") # GeoNames table of american postal codes
+ZIP_INDEX_CACHE_PATH = os.path.join(DATA_DIRECTORY, "cache", "zip_centroids.npz")
+
+
+@trace_class
+class ZipCentroidIndex:
+    """Class responsible for mapping zip codes to the mean latitude and longitude of their area, held as a sorted
+    array of integer zip codes with aligned float32 coordinate arrays - cached in cache_path, or only kept in memory if it is None
+    """
+    def __init__(self, table_path: str = ZIP_TABLE_PATH, cache_path: str = ZIP_INDEX_CACHE_PATH):
+        self.table_path = table_path
+        self.cache_path = cache_path
+        self.zip_codes, self.latitudes, self.longitudes = self.load_index()
+
+    def load_index(self) -> tuple:
+        """Loads the index from its cache file, building it from the GeoNames table if the table changed
+
+        Returns:
+            tuple: sorted zip codes, latitude and longitude of each one
+        """
+        table_status = os.stat(self.table_path)
+        table_fingerprint = np.array([table_status.st_size, table_status.st_mtime_ns], dtype=np.int64)
+        if self.cache_path is not None and os.path.exists(self.cache_path):
+            try:
+                with np.load(self.cache_path) as cached_index:
+                    if np.array_equal(cached_index['fingerprint'], table_fingerprint):
+                        return cached_index['zip_codes'], cached_index['latitudes'], cached_index['longitudes']
+            except (OSError, ValueError, KeyError, zipfile.BadZipFile) as error: # unreadable or half-written caches are simply rebuilt
+                pass
+        zip_codes, latitudes, longitudes = self.build_index()
+        if self.cache_path is None: # building it only takes a fraction of a second, nothing is written
+            return zip_codes, latitudes, longitudes
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        # each process writes its own temporary file, so workers building the index at the same time never mix their writes
+        temporary_path = '{}.{}.tmp'.format(self.cache_path, os.getpid())
+        with open(temporary_path, 'wb') as cache_file: # file object so numpy doesn't append its own extension
+            np.savez(cache_file, fingerprint=table_fingerprint, zip_codes=zip_codes, latitudes=latitudes, longitudes=longitudes)
+        os.replace(temporary_path, self.cache_path) # written aside and then moved, so a half-written index is never read
+        return zip_codes, latitudes, longitudes
+
+    def build_index(self) -> tuple:
+        """Reads the GeoNames table and averages the coordinates of zip codes listed more than once
+
+        Returns:
+            tuple: sorted zip codes, latitude and longitude of each one
+        """
+        # GeoNames layout: postal code is the 2nd column, latitude and longitude the 10th and 11th
+        zip_table = pd.read_csv(self.table_path, sep='\t', header=None, usecols=[1, 9, 10], dtype={1: str})
+        zip_table.columns = ['zip', 'latitude', 'longitude']
+        zip_table['zip'] = pd.to_numeric(zip_table['zip'], errors='coerce')
+        zip_table.dropna(how='any', inplace=True)
+        zip_centroids = zip_table.groupby('zip')[['latitude', 'longitude']].mean() # groupby also sorts the zip codes
+        return (zip_centroids.index.to_numpy(dtype=np.int32),
+                zip_centroids['latitude'].to_numpy(dtype=np.float32),
+                zip_centroids['longitude'].to_numpy(dtype=np.float32))
+
+    def query(self, zip_codes: pd.Series) -> tuple:
+        """Approximates the coordinates of each zip code, looking up every distinct zip code only once
+
+        Args:
+            zip_codes (pd.Series): zip codes as text or numbers, e.g. '10001', '10001.0' or 10001
+
+        Returns:
+            tuple: latitude and longitude arrays aligned with zip_codes, NaN where the zip code is invalid or unknown
+        """
+        row_codes, distinct_zips = pd.factorize(zip_codes)
+        distinct_zips = pd.to_numeric(pd.Series(distinct_zips), errors='coerce').to_numpy(dtype=np.float64)
+        valid = np.isfinite(distinct_zips)
+        positions = np.searchsorted(self.zip_codes, np.where(valid, distinct_zips, 0).astype(np.int64))
+        positions = np.minimum(positions, len(self.zip_codes) - 1)
+        found = valid & (self.zip_codes[positions] == distinct_zips)
+        # one extra NaN slot at the end, taken by rows with a missing zip code (code -1)
+        distinct_latitudes = np.append(np.where(found, self.latitudes[positions], np.nan), np.nan)
+        distinct_longitudes = np.append(np.where(found, self.longitudes[positions], np.nan), np.nan)
+        return distinct_latitudes.take(row_codes), distinct_longitudes.take(row_codes)
@@ -0,0 +1,132 @@
+# Module that merges a delta of new or updated collisions into the stored data, updating the collision cube with the delta only
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+from instrumentation import trace_class
+from data_cleansing.data_loader import collision_data, InMemoryDataSource, SOURCE_DTYPES
+from data_cleansing.collision_schema import encode_table
+from data_cleansing.collision_cube import CollisionCube, CUBE_COLUMNS, CUBE_PATH
+
+DELTA_SOURCES = ['crashes', 'vehicles'] # sources a delta can change - the ones the cube is counted from
+REWRITE_CHUNK_SIZE = 500_000 # rows copied at a time when an updated collision has to be removed from a stored csv
+
+
+@trace_class
+class CollisionDeltaIngest:
+    """Class responsible for applying a delta of the published data: every COLLISION_ID in a delta csv is either new
+    or replaces the stored version of that collision - for vehicles, all the stored vehicles of the collision
+
+    The collision cube is updated by retracting the stored version of the changed collisions and adding the new one,
+    the csv files get the delta merged in and the parsed columns in the column store are updated the same way, so nothing
+    has to be parsed or counted again from the whole data
+    """
+    def __init__(self, delta_paths: dict, data_source=collision_data, cube_path: str = CUBE_PATH):
+        self.data_source = data_source # loader of the stored data
+        self.cube_path = cube_path
+        self.raw_deltas = {} # delta rows as written in the csv, to be stored as they are
+        self.deltas = {} # delta rows parsed and encoded the same way the loader does
+        for source, delta_path in delta_paths.items():
+            raw_delta = pd.read_csv(delta_path, dtype=str, keep_default_na=False)
+            column_dtypes = {column: dtype for column, dtype in SOURCE_DTYPES[source].items() if column in raw_delta.columns}
+            delta = encode_table(source, pd.read_csv(delta_path, dtype=column_dtypes))
+            if source == 'crashes': # a collision published twice in the same delta counts only with its last version
+                last_versions = ~delta['COLLISION_ID'].duplicated(keep='last').to_numpy()
+                raw_delta, delta = raw_delta[last_versions], delta[last_versions]
+            self.raw_deltas[source] = raw_delta.reset_index(drop=True)
+            self.deltas[source] = delta.reset_index(drop=True)
+
+    def changed_rows(self, stored_tables: dict) -> tuple:
+        """Separates the stored version and the new version of every changed collision
+
+        Args:
+            stored_tables (dict): columns the cube is counted from, of each source as stored
+
+        Returns:
+            tuple: old rows and new rows of each source
+        """
+        changed_ids = np.unique(np.concatenate([delta['COLLISION_ID'].to_numpy() for delta in self.deltas.values()]))
+        old_rows, new_rows = {}, {}
+        for source in DELTA_SOURCES:
+            stored = stored_tables[source]
+            old_rows[source] = stored[stored['COLLISION_ID'].isin(changed_ids)]
+            if source not in self.deltas: # e.g. vehicles of a crash whose borough changed: same rows, counted in the new borough
+                new_rows[source] = old_rows[source]
+                continue
+            delta = self.deltas[source]
+            unchanged = old_rows[source][~old_rows[source]['COLLISION_ID'].isin(delta['COLLISION_ID'])]
+            new_rows[source] = pd.concat([unchanged, delta[CUBE_COLUMNS[source]]], ignore_index=True)
+        return old_rows, new_rows
+
+    def merge_into_source(self, source: str, stored_ids: pd.Series) -> dict:
+        """Merges the delta of a source into its csv and into the parsed columns in the column store
+
+        New collisions are appended to the csv; the csv is only copied when stored collisions have to be replaced
+
+        Args:
+            source (str): name of the data source
+            stored_ids (pd.Series): COLLISION_ID of every stored row, in the order of the csv
+
+        Returns:
+            dict: number of delta rows and of stored rows they replaced
+        """
+        source_path = self.data_source.source_path(source)
+        delta_ids = self.deltas[source]['COLLISION_ID']
+        replaced = stored_ids.isin(delta_ids).to_numpy()
+        column_store = getattr(self.data_source, 'column_store', None)
+        cached_columns = column_store.read(source, [source_path]) if column_store is not None else None # read before the csv changes
+        header = pd.read_csv(source_path, nrows=0).columns
+        raw_delta = self.raw_deltas[source].reindex(columns=header, fill_value='') # columns in the order of the stored csv
+        if replaced.any():
+            with open(source_path + '.tmp', 'w', newline='') as merged_file:
+                for index, chunk in enumerate(pd.read_csv(source_path, dtype=str, keep_default_na=False, chunksize=REWRITE_CHUNK_SIZE)):
+                    kept_rows = chunk[~chunk['COLLISION_ID'].astype(np.int64).isin(delta_ids)]
+                    kept_rows.to_csv(merged_file, header=index == 0, index=False)
+                raw_delta.to_csv(merged_file, header=False, index=False)
+            os.replace(source_path + '.tmp', source_path)
+        else:
+            with open(source_path, 'rb+') as source_file: # a last line without line break would be joined with the first new row
+                source_file.seek(-1, os.SEEK_END)
+                if source_file.read(1) != b'\n':
+                    source_file.write(b'\n')
+            raw_delta.to_csv(source_path, mode='a', header=False, index=False)
+        if cached_columns is not None and len(cached_columns) == len(stored_ids):
+            # same rows as the new csv, in the same order: stored rows that were kept, then the delta
+            merged_columns = pd.concat([cached_columns[~replaced], self.deltas[source][cached_columns.columns]], ignore_index=True)
+            column_store.write(source, [source_path], encode_table(source, merged_columns))
+        self.data_source.tables.pop(source, None) # loaded columns are stale, the next analysis reads them again
+        if source == 'crashes':
+            self.data_source.crash_index = None # rows moved, the index is built again from the merged crashes
+        return {'delta_rows': len(raw_delta), 'replaced_rows': int(replaced.sum())}
+
+    def apply(self) -> dict:
+        """Applies the delta to the collision cube and to the stored data
+
+        Returns:
+            dict: rows merged into each source
+        """
+        try:
+            cube = CollisionCube(self.data_source, self.cube_path) # counted from the data as stored before the delta
+            stored_tables = {source: self.data_source.get_table(source, CUBE_COLUMNS[source]) for source in DELTA_SOURCES}
+            old_rows, new_rows = self.changed_rows(stored_tables)
+            # only the changed collisions are counted: their stored version is retracted and the new one added
+            has_old_rows = any(len(rows) > 0 for rows in old_rows.values())
+            cube.apply_delta(InMemoryDataSource(old_rows) if has_old_rows else None, InMemoryDataSource(new_rows))
+            merged_rows = {source: self.merge_into_source(source, stored_tables[source]['COLLISION_ID']) for source in self.deltas}
+            cube.save_cube() # fingerprinted with the merged csv files, so it isn't rebuilt on the next run
+            return merged_rows
+        except KeyError as error:
+            return 'Dataframe passed has inconsistent/unaccounted keys'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Merges a delta of new or updated collisions into the stored data and the collision cube')
+    parser.add_argument('--crashes', default=None, help='csv with new or updated crashes, same columns as the crashes csv')
+    parser.add_argument('--vehicles', default=None, help='csv with every vehicle of new or updated collisions, same columns as the vehicles csv')
+    arguments = parser.parse_args()
+
+    delta_paths = {source: path for source, path in [('crashes', arguments.crashes), ('vehicles', arguments.vehicles)] if path is not None}
+    if not delta_paths:
+        parser.error('pass at least one of --crashes and --vehicles')
+    print(CollisionDeltaIngest(delta_paths).apply())
@@ -0,0 +1,206 @@
+# Module that records, when asked to, how long each data class and analysis step takes, how many rows it handles and how much memory it uses
+import os
+import time
+import json
+import atexit
+import inspect
+import functools
+import tracemalloc
+import multiprocessing
+import pandas as pd
+import numpy as np
+try:
+    import resource # not available on windows, peak RSS is then left empty
+except ImportError:
+    resource = None
+
+TRACE_ENVIRONMENT_VARIABLE = 'COLLISION_TRACE' # path of the trace file, tracing is enabled at import when set
+TRACE_MEMORY_ENVIRONMENT_VARIABLE = 'COLLISION_TRACE_MEMORY' # set to 1 to also trace allocations (slower)
+
+
+class StageTracer:
+    """Class responsible for collecting one timed span per call of every traced constructor and method, saved in the
+    Chrome trace event format - opened as a flame chart by chrome://tracing, Perfetto or speedscope
+
+    While disabled, a traced call costs a single attribute check
+    """
+    def __init__(self):
+        self.enabled = False
+        self.trace_memory = False # tracemalloc gives allocated bytes per span but slows every allocation down
+        self.trace_path = None
+        self.events = [] # finished spans, as trace events
+        self.open_spans = [] # memory bookkeeping of the spans still running, innermost last
+
+    def enable(self, trace_path: str = None, trace_memory: bool = False):
+        """Starts recording spans
+
+        Args:
+            trace_path (str, optional): file the trace is written to by write()
+            trace_memory (bool, optional): whether allocated bytes are recorded too
+        """
+        self.enabled = True
+        self.trace_path = trace_path
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self):
+        """Stops recording spans, the ones already recorded are kept
+        """
+        self.enabled = False
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.trace_memory = False
+
+    def count_rows(self, values) -> int:
+        """Sums the rows of every table among some values
+
+        Args:
+            values (iterable): arguments, attributes or results of a call
+
+        Returns:
+            int: total rows of the dataframes, series, categoricals and arrays found
+        """
+        return sum(len(value) for value in values if isinstance(value, (pd.DataFrame, pd.Series, pd.Categorical, np.ndarray)))
+
+    def start_memory_span(self):
+        """Opens the allocation bookkeeping of a span, keeping the peak of the enclosing span before resetting it
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        if self.open_spans:
+            self.open_spans[-1]['peak'] = max(self.open_spans[-1]['peak'], peak)
+        tracemalloc.reset_peak()
+        self.open_spans.append({'start': current, 'peak': current})
+
+    def end_memory_span(self) -> dict:
+        """Closes the allocation bookkeeping of the innermost span
+
+        Returns:
+            dict: bytes still allocated at the end of the span and highest extra bytes reached during it
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        span = self.open_spans.pop()
+        span['peak'] = max(span['peak'], peak)
+        if self.open_spans: # the enclosing span went at least as high
+            self.open_spans[-1]['peak'] = max(self.open_spans[-1]['peak'], span['peak'])
+        tracemalloc.reset_peak()
+        return {'allocated_bytes': current - span['start'], 'peak_allocated_bytes': span['peak'] - span['start']}
+
+    def record(self, name: str, function, args: tuple, kwargs: dict):
+        """Runs a traced call and stores its span
+
+        Args:
+            name (str): name of the span, e.g. 'CrashLocationData.__init__'
+            function (callable): the original constructor or method
+            args (tuple): positional arguments, the instance first
+            kwargs (dict): keyword arguments
+
+        Returns:
+            whatever function returns
+        """
+        instance = args[0] if args else None
+        instance_attributes = list(vars(instance).values()) if hasattr(instance, '__dict__') else []
+        span_arguments = {'rows_in': self.count_rows(list(args[1:]) + list(kwargs.values()) + instance_attributes)}
+        if self.trace_memory:
+            self.start_memory_span()
+        start_timestamp = time.time_ns() // 1000
+        start = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        except BaseException as error:
+            span_arguments['error'] = type(error).__name__
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            if self.trace_memory:
+                span_arguments.update(self.end_memory_span())
+            if resource is not None: # high-water mark of the whole process at the end of the span
+                span_arguments['peak_rss_bytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+            if 'error' not in span_arguments:
+                if name.endswith('.__init__'): # constructors produce their tables as attributes
+                    span_arguments['rows_out'] = self.count_rows(vars(instance).values())
+                else:
+                    span_arguments['rows_out'] = self.count_rows(result if isinstance(result, tuple) else [result])
+            self.events.append({'name': name, 'cat': function.__module__, 'ph': 'X', 'ts': start_timestamp,
+                                'dur': duration * 10 ** 6, 'pid': os.getpid(), 'tid': 0, 'args': span_arguments})
+        return result
+
+    def collect(self) -> list:
+        """Hands over the spans recorded so far, e.g. to send them from a worker process to the main one
+
+        Returns:
+            list: trace events, removed from the tracer
+        """
+        events, self.events = self.events, []
+        return events
+
+    def add_events(self, events: list):
+        """Adds spans recorded by another process
+
+        Args:
+            events (list): trace events from collect()
+        """
+        self.events.extend(events)
+
+    def write(self, trace_path: str = None):
+        """Saves every span recorded in the Chrome trace event format
+
+        Args:
+            trace_path (str, optional): destination file, the path given to enable() if None
+        """
+        trace_path = trace_path or self.trace_path
+        if trace_path is None or not self.events:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(trace_path)), exist_ok=True)
+        with open(trace_path, 'w') as trace_file:
+            json.dump({'traceEvents': sorted(self.events, key=lambda event: event['ts']), 'displayTimeUnit': 'ms'}, trace_file)
+
+
+tracer = StageTracer() # shared by every traced class of the process
+
+
+def traced(function, name: str = None):
+    """Wraps a function so each call becomes a span while tracing is enabled
+
+    Args:
+        function (callable): function or method to be traced
+        name (str, optional): name of the spans, the qualified name of the function if None
+
+    Returns:
+        callable: wrapped function
+    """
+    name = name or function.__qualname__
+    @functools.wraps(function)
+    def traced_function(*args, **kwargs):
+        if not tracer.enabled:
+            return function(*args, **kwargs)
+        return tracer.record(name, function, args, kwargs)
+    return traced_function
+
+
+def trace_class(traced_class: type = None, skip: tuple = ()):
+    """Class decorator that traces the constructor and every public method defined by the class - generators,
+    static and class methods are left as they are. Used as @trace_class, or as @trace_class(skip=[...]) to leave
+    out small helpers that would only clutter the trace
+
+    Args:
+        traced_class (type, optional): class to be traced
+        skip (tuple, optional): names of the methods that are not traced
+
+    Returns:
+        type: the same class, with its methods wrapped
+    """
+    if traced_class is None: # called with arguments, the class comes in the next call
+        return functools.partial(trace_class, skip=skip)
+    for attribute_name, attribute in list(vars(traced_class).items()):
+        if not inspect.isfunction(attribute) or inspect.isgeneratorfunction(attribute) or attribute_name in skip:
+            continue
+        if attribute_name == '__init__' or not attribute_name.startswith('_'):
+            setattr(traced_class, attribute_name, traced(attribute))
+    return traced_class
+
+
+if os.environ.get(TRACE_ENVIRONMENT_VARIABLE):
+    tracer.enable(os.environ[TRACE_ENVIRONMENT_VARIABLE], os.environ.get(TRACE_MEMORY_ENVIRONMENT_VARIABLE) == '1')
+    if multiprocessing.parent_process() is None: # worker processes send their spans to the main one instead
+        atexit.register(tracer.write)
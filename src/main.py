@@ -1,24 +1,70 @@
+import argparse
+
 from visualizations.crash_by_period_vis import CrashByPeriodTrends 
 from visualizations.cyc_ped__accidents_vis  import PedestriansAccidentsGraphs
 from visualizations.cyc_ped__accidents_vis  import PedestriansAccidents
 from visualizations.liscense_status_vis  import LiscenseStatusTrends
 from visualizations.position_lethality_vis import CarSeatDangers
 from visualizations.seasonal_alcohol  import SeasonalAlcoholColissions
+from pipeline_runner import run_parallel
+from data_cleansing.collision_cube import CollisionCube
+from data_cleansing.collision_query import CollisionIndex
+from data_cleansing.collision_schema import BOROUGHS
+from data_cleansing.data_loader import collision_data
+from data_cleansing.query_backends import QUERY_BACKENDS
+from instrumentation import tracer
+from visualizations.rendering import figure_renderer, FIGURE_FORMATS
 
-crash_period_trends = CrashByPeriodTrends()
-ped_accidents_plots = PedestriansAccidentsGraphs()
-ped_accidents_map = PedestriansAccidents()
-license_status_trends = LiscenseStatusTrends()
-car_seat_danger = CarSeatDangers()
-seasonal_alcohol = SeasonalAlcoholColissions()
+if __name__ == '__main__': # worker processes of the parallel mode import this module too, they must not run the pipeline
+    parser = argparse.ArgumentParser(description='Produces the visualizations of all five hypotheses')
+    parser.add_argument('--parallel', action='store_true', help='run the analyses on a pool of processes')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes used with --parallel, one per core by default')
+    parser.add_argument('--output-dir', default=None, help='write every figure to this folder instead of showing it - no display needed')
+    parser.add_argument('--formats', nargs='+', default=FIGURE_FORMATS, help='image formats of the figures written with --output-dir')
+    parser.add_argument('--trace', default=None, help='write a trace of every data class and analysis step to this json file')
+    parser.add_argument('--trace-memory', action='store_true', help='also record the memory allocated by each traced step (slower)')
+    parser.add_argument('--use-cube', action='store_true', help='answer the period, street, license and seasonal analyses from the pre-aggregated collision cube')
+    parser.add_argument('--start', default=None, help='only use collisions from this day on, e.g. 2021-01-01')
+    parser.add_argument('--end', default=None, help='only use collisions before this day, e.g. 2022-01-01')
+    parser.add_argument('--boroughs', nargs='+', default=None, help='only use collisions in these boroughs, e.g. BROOKLYN QUEENS')
+    parser.add_argument('--backend', choices=list(QUERY_BACKENDS), default='pandas', help='engine the data is read and filtered with - duckdb and polars use every core')
+    arguments = parser.parse_args()
+    query = None # every collision is used unless a window or boroughs are given
+    if arguments.start or arguments.end or arguments.boroughs:
+        boroughs = [borough.upper().strip() for borough in arguments.boroughs] if arguments.boroughs else None
+        unknown_boroughs = [borough for borough in boroughs or [] if borough not in BOROUGHS]
+        if unknown_boroughs: # checked before anything is read, an unknown borough would only produce empty figures
+            parser.error('unknown boroughs: {} - choose from {}'.format(', '.join(unknown_boroughs), ', '.join(BOROUGHS)))
+        query = {'start': arguments.start, 'end': arguments.end, 'boroughs': boroughs}
+        if arguments.use_cube:
+            parser.error('the collision cube holds all the data, --use-cube cannot be combined with --start, --end or --boroughs')
+    if arguments.trace:
+        tracer.enable(arguments.trace, arguments.trace_memory)
+    if QUERY_BACKENDS[arguments.backend] is not None:
+        # in parallel mode only the main process reads with the engine, the workers share the tables it read
+        collision_data.use_backend(QUERY_BACKENDS[arguments.backend]())
 
-crash_period_trends.crash_by_period_plot()
-ped_accidents_plots.accidents_graphs_plot()
-ped_accidents_map.plot_accidents()
-license_status_trends.pie_chart_borough_collision_composition()
-license_status_trends.pie_chart_borough_license_composition()
-license_status_trends.scatter_plot()
-car_seat_danger.show_graph()
-seasonal_alcohol.graph_plotting()
+    if arguments.parallel:
+        run_parallel(workers=arguments.workers, output_dir=arguments.output_dir, formats=arguments.formats, use_cube=arguments.use_cube, query=query)
+    else:
+        figure_renderer.configure(arguments.output_dir, arguments.formats)
+        cube = CollisionCube() if arguments.use_cube else None # None makes the analyses read the rows
+        data_source = CollisionIndex().query(**query) if query is not None else collision_data
+        crash_period_trends = CrashByPeriodTrends(data_source=data_source, cube=cube)
+        ped_accidents_map = PedestriansAccidents(data_source)
+        ped_accidents_plots = PedestriansAccidentsGraphs(data_source, cube=cube, accidents=ped_accidents_map) # one filtering for the map and the graphs
+        license_status_trends = LiscenseStatusTrends(data_source, cube=cube)
+        car_seat_danger = CarSeatDangers(data_source)
+        seasonal_alcohol = SeasonalAlcoholColissions(data_source, cube=cube)
 
+        crash_period_trends.crash_by_period_plot()
+        ped_accidents_plots.accidents_graphs_plot()
+        ped_accidents_plots.hotspots_graphs_plot()
+        ped_accidents_map.plot_accidents()
+        license_status_trends.pie_chart_borough_collision_composition()
+        license_status_trends.pie_chart_borough_license_composition()
+        license_status_trends.scatter_plot()
+        car_seat_danger.show_graph()
+        seasonal_alcohol.graph_plotting()
 
+    tracer.write() # does nothing unless tracing was enabled
@@ -0,0 +1,333 @@
+# Module that downloads the three collision datasets from the NYC Open Data API, page by page and several pages at a time
+import argparse
+import asyncio
+import gzip
+import http.client
+import io
+import json
+import os
+import random
+import urllib.parse
+
+import pandas as pd
+
+from instrumentation import trace_class
+from data_cleansing.data_loader import collision_data, SOURCE_FILES
+
+OPEN_DATA_URL = 'https://data.cityofnewyork.us' # Socrata portal of NYC Open Data
+DATASET_IDS = {'crashes': 'h9gi-nx95', 'vehicles': 'bm4k-52h4', 'person': 'f55k-p6yu'} # id of each data source in the portal
+PAGE_SIZE = 50_000 # rows of each request
+CONCURRENCY = 4 # requests in flight, and pages held in memory, for each data source at most
+MAX_ATTEMPTS = 5 # tries of each request before the download stops - it resumes from its checkpoint on the next run
+BACKOFF_SECONDS = 1.0 # wait before the first retry, doubled at every attempt
+RETRY_STATUSES = {429, 500, 502, 503, 504} # throttled or temporarily unavailable, worth trying again
+REQUEST_TIMEOUT = 120 # seconds without an answer before a request is considered failed
+
+
+def field_header(source: str, field: str) -> str:
+    """Name the csv export gives to a field of the API, e.g. crash_date -> CRASH DATE for crashes and CRASH_DATE for the others
+
+    Args:
+        source (str): name of the data source
+        field (str): name of the field in the API
+
+    Returns:
+        str: column of the csv the loader reads
+    """
+    if source == 'crashes' and field != 'collision_id': # the crashes export only keeps the underscore of COLLISION_ID
+        return field.upper().replace('_', ' ')
+    return field.upper()
+
+
+def export_dates(values: pd.Series) -> pd.Series:
+    """Rewrites the timestamps of the API (2021-09-11T00:00:00.000) as the dates of the csv export (09/11/2021)
+
+    Args:
+        values (pd.Series): text values of a date field, '' when missing
+
+    Returns:
+        pd.Series: dates as written in the csv files, other values untouched
+    """
+    timestamps = values.str.match(r'^\d{4}-\d{2}-\d{2}T')
+    return values.where(~timestamps, values.str[5:7] + '/' + values.str[8:10] + '/' + values.str[0:4])
+
+
+class ConnectionPool:
+    """Pool of persistent HTTP connections to the API, each used by one request at a time - requests run in threads,
+    so the event loop keeps scheduling the others while one waits for the network
+    """
+    def __init__(self, base_url: str, size: int, app_token: str = None):
+        url = urllib.parse.urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        self.connections = asyncio.Queue()
+        for _ in range(size):
+            self.connections.put_nowait(connection_class(url.hostname, url.port, timeout=REQUEST_TIMEOUT))
+        self.headers = {'Accept-Encoding': 'gzip'} # pages of csv compress several times over
+        if app_token:
+            self.headers['X-App-Token'] = app_token # requests with a token are throttled much less
+
+    def request(self, connection: http.client.HTTPConnection, path: str) -> tuple:
+        """Sends a GET request on a connection and reads its whole answer, so the connection can be reused
+
+        Args:
+            connection (http.client.HTTPConnection): connection of the pool
+            path (str): path and query of the request
+
+        Returns:
+            tuple: status, headers and body of the answer
+        """
+        connection.request('GET', path, headers=self.headers)
+        response = connection.getresponse()
+        body = response.read()
+        if response.getheader('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        return response.status, response, body
+
+    async def get(self, path: str) -> tuple:
+        """Sends a GET request on the first free connection
+
+        Args:
+            path (str): path and query of the request
+
+        Returns:
+            tuple: status, headers and body of the answer
+        """
+        connection = await self.connections.get()
+        try:
+            return await asyncio.to_thread(self.request, connection, path)
+        except (OSError, http.client.HTTPException):
+            connection.close() # reconnects on its next request
+            raise
+        finally:
+            self.connections.put_nowait(connection)
+
+    def close(self):
+        """Closes every connection of the pool
+        """
+        while not self.connections.empty():
+            self.connections.get_nowait().close()
+
+
+@trace_class(skip=['ingest_all', 'ingest_source', 'fetch', 'fetch_page'])
+class OpenDataIngest:
+    """Class responsible for downloading the collision datasets from the paginated API of the portal into the csv files
+    the loader reads, with the columns and dates of the csv export
+
+    Pages are requested several at a time over a pool of connections and appended in order, so memory holds a few pages
+    at most. A checkpoint next to each file records the pages already written, and a download that stops is resumed
+    from there. The downloaded file only replaces the stored csv once it is complete
+    """
+    def __init__(self, sources: list = None, data_source=collision_data, base_url: str = OPEN_DATA_URL,
+                 page_size: int = PAGE_SIZE, concurrency: int = CONCURRENCY, app_token: str = None,
+                 backoff_seconds: float = BACKOFF_SECONDS):
+        self.sources = list(SOURCE_FILES) if sources is None else sources
+        self.data_source = data_source # loader whose csv files are written
+        self.base_url = base_url
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.app_token = app_token
+        self.backoff_seconds = backoff_seconds
+
+    def download_paths(self, source: str) -> tuple:
+        """Paths of the csv being downloaded and of its checkpoint
+
+        Args:
+            source (str): name of the data source
+
+        Returns:
+            tuple: partial csv path and checkpoint path, next to the csv of the data source
+        """
+        source_path = self.data_source.source_path(source)
+        return source_path + '.part', source_path + '.checkpoint.json'
+
+    def read_checkpoint(self, source: str) -> dict:
+        """Collects the progress of an interrupted download of a data source, if it used the same pages
+
+        Args:
+            source (str): name of the data source
+
+        Returns:
+            dict: dataset, page size, rows to download, pages and bytes written and header of the csv, None to start over
+        """
+        part_path, checkpoint_path = self.download_paths(source)
+        if not os.path.exists(checkpoint_path) or not os.path.exists(part_path):
+            return None
+        with open(checkpoint_path) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        if checkpoint['dataset'] != DATASET_IDS[source] or checkpoint['page_size'] != self.page_size:
+            return None
+        return checkpoint
+
+    def write_checkpoint(self, source: str, checkpoint: dict):
+        """Saves the progress of the download of a data source
+
+        Args:
+            source (str): name of the data source
+            checkpoint (dict): progress of the download
+        """
+        _, checkpoint_path = self.download_paths(source)
+        with open(checkpoint_path + '.tmp', 'w') as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file)
+        os.replace(checkpoint_path + '.tmp', checkpoint_path)
+
+    async def fetch(self, pool: ConnectionPool, path: str) -> bytes:
+        """Requests a path, trying again with exponential backoff while the API is throttling or unavailable
+
+        Args:
+            pool (ConnectionPool): connections to the API
+            path (str): path and query of the request
+
+        Returns:
+            bytes: body of the answer
+        """
+        wait = 0
+        for attempt in range(MAX_ATTEMPTS):
+            # jitter spreads the retries, so requests that failed together don't retry together
+            await asyncio.sleep(wait * (1 + random.random() / 2))
+            wait = self.backoff_seconds * 2 ** attempt # doubled at every attempt
+            try:
+                status, response, body = await pool.get(path)
+            except (OSError, http.client.HTTPException) as error: # dropped connection or timeout
+                failure = error
+                continue
+            if status == 200:
+                return body
+            failure = ConnectionError(f'{path} answered with status {status}')
+            if status not in RETRY_STATUSES:
+                break
+            retry_after = response.getheader('Retry-After')
+            if retry_after and retry_after.isdigit(): # the API said how long to wait
+                wait = float(retry_after)
+        raise failure
+
+    async def fetch_page(self, pool: ConnectionPool, source: str, page: int) -> pd.DataFrame:
+        """Downloads a page of a data source and turns it into rows of the csv export
+
+        Args:
+            pool (ConnectionPool): connections to the API
+            source (str): name of the data source
+            page (int): position of the page
+
+        Returns:
+            pd.DataFrame: text of every field of the rows of the page, '' when missing
+        """
+        # ordered by the row id of the portal, so every page always holds the same rows
+        query = urllib.parse.urlencode({'$limit': self.page_size, '$offset': page * self.page_size, '$order': ':id'})
+        body = await self.fetch(pool, f'/resource/{DATASET_IDS[source]}.csv?{query}')
+        return await asyncio.to_thread(self.export_rows, source, body)
+
+    def export_rows(self, source: str, body: bytes) -> pd.DataFrame:
+        """Renames the fields of a page of the API as the columns of the csv export and rewrites its dates
+
+        Args:
+            source (str): name of the data source
+            body (bytes): csv answered by the API
+
+        Returns:
+            pd.DataFrame: rows with the columns and dates of the csv export
+        """
+        rows = pd.read_csv(io.BytesIO(body), dtype=str, keep_default_na=False)
+        rows = rows[[field for field in rows.columns if not field.startswith(':')]] # fields computed by the portal aren't exported
+        rows.columns = [field_header(source, field) for field in rows.columns]
+        for column in rows.columns:
+            if column.endswith('DATE'):
+                rows[column] = export_dates(rows[column])
+        return rows
+
+    def append_page(self, source: str, rows: pd.DataFrame, checkpoint: dict):
+        """Appends a page to the partial csv and records it in the checkpoint
+
+        Args:
+            source (str): name of the data source
+            rows (pd.DataFrame): rows of the page
+            checkpoint (dict): progress of the download, updated
+        """
+        part_path, _ = self.download_paths(source)
+        if checkpoint['header'] is None:
+            checkpoint['header'] = list(rows.columns) # every page is written with the columns of the first one
+        page_text = rows.reindex(columns=checkpoint['header'], fill_value='').to_csv(header=checkpoint['pages_written'] == 0, index=False)
+        with open(part_path, 'ab') as part_file: # binary, so the position recorded is a byte count
+            part_file.write(page_text.encode('utf-8'))
+            checkpoint['bytes_written'] = part_file.tell()
+        checkpoint['pages_written'] += 1
+        self.write_checkpoint(source, checkpoint)
+
+    async def ingest_source(self, pool: ConnectionPool, source: str) -> int:
+        """Downloads every page of a data source not downloaded yet, keeping at most `concurrency` pages requested or
+        waiting to be written
+
+        Args:
+            pool (ConnectionPool): connections to the API
+            source (str): name of the data source
+
+        Returns:
+            int: rows of the data source
+        """
+        part_path, checkpoint_path = self.download_paths(source)
+        checkpoint = self.read_checkpoint(source)
+        if checkpoint is None:
+            count_query = urllib.parse.urlencode({'$select': 'count(*) AS row_count'})
+            count_body = await self.fetch(pool, f'/resource/{DATASET_IDS[source]}.json?{count_query}')
+            row_count = int(json.loads(count_body)[0]['row_count'])
+            checkpoint = {'dataset': DATASET_IDS[source], 'page_size': self.page_size, 'row_count': row_count,
+                          'pages_written': 0, 'bytes_written': 0, 'header': None}
+            open(part_path, 'w').close()
+            self.write_checkpoint(source, checkpoint)
+        with open(part_path, 'r+b') as part_file: # a page written after the last checkpoint is written again
+            part_file.truncate(checkpoint['bytes_written'])
+        page_count = -(-checkpoint['row_count'] // self.page_size)
+        next_page = checkpoint['pages_written'] # next page to be requested
+        requested = {} # pages requested, by position, written as soon as every page before them is
+        try:
+            while checkpoint['pages_written'] < page_count:
+                while next_page < page_count and len(requested) < self.concurrency:
+                    requested[next_page] = asyncio.create_task(self.fetch_page(pool, source, next_page))
+                    next_page += 1
+                rows = await requested.pop(checkpoint['pages_written'])
+                await asyncio.to_thread(self.append_page, source, rows, checkpoint)
+        finally:
+            for task in requested.values(): # a failed page stops the download, later pages are requested again on resume
+                task.cancel()
+        os.replace(part_path, self.data_source.source_path(source)) # the stored csv is only replaced by a complete download
+        os.remove(checkpoint_path)
+        return checkpoint['row_count']
+
+    async def ingest_all(self) -> dict:
+        """Downloads every data source at the same time, sharing one pool of connections
+
+        Returns:
+            dict: rows of each data source
+        """
+        pool = ConnectionPool(self.base_url, self.concurrency, self.app_token)
+        try:
+            row_counts = await asyncio.gather(*[self.ingest_source(pool, source) for source in self.sources])
+            return dict(zip(self.sources, row_counts))
+        finally:
+            pool.close()
+
+    def run(self) -> dict:
+        """Downloads the data sources, resuming any download that was interrupted
+
+        Returns:
+            dict: rows of each data source
+        """
+        try:
+            os.makedirs(self.data_source.data_directory, exist_ok=True)
+            return asyncio.run(self.ingest_all())
+        except (OSError, http.client.HTTPException) as error: # checkpoints are kept, running again resumes the download
+            return 'Open data API could not be reached, run again to resume the download: ' + str(error)
+        except (KeyError, ValueError) as error:
+            return 'Open data API answered with inconsistent/unaccounted data'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Downloads the Crashes, Vehicles and Person datasets from NYC Open Data into the data folder')
+    parser.add_argument('--sources', nargs='+', choices=list(SOURCE_FILES), default=list(SOURCE_FILES), help='data sources downloaded')
+    parser.add_argument('--base-url', default=OPEN_DATA_URL, help='portal the datasets are downloaded from')
+    parser.add_argument('--page-size', type=int, default=PAGE_SIZE, help='rows of each request')
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY, help='requests in flight for each data source')
+    parser.add_argument('--app-token', default=os.environ.get('SOCRATA_APP_TOKEN'), help='Socrata app token, so the portal throttles the download less')
+    arguments = parser.parse_args()
+
+    print(OpenDataIngest(arguments.sources, base_url=arguments.base_url, page_size=arguments.page_size,
+                         concurrency=arguments.concurrency, app_token=arguments.app_token).run())
@@ -0,0 +1,209 @@
+# Module that runs the independent analyses on a pool of processes, sharing the loaded columns through the column store or shared memory
+import importlib
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import tracer
+from data_cleansing.data_loader import collision_data
+from data_cleansing.collision_cube import CollisionCube
+from data_cleansing.collision_query import CollisionIndex
+from visualizations.rendering import figure_renderer, FIGURE_FORMATS
+
+# module, class and plotting methods of each analysis, and the data sources it reads
+ANALYSES = {
+    'crash_by_period': ('visualizations.crash_by_period_vis', 'CrashByPeriodTrends', ['crash_by_period_plot'], ['crashes']),
+    'pedestrian_accidents_graphs': ('visualizations.cyc_ped__accidents_vis', 'PedestriansAccidentsGraphs', ['accidents_graphs_plot'], ['crashes']),
+    'pedestrian_hotspots': ('visualizations.cyc_ped__accidents_vis', 'PedestriansAccidentsGraphs', ['hotspots_graphs_plot'], ['crashes']),
+    'pedestrian_accidents_map': ('visualizations.cyc_ped__accidents_vis', 'PedestriansAccidents', ['plot_accidents'], ['crashes']),
+    'liscense_status': ('visualizations.liscense_status_vis', 'LiscenseStatusTrends',
+                        ['pie_chart_borough_collision_composition', 'pie_chart_borough_license_composition', 'scatter_plot'], ['crashes', 'vehicles']),
+    'car_seat_dangers': ('visualizations.position_lethality_vis', 'CarSeatDangers', ['show_graph'], ['person']),
+    'seasonal_alcohol': ('visualizations.seasonal_alcohol', 'SeasonalAlcoholColissions', ['graph_plotting'], ['crashes']),
+}
+CUBE_ANALYSES = ['crash_by_period', 'pedestrian_accidents_graphs', 'liscense_status', 'seasonal_alcohol'] # analyses that can be answered by the collision cube
+
+attached_blocks = [] # shared memory blocks a worker is reading from, kept alive while the worker runs
+shared_tables_description = {} # description of the shared table of each data source, None for the ones mapped from the column store - set in every worker
+worker_cube = {} # collision cube of a worker, loaded from its file the first time an analysis needs it
+worker_query = {} # date window and boroughs the analyses of a worker are run for, and the index that selects them
+
+
+class SharedTables:
+    """Class responsible for copying loaded dataframes into shared memory blocks that worker processes can read
+    without receiving a pickled copy of the data
+    """
+    def __init__(self):
+        self.blocks = [] # every block created, so they can be released at the end
+
+    def share_array(self, array: np.ndarray) -> dict:
+        """Copies an array into a new shared memory block
+
+        Args:
+            array (np.ndarray): fixed width array to be shared
+
+        Returns:
+            dict: name of the block, dtype and length needed to read the array back
+        """
+        block = SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+        self.blocks.append(block)
+        return {'block': block.name, 'dtype': array.dtype.str, 'length': len(array)}
+
+    def share_table(self, data: pd.DataFrame) -> dict:
+        """Shares every column of a dataframe - categorical and text columns are shared as integer codes plus their distinct values
+
+        Args:
+            data (pd.DataFrame): dataframe with the loaded columns of a data source
+
+        Returns:
+            dict: description of each column, small enough to be sent to the workers
+        """
+        table_description = {}
+        for column in data.columns:
+            if isinstance(data[column].dtype, pd.CategoricalDtype): # already encoded by the collision schema, codes are shared as they are
+                table_description[column] = dict(self.share_array(data[column].cat.codes.to_numpy()), categories=data[column].cat.categories, categorical=True)
+            elif data[column].dtype == object:
+                codes, categories = pd.factorize(data[column])
+                table_description[column] = dict(self.share_array(codes.astype(np.int32)), categories=categories.to_numpy(dtype=object), categorical=False)
+            else:
+                table_description[column] = self.share_array(data[column].to_numpy())
+        return table_description
+
+    def release(self):
+        """Frees every shared memory block created
+        """
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+def attach_table(table_description: dict) -> pd.DataFrame:
+    """Builds a dataframe over columns shared by the main process, numeric columns are read straight from shared memory
+
+    Args:
+        table_description (dict): description produced by SharedTables.share_table
+
+    Returns:
+        pd.DataFrame: dataframe with the shared columns
+    """
+    columns = {}
+    for column, description in table_description.items():
+        block = SharedMemory(name=description['block']) # owned and released by the main process
+        attached_blocks.append(block)
+        values = np.ndarray((description['length'],), dtype=np.dtype(description['dtype']), buffer=block.buf)
+        if 'categories' in description:
+            # categorical and text columns alike are read through their codes, which stay in shared memory - text isn't
+            # turned back into python strings in every worker
+            values = pd.Categorical.from_codes(values, categories=description['categories'])
+        columns[column] = values
+    return pd.DataFrame(columns, copy=False)
+
+
+def set_shared_tables(tables_description: dict, output_dir: str = None, formats: list = FIGURE_FORMATS,
+                      trace: bool = False, trace_memory: bool = False, use_cube: bool = False, query: dict = None):
+    """Worker initializer: keeps the description of the shared tables, which are only attached when an analysis needs them,
+    and sets where the worker delivers its figures and whether it traces its work
+
+    Args:
+        tables_description (dict): description of the shared table of each data source, None if the worker maps it from the column store
+        output_dir (str, optional): folder the figures are written to, None to show them on screen
+        formats (list, optional): image formats each figure is saved in
+        trace (bool, optional): whether spans are recorded, they are sent back with the result of each analysis
+        trace_memory (bool, optional): whether spans record allocated bytes too
+        use_cube (bool, optional): whether the analyses in CUBE_ANALYSES are answered by the collision cube
+        query (dict, optional): start, end and boroughs arguments of CollisionIndex.query, None to run over all the data
+    """
+    shared_tables_description.update(tables_description)
+    worker_cube['enabled'] = use_cube
+    worker_query['window'] = query
+    figure_renderer.configure(output_dir, formats)
+    if trace:
+        tracer.enable(trace_memory=trace_memory)
+
+
+def run_analysis(name: str) -> tuple:
+    """Builds an analysis and runs all its plotting methods
+
+    Args:
+        name (str): key of the analysis in ANALYSES
+
+    Returns:
+        tuple: name of the analysis, seconds it took and the spans traced while it ran
+    """
+    start = time.perf_counter()
+    module_name, class_name, methods, sources = ANALYSES[name]
+    analysis_class = getattr(importlib.import_module(module_name), class_name)
+    if worker_cube.get('enabled') and name in CUBE_ANALYSES:
+        if 'cube' not in worker_cube:
+            worker_cube['cube'] = CollisionCube() # built by the main process already, so only read from its file
+        analysis = analysis_class(cube=worker_cube['cube'])
+    elif worker_query.get('window') is not None:
+        for source in sorted(set(sources) | {'crashes'}): # crashes place every row in the window
+            if source not in collision_data.tables and shared_tables_description[source] is not None:
+                collision_data.tables[source] = attach_table(shared_tables_description[source])
+        if 'index' not in worker_query:
+            worker_query['index'] = CollisionIndex() # built once per worker, every analysis after the first only selects slices
+        analysis = analysis_class(data_source=worker_query['index'].query(**worker_query['window']))
+    else:
+        for source in sources: # shared tables go into the worker's loader, so the analysis never reads the csv files
+            if source not in collision_data.tables and shared_tables_description[source] is not None:
+                collision_data.tables[source] = attach_table(shared_tables_description[source])
+        analysis = analysis_class()
+    for method in methods:
+        getattr(analysis, method)()
+    return name, time.perf_counter() - start, tracer.collect()
+
+
+def run_parallel(analyses: list = None, workers: int = None, output_dir: str = None, formats: list = FIGURE_FORMATS,
+                 use_cube: bool = False, query: dict = None) -> dict:
+    """Loads the columns every analysis needs once, shares them and runs the analyses on a process pool
+
+    Args:
+        analyses (list, optional): keys of ANALYSES to run, all of them if None
+        workers (int, optional): number of processes, one per core if None
+        output_dir (str, optional): folder every worker writes its figures to, None to show them on screen
+        formats (list, optional): image formats each figure is saved in
+        use_cube (bool, optional): answer the analyses in CUBE_ANALYSES from the collision cube, their rows are then never shared
+        query (dict, optional): start, end and boroughs arguments of CollisionIndex.query, to run the analyses over a selection of the data
+
+    Returns:
+        dict: seconds taken by each analysis
+    """
+    analyses = list(ANALYSES) if analyses is None else analyses
+    for name in analyses:
+        importlib.import_module(ANALYSES[name][0]) # modules register the columns they need when imported
+    if use_cube:
+        CollisionCube() # built (or checked) once here, workers only read the file
+    sources = {source for name in analyses for source in ANALYSES[name][3] if not (use_cube and name in CUBE_ANALYSES)}
+    if query is not None:
+        sources.add('crashes') # the index places vehicles and people through their crash
+    sources = sorted(sources)
+    shared_tables = SharedTables()
+    try:
+        tables_description = {}
+        for source in sources:
+            source_table = collision_data.load_table(source)
+            if isinstance(source_table, str): # error message from the loader
+                return source_table
+            if collision_data.is_memory_mapped(source):
+                tables_description[source] = None # workers map the stored columns themselves, the same pages as this process
+            else:
+                tables_description[source] = shared_tables.share_table(source_table)
+        collision_data.tables = {} # the main process doesn't need its own copy anymore
+        durations = {}
+        # spawn starts clean interpreters, workers only get the data through the shared blocks
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=set_shared_tables, initargs=(tables_description, output_dir, formats, tracer.enabled, tracer.trace_memory, use_cube, query)) as executor:
+            for finished in as_completed([executor.submit(run_analysis, name) for name in analyses]):
+                name, duration, trace_events = finished.result()
+                durations[name] = duration
+                tracer.add_events(trace_events)
+        return durations
+    finally:
+        shared_tables.release()
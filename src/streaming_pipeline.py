@@ -0,0 +1,146 @@
+# Module that computes the results of all five hypotheses reading the csv files in chunks, so memory is bounded by the chunk size
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from instrumentation import trace_class
+from data_cleansing.data_loader import collision_data, InMemoryDataSource
+from data_cleansing.collision_cube import STREET_INCIDENT_COLUMNS
+from data_cleansing.borough_boundaries import fill_missing_boroughs
+from data_cleansing.data_pre_processing import (CRASH_LOCATION_COLUMNS, CRASH_PERIOD_COLUMNS,
+                                                LISCENSE_STATUS_CRASH_COLUMNS, LISCENSE_STATUS_VEHICLE_COLUMNS)
+from visualizations.crash_by_period_vis import CrashByPeriodTrends, PERIOD_START_HOURS
+from visualizations.cyc_ped__accidents_vis import PedestriansAccidentsGraphs
+from visualizations.liscense_status_vis import LiscenseStatusTrends
+from visualizations.position_lethality_vis import CarSeatDangers, CAR_SEAT_COLUMNS
+from visualizations.seasonal_alcohol import SeasonalAlcoholColissions, SEASONAL_ALCOHOL_COLUMNS
+
+CHUNK_SIZE = 500_000 # rows read at a time from each csv
+CRASH_COLUMNS = list(dict.fromkeys(CRASH_LOCATION_COLUMNS + LISCENSE_STATUS_CRASH_COLUMNS + CRASH_PERIOD_COLUMNS + SEASONAL_ALCOHOL_COLUMNS))
+
+
+@trace_class
+class StreamingPipeline:
+    """Computes the aggregates of every analysis chunk by chunk: each chunk goes through the same classes used in memory
+    and only their partial counts, which can be added together, are kept between chunks
+    """
+    def __init__(self, chunk_size: int = CHUNK_SIZE, period_start_hours: dict = PERIOD_START_HOURS, data_source=collision_data):
+        self.chunk_size = chunk_size
+        self.period_start_hours = period_start_hours
+        self.data_source = data_source # loader the chunks are read from
+        self.monthly_counts = None # drug/alcohol accidents by month
+        self.factor_counts = None # contributing factors by time of day
+        self.street_incidents = None # pedestrian/cyclist victims by street
+        self.crash_boroughs = [] # COLLISION_ID and BOROUGH of crashes with a borough - needed to place the vehicles
+        self.license_counts = None # vehicles by borough and driver license status
+        self.factor_class_counts = None # vehicles by borough and contributing factor class
+        self.seat_counts = {} # severity counts of each seat position, in the order positions first appear
+
+    def add_counts(self, total, partial):
+        """Adds partial counts to the running total, aligning them by their labels
+
+        Args:
+            total (pd.DataFrame | pd.Series): counts of the chunks already processed, None before the first one
+            partial (pd.DataFrame | pd.Series): counts of the current chunk
+
+        Returns:
+            pd.DataFrame | pd.Series: updated total
+        """
+        if total is None:
+            return partial
+        if isinstance(partial, pd.DataFrame):
+            columns = total.columns.union(partial.columns) # sorted union, same order the in-memory counts use
+            return total.reindex(columns=columns, fill_value=0) + partial.reindex(columns=columns, fill_value=0)
+        return total.add(partial, fill_value=0)
+
+    def process_crashes_chunk(self, crashes: pd.DataFrame):
+        """Updates the seasonal, period and street aggregates with a chunk of the crashes data
+
+        Args:
+            crashes (pd.DataFrame): chunk of the crashes csv
+        """
+        chunk_source = InMemoryDataSource({'crashes': crashes})
+        self.monthly_counts = self.add_counts(self.monthly_counts, SeasonalAlcoholColissions(chunk_source).count_by_month())
+        self.factor_counts = self.add_counts(self.factor_counts, CrashByPeriodTrends(self.period_start_hours, chunk_source).get_contributing_factor_counts())
+        street_incidents = PedestriansAccidentsGraphs(chunk_source).streets_accidents()[STREET_INCIDENT_COLUMNS]
+        self.street_incidents = self.add_counts(self.street_incidents, street_incidents)
+        crashes['BOROUGH'] = fill_missing_boroughs(crashes, self.data_source) # located here, with the coordinates of the chunk
+        crash_boroughs = crashes.loc[crashes['BOROUGH'].notna(), ['COLLISION_ID', 'BOROUGH']]
+        self.crash_boroughs.append(crash_boroughs.astype({'BOROUGH': 'category'})) # a few bytes per crash instead of a string
+
+    def process_vehicles_chunk(self, vehicles: pd.DataFrame, crash_source: InMemoryDataSource):
+        """Updates the borough compositions with a chunk of the vehicles data
+
+        Args:
+            vehicles (pd.DataFrame): chunk of the vehicles csv
+            crash_source (InMemoryDataSource): COLLISION_ID and BOROUGH of every crash with a borough, shared by every chunk
+        """
+        crash_source.tables['vehicles'] = vehicles # the COLLISION_ID index of the crashes is built with the first chunk and kept
+        license_trends = LiscenseStatusTrends(crash_source)
+        license_trends.add_contributing_factor_class()
+        vehicle_data = license_trends.collision_data
+        license_counts = vehicle_data.groupby(['BOROUGH', 'DRIVER_LICENSE_STATUS'], observed=True).size()
+        factor_class_counts = vehicle_data.groupby(['BOROUGH', 'CONTRIBUTING FACTOR CLASS'], observed=True).size()
+        self.license_counts = self.add_counts(self.license_counts, license_counts)
+        self.factor_class_counts = self.add_counts(self.factor_class_counts, factor_class_counts)
+
+    def process_person_chunk(self, person: pd.DataFrame):
+        """Updates the seat position severity counts with a chunk of the person data
+
+        Args:
+            person (pd.DataFrame): chunk of the person csv
+        """
+        car_seat_dangers = CarSeatDangers(InMemoryDataSource({'person': person}))
+        accident_count = car_seat_dangers.data_processing()
+        for index, position in enumerate(car_seat_dangers.positions):
+            self.seat_counts[position] = self.seat_counts.get(position, np.zeros(3)) + accident_count[index]
+
+    def run(self) -> dict:
+        """Reads crashes, vehicles and person data once each, chunk by chunk, and combines the partial aggregates
+
+        Returns:
+            dict: final result of every analysis
+        """
+        for crashes in self.data_source.iter_chunks('crashes', CRASH_COLUMNS, self.chunk_size):
+            self.process_crashes_chunk(crashes)
+        # categories of each chunk are unified, so the boroughs never go back to one string per crash
+        crash_boroughs = pd.DataFrame({'COLLISION_ID': np.concatenate([chunk['COLLISION_ID'].to_numpy() for chunk in self.crash_boroughs]),
+                                       'BOROUGH': union_categoricals([chunk['BOROUGH'] for chunk in self.crash_boroughs])})
+        for column in ['LATITUDE', 'LONGITUDE']: # every crash kept already has its borough, so its coordinates aren't needed again
+            crash_boroughs[column] = np.full(len(crash_boroughs), np.nan, dtype=np.float32)
+        self.crash_boroughs = []
+        crash_source = InMemoryDataSource({'crashes': crash_boroughs})
+        for vehicles in self.data_source.iter_chunks('vehicles', LISCENSE_STATUS_VEHICLE_COLUMNS, self.chunk_size):
+            self.process_vehicles_chunk(vehicles, crash_source)
+        for person in self.data_source.iter_chunks('person', CAR_SEAT_COLUMNS, self.chunk_size):
+            self.process_person_chunk(person)
+
+        # the same classes turn the summed counts into the final tables - built over no rows, only their count-based methods are used
+        empty_source = InMemoryDataSource({'crashes': pd.DataFrame(columns=CRASH_COLUMNS)})
+        period_trends = CrashByPeriodTrends(self.period_start_hours, empty_source)
+        seasonal_alcohol = SeasonalAlcoholColissions(empty_source)
+        return {
+            'seasonal_alcohol': seasonal_alcohol.data_processing(self.monthly_counts),
+            'crash_by_period': period_trends.related_to_factors(self.factor_counts),
+            'borough_license_composition': LiscenseStatusTrends.composition_from_counts(self.license_counts.astype('int64'), 'DRIVER_LICENSE_STATUS'),
+            'borough_collision_composition': LiscenseStatusTrends.composition_from_counts(self.factor_class_counts.astype('int64'), 'CONTRIBUTING FACTOR CLASS'),
+            'seat_severity': pd.DataFrame(list(self.seat_counts.values()), index=list(self.seat_counts), columns=['Serious', 'Moderate', 'Minor']),
+            'street_incidents': self.street_incidents.sort_values(by='GENERAL INCIDENTS', ascending=False),
+        }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Computes the results of every analysis reading the data in chunks')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='rows read at a time from each csv')
+    parser.add_argument('--output-dir', default='streaming_results', help='folder the result tables are written to')
+    arguments = parser.parse_args()
+
+    results = StreamingPipeline(arguments.chunk_size).run()
+    os.makedirs(arguments.output_dir, exist_ok=True)
+    results['crash_by_period'][0].to_csv(os.path.join(arguments.output_dir, 'crash_by_period.csv'), index=False)
+    for name in ['seasonal_alcohol', 'borough_license_composition', 'borough_collision_composition']:
+        results[name].to_csv(os.path.join(arguments.output_dir, name + '.csv'), index=False)
+    for name in ['seat_severity', 'street_incidents']:
+        results[name].to_csv(os.path.join(arguments.output_dir, name + '.csv'))
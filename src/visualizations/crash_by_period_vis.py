@@ -8,91 +8,102 @@ import numpy as np
 
 sys.path.append(os.path.abspath(os.path.dirname(__file__) + "/.."))
 
+from instrumentation import trace_class
+from data_cleansing.data_loader import collision_data
+from visualizations.rendering import figure_renderer
 from data_cleansing.data_pre_processing import CrashByPeriodData
+from data_cleansing.factor_counting import ContributingFactorCounter
 
+# first hour of each period of the day, in the order the periods are shown - each period lasts until the next one starts
+PERIOD_START_HOURS = {'morning': 6,
+                      'mid_day': 12,
+                      'night': 18,
+                      'late_night': 0}
+
+@trace_class
 class CrashByPeriodTrends:
     """Class responsible for producing temporal analysis on CF of collisions 
     """
-    def __init__(self):
-        self.accidents_data = CrashByPeriodData().complete_crash_period_data
+    def __init__(self, period_start_hours: dict = PERIOD_START_HOURS, data_source=collision_data, cube=None):
+        self.cube = cube # a CollisionCube answers the factor counts from its counts by hour, without reading the crashes
+        if cube is None:
+            self.accidents_data = CrashByPeriodData(data_source).complete_crash_period_data
+        self.period_start_hours = period_start_hours
+
+    def get_period_of_hour(self) -> np.ndarray:
+        """Builds a lookup table with the period of the day of each of the 24 hours
+
+        Returns:
+            np.ndarray: array where position h holds the code of the period hour h belongs to
+        """
+        period_names = list(self.period_start_hours)
+        starts = sorted(self.period_start_hours.items(), key=lambda period: period[1]) # periods in the order they happen
+        period_of_hour = np.empty(24, dtype=np.int8)
+        for index, (period, start_hour) in enumerate(starts):
+            end_hour = starts[index + 1][1] if index + 1 < len(starts) else 24
+            period_of_hour[start_hour:end_hour] = period_names.index(period)
+        period_of_hour[:starts[0][1]] = period_names.index(starts[-1][0]) # hours before the first start belong to the last period of the previous day
+        return period_of_hour
 
-    def classify_time_of_day(self, row:pd.Series) -> str:
-        """Classifies datetime values into groups
+    def classify_time_of_day(self, crash_times: pd.Series) -> pd.Categorical:
+        """Classifies crash times into periods of the day
 
         Args:
-            row pd.Series: accidents data
+            crash_times pd.Series: crash times formatted as hour:minute
 
         Returns:
-            str: class of date time
+            pd.Categorical: ordered period of the day of each crash
         """
         try:
             # we only care to analyse the hour of the crash time since this allows us to divide the day into seperate blocks of classifications
-            hour = int(str(row['CRASH TIME']).split(':')[0])
-            #dictionary mapping classifications to time
-            classifying_dict = {'morning':[6,7,8,9,10,11], 
-                        'mid_day':[12,13,14,15,16,17], 
-                        'night': [18,19,20,21,22,23], 
-                        'late_night': [0,1,2,3,4,5]} 
-            for classification, times in classifying_dict.items(): # iterate over each classification
-                # depending on the hour, if it fits into a certain classifications this is what we return
-                if hour in times: 
-                    return classification 
-        except KeyError as error:
+            # a day has at most 1440 different crash times, so each distinct time is parsed only once and then spread to all rows
+            time_codes, distinct_times = pd.factorize(crash_times)
+            distinct_hours = distinct_times.str.split(':', n=1).str[0].astype(int).to_numpy()
+            period_codes = self.get_period_of_hour()[distinct_hours][time_codes]
+            period_codes[time_codes == -1] = -1 # missing crash times stay without classification
+            return pd.Categorical.from_codes(period_codes, categories=list(self.period_start_hours), ordered=True)
+        except AttributeError as error:
             return 'Dataframe passed has inconsistent/unaccounted keys'
-        except IndexError as error:
+        except (ValueError, IndexError) as error:
             return 'Index passed is invalid - hour cannot be formatted'
 
 
     def get_contributing_factor_counts(self) -> pd.DataFrame:
-        """collects dataframes of counts o each contributing factor at a specific time of day
+        """counts each contributing factor of every vehicle at each time of day, all in a single grouped pass
 
         Returns:
-            pd.DataFrame: 5 dataframes correspinding to the contributing factor of the vehicle involved
+            pd.DataFrame: table with one row per time of day and one column per contributing factor
         """
         try:
-            self.accidents_data['TIME OF DAY'] = self.accidents_data.apply(self.classify_time_of_day, axis=1) # classify each time of day
-            # group data by Time of day, filtering by respective CF and counting the individual kinds of CF that occurredat that period of the day
-            contributing_factor_counts_1 = self.accidents_data.groupby(by='TIME OF DAY')[['CONTRIBUTING FACTOR VEHICLE 1']].value_counts().reset_index(name='Number of occurrences') 
-            contributing_factor_counts_2 = self.accidents_data.groupby(by='TIME OF DAY')[['CONTRIBUTING FACTOR VEHICLE 2']].value_counts().reset_index(name='Number of occurrences')
-            contributing_factor_counts_3 = self.accidents_data.groupby(by='TIME OF DAY')[['CONTRIBUTING FACTOR VEHICLE 3']].value_counts().reset_index(name='Number of occurrences')
-            contributing_factor_counts_4 = self.accidents_data.groupby(by='TIME OF DAY')[['CONTRIBUTING FACTOR VEHICLE 4']].value_counts().reset_index(name='Number of occurrences')
-            contributing_factor_counts_5 = self.accidents_data.groupby(by='TIME OF DAY')[['CONTRIBUTING FACTOR VEHICLE 5']].value_counts().reset_index(name='Number of occurrences')
-
-            #return all 5 counts
-            return contributing_factor_counts_1, contributing_factor_counts_2, contributing_factor_counts_3, contributing_factor_counts_4, contributing_factor_counts_5
+            if self.cube is not None:
+                return self.cube.factor_counts_by_period(self.get_period_of_hour(), list(self.period_start_hours))
+            self.accidents_data['TIME OF DAY'] = self.classify_time_of_day(self.accidents_data['CRASH TIME']) # classify each time of day
+            # the 5 CF columns become one long array of factors, counted by time of day all at once
+            self.factor_counter = ContributingFactorCounter(self.accidents_data)
+            return self.factor_counter.count_by_group(self.accidents_data['TIME OF DAY'])
         except KeyError as error:
             return 'Dataframe passed has inconsistent/unaccounted keys'
 
-    def related_to_factors(self) -> pd.DataFrame:
+    def related_to_factors(self, factor_counts: pd.DataFrame = None) -> pd.DataFrame:
         """
         Compile contributing factor counts into a single DataFrame and identify the most common contributing factors at different times of day.
 
+        Args:
+            factor_counts (pd.DataFrame, optional): table of counts already computed (e.g. summed over chunks of the data),
+                counted from the accidents data if None.
+
         Returns:
             pd.DataFrame: Compiled DataFrame with contributing factors and their occurrences by time of day.
         """
         try:
-            cf1_count, cf2_count, cf3_count, cf4_count, cf5_count = self.get_contributing_factor_counts() # Get counts for contributing factors for each vehicle of all collisions
-            # Rename columns for consistency and allow for concatenation
-            cf1_count.rename(columns={'CONTRIBUTING FACTOR VEHICLE 1': 'CONTRIBUTING FACTOR'}, inplace=True)
-            cf2_count.rename(columns={'CONTRIBUTING FACTOR VEHICLE 2': 'CONTRIBUTING FACTOR'}, inplace=True)
-            cf3_count.rename(columns={'CONTRIBUTING FACTOR VEHICLE 3': 'CONTRIBUTING FACTOR'}, inplace=True)
-            cf4_count.rename(columns={'CONTRIBUTING FACTOR VEHICLE 4': 'CONTRIBUTING FACTOR'}, inplace=True)
-            cf5_count.rename(columns={'CONTRIBUTING FACTOR VEHICLE 5': 'CONTRIBUTING FACTOR'}, inplace=True)
-            # Concatenate all counts into a single DataFrame
-            concatenated_df = pd.concat([cf1_count, cf2_count, cf3_count, cf4_count, cf5_count], axis=0)
-            summed_df = concatenated_df.groupby(by=['CONTRIBUTING FACTOR', 'TIME OF DAY'], as_index=False).sum() # Sum occurrences by contributing factor and time of day
-            # Find the most common contributing factors at different times of day
-            max_morning = summed_df[summed_df['TIME OF DAY'] == 'morning'].sort_values(by='Number of occurrences', ascending=False).head(5)['CONTRIBUTING FACTOR']
-            max_mid_day = summed_df[summed_df['TIME OF DAY'] == 'mid_day'].sort_values(by='Number of occurrences', ascending=False).head(5)['CONTRIBUTING FACTOR']
-            max_night = summed_df[summed_df['TIME OF DAY'] == 'night'].sort_values(by='Number of occurrences', ascending=False).head(5)['CONTRIBUTING FACTOR']
-            max_late_night = summed_df[summed_df['TIME OF DAY'] == 'late_night'].sort_values(by='Number of occurrences', ascending=False).head(5)['CONTRIBUTING FACTOR']
-
-            most_common_contributing_factors = list(set(max_morning.to_list() + max_mid_day.to_list() + max_night.to_list() + max_late_night.to_list())) # Compile the most common contributing factors into a list
-            day_order = ['morning', 'mid_day', 'night', 'late_night']
-            summed_df['TIME OF DAY'] = pd.Categorical(summed_df['TIME OF DAY'], categories=day_order, ordered=True)
-            summed_df = summed_df.sort_values(by='TIME OF DAY')
+            if factor_counts is None:
+                factor_counts = self.get_contributing_factor_counts() # Get counts for contributing factors for each vehicle of all collisions
+            summed_df = ContributingFactorCounter.to_long_format(factor_counts) # one row per contributing factor and time of day, ordered by time of day
+            # Find the 5 most common contributing factors at each time of day, from the same counts
+            top_factors_by_period = ContributingFactorCounter.top_factors(factor_counts, k=5)
+            most_common_contributing_factors = list(dict.fromkeys(factor for factors in top_factors_by_period.values() for factor in factors)) # Compile the most common contributing factors into a list
             return summed_df, most_common_contributing_factors
-        except KeyError as error:
+        except (KeyError, AttributeError) as error:
             return 'Dataframe passed has inconsistent/unaccounted keys'
     def crash_by_period_plot(self):
         """
@@ -112,7 +123,7 @@ class CrashByPeriodTrends:
             plt.ylabel('Logarithmic number of accidents')
             plt.legend(title='Contributing factor',loc='upper left')
             plt.xticks(rotation=45)
-            plt.show()
+            figure_renderer.show('crash_by_period')
         except KeyError as error:
             return 'Dataframe passed has inconsistent/unaccounted keys'
 
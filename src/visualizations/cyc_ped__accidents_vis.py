@@ -4,6 +4,7 @@ import geopandas.tools
 import geopandas
 import colorcet as cc
 import hvplot.pandas
+import holoviews
 import geoviews # Although we don't explicitly use geoviews, it is used by holoviews in the background
 import seaborn
 import pandas as pd
@@ -13,83 +14,143 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.dirname(__file__) + "/.."))
 
+from instrumentation import trace_class
 from data_cleansing import data_pre_processing
+from data_cleansing.data_loader import collision_data
+from data_cleansing.collision_hotspots import IntersectionHotspots
+from visualizations.rendering import figure_renderer
+from visualizations.density_tiles import DensityTilePyramid
 
 
+PEDESTRIAN_CYCLIST_COLUMNS = ['NUMBER OF PEDESTRIANS INJURED',
+                              'NUMBER OF PEDESTRIANS KILLED',
+                              'NUMBER OF CYCLIST INJURED',
+                              'NUMBER OF CYCLIST KILLED']
+
+
+@trace_class
 class PedestriansAccidents:
     """
     Used to filter and plot the data related to pedestrians and cyclists accidents based on known geographical data
     """
-    def __init__(self):
-        self.df = data_pre_processing.CrashLocationData().full_geo_data
-        self.geodf = geopandas.GeoDataFrame(self.df, 
-                                    # x is longitude and y is latitude, geopandas works very oddly
-                                    geometry=geopandas.points_from_xy(self.df["LONGITUDE"], self.df["LATITUDE"]))
-    
-    def clean_df(self) -> geopandas.GeoDataFrame:
+    def __init__(self, data_source=collision_data):
+        self.data_source = data_source
+        self.df = None # located crashes, loaded the first time they are needed - the map doesn't need them once its tiles are built
+        self.filtered_df = None # pedestrian and cyclist crashes, filtered the first time they are needed and shared by every plot
+
+    def clean_df(self) -> pd.DataFrame:
         """
-        Filter by demographic involved and removes anomolous and invalid points
+        Filter by demographic involved and removes anomolous points, only once - later calls get the same dataframe
 
         Returns
         -------
-        geopandas.GeoDataFrame
+        pd.DataFrame
             A data frame with all relevant geographic data related to motorvehicle accidents
-            which involve the injury or death of pedestrians and/or pedestrians
+            which involve the injury or death of pedestrians and/or pedestrians - shared, never modified by the callers
         """
         try:
-            # Getting rid of all rows that doesn't have data about cyclists or pedestrians
-            self.geodf.dropna(inplace=True, axis=0, subset=[
-                'NUMBER OF PEDESTRIANS INJURED',
-                'NUMBER OF PEDESTRIANS KILLED',
-                'NUMBER OF CYCLIST INJURED',
-                'NUMBER OF CYCLIST KILLED'], how='all')
-            # Using a mask to clean all rows that doesn't involve cyclists or pedestrians
-            mask = (self.geodf[[
-                'NUMBER OF PEDESTRIANS INJURED',
-                'NUMBER OF PEDESTRIANS KILLED',
-                'NUMBER OF CYCLIST INJURED',
-                'NUMBER OF CYCLIST KILLED']] != 0).any(axis=1)
-            filtered_geodf = self.geodf[mask]
-            filtered_geodf.reset_index(inplace=True, drop=True)
-            filtered_geodf = filtered_geodf[~filtered_geodf.is_empty] # Cleaning points that doesn't have a geographic point to plot
-            filtered_geodf = filtered_geodf[filtered_geodf['LATITUDE']!=0] # Cleaning some outliers that had Latitude=0
-            return filtered_geodf
+            if self.filtered_df is None:
+                if self.df is None:
+                    self.df = data_pre_processing.CrashLocationData(self.data_source).full_geo_data
+                victims = self.df[PEDESTRIAN_CYCLIST_COLUMNS]
+                # rows with data about cyclists or pedestrians, where any of them was injured or killed - a missing count isn't a zero
+                involved = victims.notna().any(axis=1) & (victims != 0).any(axis=1)
+                valid_points = self.df['LATITUDE'] != 0 # Cleaning some outliers that had Latitude=0
+                self.filtered_df = self.df[(involved & valid_points).to_numpy()].reset_index(drop=True)
+            return self.filtered_df
         except KeyError as error:
             return 'Dataframe passed has inconsistent/unaccounted keys'
+
+    def clean_geodf(self) -> geopandas.GeoDataFrame:
+        """
+        Builds the point geometry of the filtered crashes only, for the plots that need it
+
+        Returns
+        -------
+        geopandas.GeoDataFrame
+            The filtered crashes with a point for each one
+        """
+        filtered_df = self.clean_df()
+        if isinstance(filtered_df, str):
+            return filtered_df
+        # x is longitude and y is latitude, geopandas works very oddly
+        points = geopandas.points_from_xy(filtered_df["LONGITUDE"].to_numpy(), filtered_df["LATITUDE"].to_numpy())
+        return geopandas.GeoDataFrame(filtered_df, geometry=points)
+
     def plot_accidents(self):
         """
         Plots all accidents involving pedestrians and/or cyclists across the city of new york
+
+        The density of the crashes is read from a pyramid of tiles built once from the filtered crashes, so each view
+        (and each zoom or pan) only assembles the few tiles it shows instead of rasterizing every crash again
         """
-        filtered_geodf = self.clean_df()
+        source_paths = [self.data_source.source_path('crashes')] if hasattr(self.data_source, 'source_path') else None
+        density_tiles = DensityTilePyramid(source_paths)
+        density_tiles.load(self.crash_points) # the crashes are only loaded when the tiles have to be built
         hvplot.extension('bokeh') # HoloViews plots are ideal for large quantities of data
-        plot =filtered_geodf.hvplot.points(x='LONGITUDE', 
-                                        y='LATITUDE', 
-                                        frame_width=800, 
-                                        frame_height=800, 
-                                        rasterize=True, 
-                                        dynspread=True,
-                                        cnorm='eq_hist', 
-                                        cmap=cc.fire[100:], 
-                                        bgcolor='black')
-        hvplot.show(plot)
 
+        def density_view(x_range, y_range):
+            counts, bounds = density_tiles.raster(x_range, y_range, width=800)
+            return holoviews.Image(counts, bounds=bounds, kdims=['LONGITUDE', 'LATITUDE'], vdims=['CRASHES'])
+
+        plot = holoviews.DynamicMap(density_view, streams=[holoviews.streams.RangeXY()])
+        plot = plot.opts(holoviews.opts.Image(frame_width=800,
+                                              frame_height=800,
+                                              cnorm='eq_hist',
+                                              cmap=cc.fire[100:],
+                                              bgcolor='black',
+                                              tools=['hover']))
+        figure_renderer.show_interactive(plot, 'pedestrian_accidents_map')
 
+    def crash_points(self) -> tuple:
+        """
+        Coordinates of the filtered crashes, as the density tiles are built from
+
+        Returns
+        -------
+        tuple
+            Latitude and longitude arrays
+        """
+        filtered_df = self.clean_df()
+        return filtered_df['LATITUDE'].to_numpy(dtype='float64'), filtered_df['LONGITUDE'].to_numpy(dtype='float64')
+
+
+@trace_class
 class PedestriansAccidentsGraphs:
     """
     Used to plot pedestrian and cyclists accidents with a bar chart
     """
-    def __init__(self):
-        self.crash_data = PedestriansAccidents().clean_df()
+    def __init__(self, data_source=collision_data, cube=None, accidents=None):
+        self.data_source = data_source
+        self.cube = cube # a CollisionCube answers the street totals without reading the crashes
+        self.accidents = accidents # PedestriansAccidents of the map, so both share its filtered crashes - built when needed if None
+        if cube is None:
+            self.crash_data = self.pedestrian_accidents().clean_df()
+
+    def pedestrian_accidents(self) -> PedestriansAccidents:
+        """
+        Collects the PedestriansAccidents the crashes are taken from, building it the first time
+
+        Returns
+        -------
+        PedestriansAccidents
+            Shared with the map when it was passed to the constructor
+        """
+        if self.accidents is None:
+            self.accidents = PedestriansAccidents(self.data_source)
+        return self.accidents
     
     def streets_accidents(self) -> geopandas.GeoDataFrame:
         try:
-            # Filters the dataframe by dropping rows without street name
-            self.crash_data = self.crash_data[self.crash_data['ON STREET NAME'].isna() == False]
-            self.crash_data["PEDESTRIANS INCIDENTS"] = self.crash_data['NUMBER OF PEDESTRIANS INJURED'] + self.crash_data['NUMBER OF PEDESTRIANS KILLED']
-            self.crash_data["CYCLISTS INCIDENTS"] = self.crash_data['NUMBER OF CYCLIST INJURED'] + self.crash_data['NUMBER OF CYCLIST KILLED']
-            self.crash_data["GENERAL INCIDENTS"] = self.crash_data['PEDESTRIANS INCIDENTS'] + self.crash_data['CYCLISTS INCIDENTS']
-            # Group each street and then sum the values of each selected column to count the accidents by victim
-            incidents_by_street = self.crash_data.groupby(['ON STREET NAME'])[['ON STREET NAME','GENERAL INCIDENTS', 
+            if self.cube is not None:
+                return self.cube.street_totals()
+            # Filters the dataframe by dropping rows without street name - a copy, the hotspots still need the crashes without one
+            crash_data = self.crash_data[self.crash_data['ON STREET NAME'].isna() == False].copy()
+            crash_data["PEDESTRIANS INCIDENTS"] = crash_data['NUMBER OF PEDESTRIANS INJURED'] + crash_data['NUMBER OF PEDESTRIANS KILLED']
+            crash_data["CYCLISTS INCIDENTS"] = crash_data['NUMBER OF CYCLIST INJURED'] + crash_data['NUMBER OF CYCLIST KILLED']
+            crash_data["GENERAL INCIDENTS"] = crash_data['PEDESTRIANS INCIDENTS'] + crash_data['CYCLISTS INCIDENTS']
+            # Group each street and then sum the values of each selected column to count the accidents by victim - streets are categories, only the ones with crashes are kept
+            incidents_by_street = crash_data.groupby(['ON STREET NAME'], observed=True)[['GENERAL INCIDENTS', 
                                                                     'NUMBER OF CYCLIST INJURED',
                                                                     'NUMBER OF CYCLIST KILLED',
                                                                     'NUMBER OF PEDESTRIANS INJURED',
@@ -101,13 +162,36 @@ class PedestriansAccidentsGraphs:
             return 'Dataframe passed has inconsistent/unaccounted keys'
         except TypeError as error:
             return 'Incapable of summing cells of inconsitent type'
-        
+
+    def intersection_hotspots(self, top: int = 10) -> pd.DataFrame:
+        """
+        Ranks the spots of the city with most pedestrian and cyclist victims, on a grid of cells about the size of an intersection,
+        so a long avenue doesn't win only for being long
+
+        Parameters
+        ----------
+        top : int, optional
+            Number of hotspots returned
+
+        Returns
+        -------
+        pd.DataFrame
+            Center, dominant pair of streets, crashes and victims of each hotspot, from the most dangerous one
+        """
+        try:
+            # the cube only holds totals by street, so the points are read here if the class was built with one
+            crash_data = self.crash_data if self.cube is None else self.pedestrian_accidents().clean_df()
+            return IntersectionHotspots(crash_data).top_cells(top)
+        except KeyError as error:
+            return 'Dataframe passed has inconsistent/unaccounted keys'
+
     def accidents_graphs_plot(self):
         """
         Plots a bar graph with the 5 streets with most accidents involving cyclists or pedestrians and what are their conditions
         """
         incidents_df = self.streets_accidents()
-        incidents_df = incidents_df.head() # Take the first 5 streets with most incidents throgouth the years
+        incidents_df = incidents_df.head().reset_index() # Take the first 5 streets with most incidents throgouth the years
+        incidents_df['ON STREET NAME'] = incidents_df['ON STREET NAME'].astype(str) # only these 5 streets become bars, not every street category
         modified_df = pd.melt(incidents_df, id_vars='ON STREET NAME',var_name='victim class', value_name='number of victims')
         # Creates a bar graph to show the data
         graph = seaborn.catplot(data=modified_df, 
@@ -117,8 +201,33 @@ class PedestriansAccidentsGraphs:
                             kind='bar', 
                             height=5, 
                             aspect=1)
-        graph.set_xticklabels(labels=['Broadway', '3rd Av', '5th Av', '2nd Av', 'Atlantic Av']) # Labelling the x-axis
+        graph.set_xticklabels(labels=incidents_df['ON STREET NAME'].str.title(), rotation=20, ha='right') # Labelling the x-axis with the streets ranked
+        graph._legend.set_bbox_to_anchor((1, 0.75)) # Moving the legend for it not to overlap with the graph
+        graph._legend.set_frame_on(True)
+        plt.tight_layout() # Ensure that all visualizations are correctly displayed
+        figure_renderer.show('pedestrian_accidents_by_street')
+
+    def hotspots_graphs_plot(self):
+        """
+        Plots a bar graph with the 5 intersections with most accidents involving cyclists or pedestrians and what are their conditions
+        """
+        hotspots_df = self.intersection_hotspots(top=5)
+        # each hotspot is named by its rank and its pair of streets (or its only street) - two cells can share the same pair
+        street_pairs = (hotspots_df['ON STREET NAME'].fillna('').str.title() + ' & '
+                        + hotspots_df['CROSS STREET NAME'].fillna('').str.title()).str.strip(' &')
+        hotspots_df['INTERSECTION'] = (hotspots_df.index + 1).astype(str) + '. ' + street_pairs
+        hotspots_df = hotspots_df[['INTERSECTION', 'NUMBER OF CYCLIST INJURED', 'NUMBER OF CYCLIST KILLED',
+                                   'NUMBER OF PEDESTRIANS INJURED', 'NUMBER OF PEDESTRIANS KILLED']]
+        modified_df = pd.melt(hotspots_df, id_vars='INTERSECTION', var_name='victim class', value_name='number of victims')
+        graph = seaborn.catplot(data=modified_df,
+                            x='INTERSECTION',
+                            y='number of victims',
+                            hue='victim class',
+                            kind='bar',
+                            height=5,
+                            aspect=1.4)
+        graph.set_xticklabels(rotation=20, ha='right')
         graph._legend.set_bbox_to_anchor((1, 0.75)) # Moving the legend for it not to overlap with the graph
         graph._legend.set_frame_on(True)
         plt.tight_layout() # Ensure that all visualizations are correctly displayed
-        plt.show()
\ No newline at end of file
+        figure_renderer.show('pedestrian_accidents_by_intersection')
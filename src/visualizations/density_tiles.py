@@ -0,0 +1,171 @@
+# Module that precomputes the crash density of the city at several resolutions, so a map only reads the few tiles it shows
+import os
+import numpy as np
+
+import sys
+sys.path.append(os.path.abspath(os.path.dirname(__file__) + "/.."))
+
+from instrumentation import trace_class
+from data_cleansing.data_loader import DATA_DIRECTORY
+from data_cleansing.data_cache import CACHE_VERSION
+from data_cleansing.collision_hotspots import NYC_BOUNDS
+
+TILES_PATH = os.path.join(DATA_DIRECTORY, "cache", "density_tiles.npz")
+TILES_VERSION = 1 # must be increased whenever the layout of the tiles changes, so old tile files are rebuilt
+TILE_SIZE = 256 # pixels on each side of a tile
+MAX_LEVEL = 6 # level L splits the city into 2**L x 2**L tiles - 16384 pixels across at the last one, a few meters each
+
+
+@trace_class(skip=['raster', 'level_arrays'])
+class DensityTilePyramid:
+    """Class responsible for counting crashes in the pixels of every tile of every level of a pyramid over the city
+
+    Each level is stored as the ids of its non-empty tiles, where the pixels of each tile start, and the position
+    and count of each non-empty pixel - a view of the map only assembles the tiles it covers, at the level that
+    matches its width, so it costs the same whatever the number of crashes
+    """
+    def __init__(self, source_paths: list = None, tiles_path: str = TILES_PATH):
+        self.source_paths = source_paths # files the crashes came from, None if the pyramid is never stored (data in memory)
+        self.tiles_path = tiles_path
+        (self.south, self.north), (self.west, self.east) = NYC_BOUNDS['LATITUDE'], NYC_BOUNDS['LONGITUDE']
+        self.levels = {} # arrays of each level already read or built
+
+    def source_fingerprint(self) -> np.ndarray:
+        """Versions of the cleaning and of the tiles, and size and modification time of every source file
+
+        Returns:
+            np.ndarray: fingerprint stored with the tiles, None if there are no source files
+        """
+        if self.source_paths is None or self.tiles_path is None:
+            return None
+        fingerprint = [CACHE_VERSION, TILES_VERSION]
+        for source_path in self.source_paths:
+            source_status = os.stat(source_path)
+            fingerprint += [source_status.st_size, source_status.st_mtime_ns]
+        return np.array(fingerprint, dtype=np.int64)
+
+    def load(self, points_function):
+        """Keeps the stored tiles if the sources didn't change, otherwise builds and stores them again
+
+        Args:
+            points_function (callable): returns the latitude and longitude arrays of the crashes, only called to build the tiles
+        """
+        fingerprint = self.source_fingerprint()
+        if fingerprint is not None and os.path.exists(self.tiles_path):
+            with np.load(self.tiles_path) as stored_tiles: # only the fingerprint is read, levels are read when shown
+                if np.array_equal(stored_tiles['fingerprint'], fingerprint):
+                    return
+        latitudes, longitudes = points_function()
+        self.levels = self.build_levels(np.asarray(latitudes, dtype=np.float64), np.asarray(longitudes, dtype=np.float64))
+        if fingerprint is not None:
+            os.makedirs(os.path.dirname(self.tiles_path), exist_ok=True)
+            level_arrays = {name + '_' + str(level): array for level, arrays in self.levels.items() for name, array in arrays.items()}
+            with open(self.tiles_path + '.tmp', 'wb') as tiles_file: # file object so numpy doesn't append its own extension
+                np.savez_compressed(tiles_file, fingerprint=fingerprint, **level_arrays)
+            os.replace(self.tiles_path + '.tmp', self.tiles_path)
+
+    def build_levels(self, latitudes: np.ndarray, longitudes: np.ndarray) -> dict:
+        """Counts the crashes of every pixel of the last level, then merges 2 x 2 pixels into one for each level above it
+
+        Args:
+            latitudes (np.ndarray): latitude of each crash
+            longitudes (np.ndarray): longitude of each crash
+
+        Returns:
+            dict: tiles, offsets, pixels and counts arrays of each level
+        """
+        pixels_across = TILE_SIZE * 2 ** MAX_LEVEL
+        with np.errstate(invalid='ignore'): # NaN coordinates fall outside the city below
+            columns = np.floor((longitudes - self.west) / (self.east - self.west) * pixels_across)
+            rows = np.floor((self.north - latitudes) / (self.north - self.south) * pixels_across) # row 0 is the north edge
+        inside = (columns >= 0) & (columns < pixels_across) & (rows >= 0) & (rows < pixels_across)
+        columns, rows = columns[inside].astype(np.int64), rows[inside].astype(np.int64)
+        counts = np.ones(len(columns), dtype=np.int64)
+        levels = {}
+        for level in range(MAX_LEVEL, -1, -1):
+            # crashes of the same pixel are merged, so each level above only handles the pixels of the one below
+            pixel_keys, pixel_codes = np.unique(rows * pixels_across + columns, return_inverse=True)
+            counts = np.bincount(pixel_codes.ravel(), weights=counts).astype(np.int64)
+            rows, columns = np.divmod(pixel_keys, pixels_across)
+            levels[level] = self.level_tiles(level, rows, columns, counts)
+            rows, columns, pixels_across = rows // 2, columns // 2, pixels_across // 2
+        return levels
+
+    def level_tiles(self, level: int, rows: np.ndarray, columns: np.ndarray, counts: np.ndarray) -> dict:
+        """Groups the non-empty pixels of a level by tile
+
+        Args:
+            level (int): level of the pyramid
+            rows (np.ndarray): row of each pixel in the level
+            columns (np.ndarray): column of each pixel in the level
+            counts (np.ndarray): crashes in each pixel
+
+        Returns:
+            dict: ids of the non-empty tiles, start of the pixels of each one, and position and count of each pixel
+        """
+        tile_ids = (rows // TILE_SIZE) * 2 ** level + columns // TILE_SIZE
+        tile_order = np.argsort(tile_ids, kind='stable')
+        tiles, tile_starts = np.unique(tile_ids[tile_order], return_index=True)
+        return {'tiles': tiles.astype(np.int32),
+                'offsets': np.append(tile_starts, len(tile_order)).astype(np.int64),
+                'pixels': ((rows % TILE_SIZE) * TILE_SIZE + columns % TILE_SIZE)[tile_order].astype(np.uint16),
+                'counts': counts[tile_order].astype(np.uint32)}
+
+    def level_arrays(self, level: int) -> dict:
+        """Arrays of a level, read from the tiles file the first time the level is shown
+
+        Args:
+            level (int): level of the pyramid
+
+        Returns:
+            dict: tiles, offsets, pixels and counts arrays of the level
+        """
+        if level not in self.levels:
+            with np.load(self.tiles_path) as stored_tiles:
+                self.levels[level] = {name: stored_tiles[name + '_' + str(level)] for name in ['tiles', 'offsets', 'pixels', 'counts']}
+        return self.levels[level]
+
+    def raster(self, x_range: tuple = None, y_range: tuple = None, width: int = 800) -> tuple:
+        """Assembles the crash counts of a view from the tiles it covers, at the first level with at least width pixels across it
+
+        Args:
+            x_range (tuple, optional): longitudes of the west and east edges of the view, the whole city if None
+            y_range (tuple, optional): latitudes of the south and north edges of the view, the whole city if None
+            width (int, optional): width of the view on screen, in pixels
+
+        Returns:
+            tuple: counts of each pixel (NaN where there are no crashes, first row to the north), and their
+            (west, south, east, north) bounds
+        """
+        west, east = np.clip(x_range if x_range is not None else (self.west, self.east), self.west, self.east)
+        south, north = np.clip(y_range if y_range is not None else (self.south, self.north), self.south, self.north)
+        visible_fraction = max((east - west) / (self.east - self.west), 1e-9)
+        level = int(np.clip(np.ceil(np.log2(width / (TILE_SIZE * visible_fraction))), 0, MAX_LEVEL))
+        pixels_across = TILE_SIZE * 2 ** level
+        first_column = int(np.floor((west - self.west) / (self.east - self.west) * pixels_across))
+        last_column = max(int(np.ceil((east - self.west) / (self.east - self.west) * pixels_across)), first_column + 1)
+        first_row = int(np.floor((self.north - north) / (self.north - self.south) * pixels_across))
+        last_row = max(int(np.ceil((self.north - south) / (self.north - self.south) * pixels_across)), first_row + 1)
+        first_tile_row, first_tile_column = first_row // TILE_SIZE, first_column // TILE_SIZE
+        tile_rows = range(first_tile_row, (last_row - 1) // TILE_SIZE + 1)
+        tile_columns = range(first_tile_column, (last_column - 1) // TILE_SIZE + 1)
+        view = np.zeros((len(tile_rows) * TILE_SIZE, len(tile_columns) * TILE_SIZE), dtype=np.float32)
+        arrays = self.level_arrays(level)
+        for tile_row in tile_rows:
+            for tile_column in tile_columns:
+                position = np.searchsorted(arrays['tiles'], tile_row * 2 ** level + tile_column)
+                if position == len(arrays['tiles']) or arrays['tiles'][position] != tile_row * 2 ** level + tile_column:
+                    continue # no crashes in this tile
+                start, end = arrays['offsets'][position], arrays['offsets'][position + 1]
+                tile = np.zeros(TILE_SIZE * TILE_SIZE, dtype=np.float32)
+                tile[arrays['pixels'][start:end]] = arrays['counts'][start:end]
+                top, left = (tile_row - first_tile_row) * TILE_SIZE, (tile_column - first_tile_column) * TILE_SIZE
+                view[top:top + TILE_SIZE, left:left + TILE_SIZE] = tile.reshape(TILE_SIZE, TILE_SIZE)
+        top, left = first_tile_row * TILE_SIZE, first_tile_column * TILE_SIZE
+        view = view[first_row - top:last_row - top, first_column - left:last_column - left]
+        view[view == 0] = np.nan # empty pixels are left transparent
+        bounds = (self.west + first_column / pixels_across * (self.east - self.west),
+                  self.north - last_row / pixels_across * (self.north - self.south),
+                  self.west + last_column / pixels_across * (self.east - self.west),
+                  self.north - first_row / pixels_across * (self.north - self.south))
+        return view, bounds
@@ -7,34 +7,92 @@ import numpy as np
 
 sys.path.append(os.path.abspath(os.path.dirname(__file__) + "/.."))
 
+from instrumentation import trace_class
+from data_cleansing.data_loader import collision_data
+from visualizations.rendering import figure_renderer
 from data_cleansing.data_pre_processing import LiscenseStatusCollisionData
 
+IMPORTANT_FACTORS = ['Driver Inattention/Distraction', 'Driver Inexperience'] # factors related to inattention/inexperience
+FACTOR_CLASSES = ['Inattention/Inexperience Related', 'Unspecified', 'Other'] # possible classes of the contributing factors
+
+@trace_class
 class LiscenseStatusTrends:
-    def __init__(self):
-        self.collision_data = LiscenseStatusCollisionData().complete_liscense_status_df 
+    def __init__(self, data_source=collision_data, cube=None):
+        self.cube = cube
+        if cube is not None: # one row per combination of borough, license status and factors, weighted by its 'VEHICLES' count
+            self.collision_data = cube.vehicle_counts()
+        else:
+            self.collision_data = LiscenseStatusCollisionData(data_source).complete_liscense_status_df
+
+    @staticmethod
+    def composition_from_counts(counts: pd.Series, column: str) -> pd.DataFrame:
+        """Turns counts by borough into the percentage of collisions of each category inside each borough
 
-    def classify_contributing_factor(self, row):
-        """Classify contributing factors as inattention/inexperience related, unspecified, or other.
-        
         Args:
-            row (pd.Series): A row from the DataFrame containing contributing factor data.
+            counts (pd.Series): counts indexed by borough and category
+            column (str): name of the category column
+
+        Returns:
+            pd.DataFrame: same layout as the borough compositions computed from the rows
+        """
+        percentages = counts / counts.groupby(level='BOROUGH').transform('sum')
+        composition = percentages.rename_axis(['BOROUGH', column]).reset_index(name='Percentage of Collisions')
+        composition = composition[composition['Percentage of Collisions'] > 0]
+        return composition.sort_values(by=['BOROUGH', 'Percentage of Collisions'], ascending=[True, False], kind='stable').reset_index(drop=True)
+
+    @staticmethod
+    def population_composition_from_counts(counts: pd.Series, column: str) -> pd.DataFrame:
+        """Turns counts by category into the percentage of collisions of each category in all of NYC
+
+        Args:
+            counts (pd.Series): counts indexed by category
+            column (str): name of the category column
+
+        Returns:
+            pd.DataFrame: same layout as the population compositions computed from the rows
+        """
+        percentages = (counts / counts.sum()).rename_axis(column).sort_values(ascending=False, kind='stable')
+        composition = percentages.reset_index(name='Percentage of Collisions')
+        composition = composition[composition['Percentage of Collisions'] > 0]
+        composition['BOROUGH'] = 'All NYC'
+        return composition
+
+    def count_vehicles(self, columns: list) -> pd.Series:
+        """Sums the vehicles of the cube by some of its columns
+
+        Args:
+            columns (list): columns the vehicles are grouped by
+
+        Returns:
+            pd.Series: vehicles of each combination of the columns that happened
+        """
+        return self.collision_data.groupby(columns, observed=True)['VEHICLES'].sum()
+
+    def classify_contributing_factor(self) -> pd.Series:
+        """Classify contributing factors of every vehicle as inattention/inexperience related, unspecified, or other.
         
         Returns:
-            str: Classification of the contributing factor.
+            pd.Series: Categorical classification of the contributing factors of each row of the collision data.
         """
         try:
-            contributing_factor_1 = row['CONTRIBUTING_FACTOR_1']  
-            contributing_factor_2 = row['CONTRIBUTING_FACTOR_2']  
-            important_factors = ['Driver Inattention/Distraction', 'Driver Inexperience']  # Important factors list
-            if contributing_factor_1 in important_factors or contributing_factor_2 in important_factors:
-                return 'Inattention/Inexperience Related'  # Classify as inattention/inexperience related
-            elif contributing_factor_1 == 'Unspecified' and contributing_factor_2 == 'Unspecified':
-                return 'Unspecified'  # Classify as unspecified
-            else:
-                return 'Other'  # Classify as other
+            factor_1 = pd.Categorical(self.collision_data['CONTRIBUTING_FACTOR_1'])
+            factor_2 = pd.Categorical(self.collision_data['CONTRIBUTING_FACTOR_2'])
+            # each test is done once per distinct factor and spread to all rows through the categorical codes (missing factors, code -1, fail every test)
+            important_1 = np.append(factor_1.categories.isin(IMPORTANT_FACTORS), False)[factor_1.codes]
+            important_2 = np.append(factor_2.categories.isin(IMPORTANT_FACTORS), False)[factor_2.codes]
+            unspecified_1 = np.append(factor_1.categories == 'Unspecified', False)[factor_1.codes]
+            unspecified_2 = np.append(factor_2.categories == 'Unspecified', False)[factor_2.codes]
+            class_codes = np.select([important_1 | important_2, unspecified_1 & unspecified_2], [0, 1], default=2) # position in FACTOR_CLASSES
+            return pd.Series(pd.Categorical.from_codes(class_codes, categories=FACTOR_CLASSES), index=self.collision_data.index)
         except KeyError as error:
             return 'Dataframe passed has inconsistent/unaccounted keys'
 
+    def add_contributing_factor_class(self):
+        """Adds the contributing factor class to the collision data, classifying it only the first time it is needed
+        """
+        if 'CONTRIBUTING FACTOR CLASS' not in self.collision_data.columns:
+            self.collision_data['CONTRIBUTING FACTOR CLASS'] = self.classify_contributing_factor()
+
     def get_borough_collision_composition(self) -> pd.DataFrame:
         """Compute the composition of collisions by contributing factor class for each borough.
         
@@ -42,10 +100,13 @@ class LiscenseStatusTrends:
             pd.DataFrame: DataFrame with the percentage of collisions by contributing factor class for each borough.
         """
         try:
-            # classify CF
-            self.collision_data['CONTRIBUTING FACTOR CLASS'] = self.collision_data.apply(self.classify_contributing_factor, axis=1)  
+            # classify CF - reused by every composition after the first one
+            self.add_contributing_factor_class()
+            if self.cube is not None:
+                return self.composition_from_counts(self.count_vehicles(['BOROUGH', 'CONTRIBUTING FACTOR CLASS']), 'CONTRIBUTING FACTOR CLASS')
             # calculate percentage of collisions caused by specific CF class
-            borough_group_collisions = self.collision_data.groupby(by='BOROUGH')[['CONTRIBUTING FACTOR CLASS']].value_counts(normalize=True).reset_index(name='Percentage of Collisions')  
+            borough_group_collisions = self.collision_data.groupby(by='BOROUGH', observed=True)[['CONTRIBUTING FACTOR CLASS']].value_counts(normalize=True).reset_index(name='Percentage of Collisions')  
+            borough_group_collisions = borough_group_collisions[borough_group_collisions['Percentage of Collisions'] > 0] # classes that never happened in a borough have no share
             return borough_group_collisions 
         except KeyError as error:
             return 'Dataframe passed has inconsistent/unaccounted keys'
@@ -55,10 +116,13 @@ class LiscenseStatusTrends:
             pd.DataFrame: DataFrame with the percentage of collisions by contributing factor class for all of NYC.
         """
         try:
-            # classify each CF class
-            self.collision_data['CONTRIBUTING FACTOR CLASS'] = self.collision_data.apply(self.classify_contributing_factor, axis=1)  
+            # classify each CF class - reused by every composition after the first one
+            self.add_contributing_factor_class()
+            if self.cube is not None:
+                return self.population_composition_from_counts(self.count_vehicles('CONTRIBUTING FACTOR CLASS'), 'CONTRIBUTING FACTOR CLASS')
             # calculate percentage of collisions caused by specific CF class
             population_collision_composition = self.collision_data[['CONTRIBUTING FACTOR CLASS']].value_counts(normalize=True).reset_index(name='Percentage of Collisions')  
+            population_collision_composition = population_collision_composition[population_collision_composition['Percentage of Collisions'] > 0] # classes that never happened have no share
             population_collision_composition['BOROUGH'] = 'All NYC'  
             return population_collision_composition  
         except KeyError as error:
@@ -69,8 +133,11 @@ class LiscenseStatusTrends:
             pd.DataFrame: DataFrame with the percentage of collisions by driver license status for each borough.
         """
         try:
+            if self.cube is not None:
+                return self.composition_from_counts(self.count_vehicles(['BOROUGH', 'DRIVER_LICENSE_STATUS']), 'DRIVER_LICENSE_STATUS')
             # return dataframe which breaksdown the composition of collisons in each borugh cause dby a specifica driver licesnse status
-            borough_license_composition = self.collision_data.groupby(by='BOROUGH')['DRIVER_LICENSE_STATUS'].value_counts(normalize=True).reset_index(name='Percentage of Collisions')  
+            borough_license_composition = self.collision_data.groupby(by='BOROUGH', observed=True)['DRIVER_LICENSE_STATUS'].value_counts(normalize=True).reset_index(name='Percentage of Collisions')  
+            borough_license_composition = borough_license_composition[borough_license_composition['Percentage of Collisions'] > 0] # statuses that never happened in a borough have no share
             return borough_license_composition  
         except KeyError as error:
             return 'Dataframe passed has inconsistent/unaccounted keys'
@@ -80,8 +147,11 @@ class LiscenseStatusTrends:
             pd.DataFrame: DataFrame with the percentage of collisions by driver license status for all of NYC.
         """
         try:
+            if self.cube is not None:
+                return self.population_composition_from_counts(self.count_vehicles('DRIVER_LICENSE_STATUS'), 'DRIVER_LICENSE_STATUS')
             # produce percentage of all ollisions with a specific kind of driver license status
             population_license_composition = self.collision_data['DRIVER_LICENSE_STATUS'].value_counts(normalize=True).reset_index(name='Percentage of Collisions') 
+            population_license_composition = population_license_composition[population_license_composition['Percentage of Collisions'] > 0] # statuses that never happened have no share
             population_license_composition['BOROUGH'] = 'All NYC'  
             return population_license_composition  
         except KeyError as error:
@@ -101,7 +171,7 @@ class LiscenseStatusTrends:
 
             for index,each_area in enumerate(all_area_names): # for each area plot in respective subplot a piechart of composition
                 area_sample = complete_lisc_comp[complete_lisc_comp['BOROUGH'] == each_area]
-                percentages = area_sample['Perecentage of Collisions']
+                percentages = area_sample['Percentage of Collisions']
                 labels  = area_sample['DRIVER_LICENSE_STATUS']
                 color_palette = plt.viridis()
                 pie_ax = axes.flatten()[index] 
@@ -116,7 +186,7 @@ class LiscenseStatusTrends:
                 pie_ax.set_title(each_area)   
             fig.legend(labels=labels, loc='center right', title="Driver License Status")         
             fig.tight_layout(rect=[0, 0, 0.85, 1])
-            plt.show()
+            figure_renderer.show('borough_license_composition')
         except KeyError as error:
             return 'Dataframe passed has inconsistent/unaccounted keys'
 
@@ -134,7 +204,7 @@ class LiscenseStatusTrends:
 
             for index,each_area in enumerate(all_area_names): # for each area plot in respective subplot a piechart of composition
                 area_sample = complete_collision_comp[complete_collision_comp['BOROUGH'] == each_area]
-                percentages = area_sample['Perecentage of Collisions']
+                percentages = area_sample['Percentage of Collisions']
                 labels  = area_sample['CONTRIBUTING FACTOR CLASS']
                 color_palette = plt.viridis()
                 pie_ax = axes.flatten()[index] 
@@ -149,7 +219,7 @@ class LiscenseStatusTrends:
                 pie_ax.set_title(each_area)   
             fig.legend(labels=labels, loc='center right', title="Contributing Factor Class")         
             fig.tight_layout(rect=[0, 0, 0.85, 1])
-            plt.show()
+            figure_renderer.show('borough_collision_composition')
         except KeyError as error:
             return 'Dataframe passed has inconsistent/unaccounted keys'
     def scatter_plot(self):
@@ -161,15 +231,15 @@ class LiscenseStatusTrends:
             borough_lisc_comp = self.get_borough_liscense_composition()
             
             # perecentage of collisions with CF as inattention/inexperience
-            borough_inattention_collisions = borough_collision_comp[borough_collision_comp['CONTRIBUTING FACTOR CLASS'] == 'Inattention/Inexeprience Related']
+            borough_inattention_collisions = borough_collision_comp[borough_collision_comp['CONTRIBUTING FACTOR CLASS'] == 'Inattention/Inexperience Related']
 
             # dataframe of sepearte percentages of all collisions in a single borough cause by both unliscned and permit drivers
             filtered_borough_lisc_comp = borough_lisc_comp[borough_lisc_comp['DRIVER_LICENSE_STATUS'] != 'Licensed']
             # dataframe that claculates the total percetnage of both unliscensed and permit frivers in a borough
-            sum_borough_lisc_comp = filtered_borough_lisc_comp.groupby(by='BOROUGH',as_index=False)['Perecentage of Collisions'].sum()
+            sum_borough_lisc_comp = filtered_borough_lisc_comp.groupby(by='BOROUGH',as_index=False, observed=True)['Percentage of Collisions'].sum() # only the boroughs in the data, e.g. of a query
             
-            x_axis_percentage_of_drivers = sum_borough_lisc_comp['Perecentage of Collisions']
-            y_axis_percentage_of_collisions = borough_inattention_collisions['Perecentage of Collisions']
+            x_axis_percentage_of_drivers = sum_borough_lisc_comp['Percentage of Collisions']
+            y_axis_percentage_of_collisions = borough_inattention_collisions['Percentage of Collisions']
             borough_names = sum_borough_lisc_comp['BOROUGH']
             #creating scatter plot based on known percentages
             plt.scatter(x=x_axis_percentage_of_drivers, y=y_axis_percentage_of_collisions)
@@ -189,6 +259,6 @@ class LiscenseStatusTrends:
             plt.xlabel('Percentage of Unlicensed/Permit Drivers',labelpad=2)
             plt.ylabel('Percentage of Inattention/Inexperience Collisions',labelpad=2)
             plt.tight_layout()
-            plt.show()
+            figure_renderer.show('license_vs_inattention')
         except KeyError as error:
             return 'Dataframe passed has inconsistent/unaccounted keys'
\ No newline at end of file
@@ -4,10 +4,21 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 
-df_person_colision = pd.read_csv("src/dados/Motor_Vehicle_Collisions_-_Person.csv")
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.dirname(__file__) + "/.."))
+
+from instrumentation import trace_class
+from data_cleansing.data_loader import collision_data
+from data_cleansing.collision_schema import replace_labels
+from visualizations.rendering import figure_renderer
+
+CAR_SEAT_COLUMNS = ['PERSON_TYPE', 'PERSON_INJURY', 'POSITION_IN_VEHICLE', 'SAFETY_EQUIPMENT', 'COMPLAINT']
+collision_data.register_columns('person', CAR_SEAT_COLUMNS) # registered at import so the person data is read only once
+@trace_class
 class CarSeatDangers:
-    def __init__(self):
-        self.df = df_person_colision.copy(deep=True)
+    def __init__(self, data_source=collision_data):
+        self.df = data_source.get_table('person', CAR_SEAT_COLUMNS)
         self.serious = np.array(["Amputation", 
                                  "Paralysis", 
                                  "Severe Burn", 
@@ -27,6 +38,7 @@ class CarSeatDangers:
                                "None Visible", 
                                "Complaint of Pain", 
                                "Complaint of Pain or Nausea"])
+        self.clean_df = None # cleaned person data, produced only once by replace_values
         
 
     def remove_lines(self, df_person_colision: pd.DataFrame) -> pd.DataFrame:
@@ -76,6 +88,8 @@ class CarSeatDangers:
         df_person_colision
 
         """
+        if self.clean_df is not None: # lines were already removed and replaced, reuse them
+            return self.clean_df
         try:
             # replacement of values ​​in the POSITION_IN_VEHICLE column with smaller values
             replace_values = {
@@ -91,8 +105,9 @@ class CarSeatDangers:
             }
             clean_df = self.remove_lines(self.df)
             # Replacing the values ​​in the POSITION_IN_VEHICLE column
-            clean_df['POSITION_IN_VEHICLE'] = clean_df['POSITION_IN_VEHICLE'].replace(replace_values)
+            clean_df['POSITION_IN_VEHICLE'] = replace_labels(clean_df['POSITION_IN_VEHICLE'], replace_values) # renames the categories, not every row
             
+            self.clean_df = clean_df
             return clean_df
         except KeyError as error:
             return 'Dataframe passed has inconsistent/unaccounted keys'
@@ -117,28 +132,27 @@ class CarSeatDangers:
         accident_count
         """
         try:
-            self.positions = self.replace_values()['POSITION_IN_VEHICLE'].unique().tolist()
-            accident_count = np.zeros((len(self.positions), 3)) 
             clean_df = self.replace_values()
-            clean_df['position_idx'] = clean_df['POSITION_IN_VEHICLE'].map(lambda pos: self.positions.index(pos))
-
-            # Iterating over all rows of the df_pessoas DataFrame
-            for _, row in clean_df.iterrows(): # iterrows returns a tuple (index, data), but only data value is needed
-                # Find the position index
-                idx = self.positions.index(row['POSITION_IN_VEHICLE'])
-                
-                # If the person died, we will classify it as a serious accident as well
-                if row['PERSON_INJURY'] == "Killed":
-                    accident_count[idx][0] += 1      
-                # Checking the type of injury and increment the correct count
-                elif row['COMPLAINT'] in self.serious:
-                    accident_count[idx][0] += 1
-                elif row['COMPLAINT'] in self.moderate:
-                    accident_count[idx][1] += 1
-                elif row['COMPLAINT'] in self.minor:
-                    accident_count[idx][2] += 1
-
-            return np.array(accident_count)
+            # positions get codes in the order they first appear, the same order as unique()
+            position_codes, positions = pd.factorize(clean_df['POSITION_IN_VEHICLE'])
+            self.positions = positions.tolist()
+
+            # Mapping each complaint to its severity: 0 for serious, 1 for moderate, 2 for minor and -1 for the ones not counted
+            complaints = pd.Categorical(clean_df['COMPLAINT'])
+            severity_of_complaint = np.full(len(complaints.categories) + 1, -1, dtype=np.int64) # last slot is for missing complaints (code -1)
+            severity_of_complaint[:-1][complaints.categories.isin(self.serious)] = 0
+            severity_of_complaint[:-1][complaints.categories.isin(self.moderate)] = 1
+            severity_of_complaint[:-1][complaints.categories.isin(self.minor)] = 2
+            severity = severity_of_complaint[complaints.codes]
+            # If the person died, we will classify it as a serious accident as well
+            severity[(clean_df['PERSON_INJURY'] == 'Killed').to_numpy()] = 0
+
+            # Counting every position and severity pair at once
+            counted = (severity >= 0) & (position_codes >= 0)
+            accident_count = np.bincount(position_codes[counted] * 3 + severity[counted], minlength=len(self.positions) * 3)
+            accident_count = accident_count.reshape(len(self.positions), 3).astype(float)
+
+            return accident_count
         except KeyError as error:
             return 'Dataframe passed has inconsistent/unaccounted keys'
     def show_graph(self):
@@ -160,7 +174,7 @@ class CarSeatDangers:
         """
         try:
             accident_count = self.data_processing()
-            positions = self.replace_values()['POSITION_IN_VEHICLE'].unique().tolist()
+            positions = self.positions
 
             # Separating the 'accident_count' matrix into distinct columns in the DataFrame
             df = pd.DataFrame({
@@ -183,6 +197,6 @@ class CarSeatDangers:
             plt.legend(title='Injury Severity')
 
             # Showing the graph
-            plt.show()
+            figure_renderer.show('seat_position_severity')
         except KeyError as error:
             return 'Dataframe passed has inconsistent/unaccounted keys'
\ No newline at end of file
@@ -0,0 +1,68 @@
+# Module that decides where finished figures go: an interactive window, or image files written to an output folder
+import os
+import matplotlib
+import matplotlib.pyplot as plt
+
+FIGURE_FORMATS = ['png', 'svg'] # formats each figure is written in when rendering to files
+
+
+class FigureRenderer:
+    """Class responsible for delivering the figures of every analysis - shown on screen by default, or saved
+    to an output folder when configured, so the whole report can be produced without anyone watching
+    """
+    def __init__(self, output_dir: str = None, formats: list = FIGURE_FORMATS):
+        self.output_dir = output_dir # None means figures are shown interactively
+        self.formats = formats
+
+    def configure(self, output_dir: str = None, formats: list = FIGURE_FORMATS):
+        """Chooses between showing figures and writing them to files
+
+        Args:
+            output_dir (str, optional): folder figures are written to, None to show them on screen
+            formats (list, optional): image formats each matplotlib figure is saved in, e.g. ['png', 'svg']
+        """
+        self.output_dir = output_dir
+        self.formats = formats
+        if output_dir is not None:
+            matplotlib.use('Agg') # no display needed, nothing can block waiting for a window to be closed
+            os.makedirs(output_dir, exist_ok=True)
+
+    def show(self, name: str) -> list:
+        """Delivers the current matplotlib figure
+
+        Args:
+            name (str): file name of the figure, without extension
+
+        Returns:
+            list: paths of the files written, empty when the figure was shown on screen
+        """
+        if self.output_dir is None:
+            plt.show()
+            return []
+        figure = plt.gcf()
+        paths = [os.path.join(self.output_dir, name + '.' + file_format) for file_format in self.formats]
+        for path in paths:
+            figure.savefig(path, bbox_inches='tight')
+        plt.close(figure) # next plot starts on a clean figure, as it would after closing the window
+        return paths
+
+    def show_interactive(self, plot, name: str) -> list:
+        """Delivers a HoloViews plot, written as a standalone html page when rendering to files
+
+        Args:
+            plot: plot produced by hvplot
+            name (str): file name of the page, without extension
+
+        Returns:
+            list: path of the page written, empty when the plot was opened on the browser
+        """
+        import hvplot # only the map needs it, and it is slow to import
+        if self.output_dir is None:
+            hvplot.show(plot)
+            return []
+        path = os.path.join(self.output_dir, name + '.html')
+        hvplot.save(plot, path)
+        return [path]
+
+
+figure_renderer = FigureRenderer() # shared by every visualization, configured once by the entry point
@@ -3,44 +3,72 @@ import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 
-crashes = pd.read_csv("src/dados/Motor_Vehicle_Collisions_-_Crashes.csv")
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.dirname(__file__) + "/.."))
 
+from instrumentation import trace_class
+from data_cleansing.data_loader import collision_data
+from visualizations.rendering import figure_renderer
+
+SEASONAL_ALCOHOL_COLUMNS = ['CRASH DATE', 'CONTRIBUTING FACTOR VEHICLE 1']
+collision_data.register_columns('crashes', SEASONAL_ALCOHOL_COLUMNS) # registered at import so crashes are read only once
+
+DRUGS = ["Drugs (illegal)"] # the collision schema already merges the "Drugs (Illegal)" spelling into this one
+ALCOHOL = ["Alcohol Involvement"]
+MONTH_ORDER = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]
+
+@trace_class
 class SeasonalAlcoholColissions:
     """
     Used to filter and plot data related to drug usage or alcohol drinking along the months of the year
     """
-    def __init__(self):
-        self.df = crashes.copy(deep=True)
+    def __init__(self, data_source=collision_data, cube=None):
+        self.cube = cube # a CollisionCube answers the monthly counts without reading the crashes
+        if cube is None:
+            self.df = data_source.get_table('crashes', SEASONAL_ALCOHOL_COLUMNS)
+
+    def count_by_month(self) -> pd.DataFrame:
+        """Counts accidents caused by drug usage and by alcohol usage in each month
+
+        Returns
+        -------
+        pd.DataFrame
+            Counts of both kinds of accident, one row per month number (1 to 12); counts of different
+            parts of the data can simply be added together
+        """
+        if self.cube is not None:
+            return self.cube.monthly_counts(DRUGS, ALCOHOL)
+        self.df['CRASH DATE'] = pd.to_datetime(self.df['CRASH DATE'], format="%m/%d/%Y")
+        months = self.df['CRASH DATE'].dt.month
+        # Filtering the months with the useful information (whether the accident was caused by drug usage or alcohol usage)
+        crashes_by_drugs = months[self.df["CONTRIBUTING FACTOR VEHICLE 1"].isin(DRUGS)]
+        crashes_by_alcohol = months[self.df["CONTRIBUTING FACTOR VEHICLE 1"].isin(ALCOHOL)]
+        # Counting each kind of accident by month to analyse seasonal data
+        return pd.DataFrame({'Drug Accidents': crashes_by_drugs.value_counts().reindex(range(1, 13), fill_value=0),
+                             'Alcohol Accidents': crashes_by_alcohol.value_counts().reindex(range(1, 13), fill_value=0)})
 
-    def data_processing(self) -> pd.DataFrame:
+    def data_processing(self, monthly_counts: pd.DataFrame = None) -> pd.DataFrame:
         """Cleans and categorize accidents
 
+        Parameters
+        ----------
+        monthly_counts : pd.DataFrame, optional
+            Counts already produced by count_by_month (e.g. summed over chunks of the data), counted from self.df if None
+
         Returns
         -------
         pd.DataFrame
             A pandas DataFrame with all the needed data to plot the figures
         """
         try:
-            self.df['CRASH DATE'] = pd.to_datetime(self.df['CRASH DATE'], format="%m/%d/%Y")
-            self.df['MONTH'] = self.df['CRASH DATE'].dt.month_name()
-            
-            drugs = ["Drugs (Illegal)", "Drugs (illegal)"]
-            alcohol = ["Alcohol Involvement"]
-            # Filtering the DataFrame with the useful information (whether the accident was caused by drug usage or alcohol usage)
-            crashes_by_drugs = self.df[self.df["CONTRIBUTING FACTOR VEHICLE 1"].isin(drugs)] 
-            crashes_by_alcohol = self.df[self.df["CONTRIBUTING FACTOR VEHICLE 1"].isin(alcohol)]
-            # Grouping each DataFrame by month to analyse seasonal data
-            crashes_by_drugs = crashes_by_drugs.groupby('MONTH').size().reset_index(name='Drug Accidents')
-            crashes_by_alcohol = crashes_by_alcohol.groupby('MONTH').size().reset_index(name='Alcohol Accidents')
-            # Merging both dataframes after counting accidents by month
-            processed_df = crashes_by_drugs.merge(crashes_by_alcohol, on='MONTH', how="outer")
-            processed_df = processed_df.dropna()  # Dropping rows without information
-            
-            month_order = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]
-            # Sort_values uses alphabetical order, pd.Categorical crates the correct month order
-            processed_df['MONTH'] = pd.Categorical(processed_df['MONTH'], categories=month_order, ordered=True)
-            processed_df = processed_df.sort_values(by='MONTH')
-            return processed_df
+            if monthly_counts is None:
+                monthly_counts = self.count_by_month()
+            # Months without accidents of one of the kinds have no information to compare, so they are dropped
+            processed_df = monthly_counts[(monthly_counts > 0).all(axis=1)]
+            # Sort_values would use alphabetical order, pd.Categorical keeps the correct month order
+            processed_df.insert(0, 'MONTH', pd.Categorical([MONTH_ORDER[month - 1] for month in processed_df.index], categories=MONTH_ORDER, ordered=True))
+            return processed_df.reset_index(drop=True)
         except KeyError as error:
             return'Dataframe passed has inconsistent/unaccounted keys'
 
@@ -69,6 +97,6 @@ class SeasonalAlcoholColissions:
             plt.title("Number of Accidents by Month (Drugs and Alcohol)")
             plt.xlabel("Month")
             plt.ylabel("Number of Accidents")
-            plt.show()
+            figure_renderer.show('seasonal_alcohol')
         except KeyError as error:
             return 'Dataframe passed has inconsistent/unaccounted keys'
\ No newline at end of file
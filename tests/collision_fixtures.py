@@ -0,0 +1,93 @@
+# Small collision datasets with the columns and raw spellings of the real csv files, so analyses can be tested without the 'dados' folder
+
+import sys
+import os
+import numpy as np
+import pandas as pd
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+from data_cleansing.data_loader import InMemoryDataSource, SOURCE_DTYPES
+
+
+def typed_table(source: str, rows: dict) -> pd.DataFrame:
+    """Builds a dataframe with the dtypes the loader parses the csv of a data source with
+
+    Args:
+        source (str): name of the data source
+        rows (dict): values of each column
+
+    Returns:
+        pd.DataFrame: columns typed as read from the csv, before the collision schema encodes them
+    """
+    return pd.DataFrame({column: pd.Series(values, dtype=SOURCE_DTYPES[source].get(column, object))
+                         for column, values in rows.items()})
+
+
+def crash_fixture() -> pd.DataFrame:
+    """Six crashes in January and July, one without borough or coordinates and two with an unspecified factor
+
+    Returns:
+        pd.DataFrame: crashes data source
+    """
+    return typed_table('crashes', {
+        'COLLISION_ID': [1, 2, 3, 4, 5, 6],
+        'CRASH DATE': ['01/15/2021', '01/20/2021', '07/04/2021', '07/05/2021', '07/10/2021', '01/02/2022'],
+        'CRASH TIME': ['8:30', '23:10', '14:00', '2:45', '17:20', '9:05'],
+        'BOROUGH': ['BROOKLYN', 'QUEENS', 'BROOKLYN', 'MANHATTAN', np.nan, 'MANHATTAN'],
+        'ZIP CODE': ['11201', '11368', '11215', '10001', np.nan, '10002'],
+        'LATITUDE': [40.6932, 40.7498, 40.6681, 40.7506, np.nan, 40.7157],
+        'LONGITUDE': [-73.9876, -73.8626, -73.9806, -73.9972, np.nan, -73.9863],
+        'ON STREET NAME': ['ATLANTIC AVENUE', 'ROOSEVELT AVENUE', '7 AVENUE', 'WEST 34 STREET', np.nan, 'DELANCEY STREET'],
+        'CROSS STREET NAME': ['FLATBUSH AVENUE', '90 STREET', '9 STREET', '8 AVENUE', np.nan, 'ESSEX STREET'],
+        'NUMBER OF PEDESTRIANS INJURED': [1, 0, 0, 0, 0, 1],
+        'NUMBER OF PEDESTRIANS KILLED': [0, 0, 0, 0, 0, 0],
+        'NUMBER OF CYCLIST INJURED': [0, 0, 1, 0, 0, 0],
+        'NUMBER OF CYCLIST KILLED': [0, 0, 0, 0, 0, 0],
+        'NUMBER OF MOTORIST INJURED': [0, 2, 0, 1, 0, 0],
+        'NUMBER OF MOTORIST KILLED': [0, 0, 0, 0, 0, 0],
+        'CONTRIBUTING FACTOR VEHICLE 1': ['Driver Inattention/Distraction', 'Alcohol Involvement', 'Drugs (Illegal)',
+                                          'Unspecified', 'Alcohol Involvement', 'Driver Inexperience'],
+        'CONTRIBUTING FACTOR VEHICLE 2': ['Unspecified', np.nan, np.nan, np.nan, np.nan, 'Driver Inattention/Distraction'],
+        'CONTRIBUTING FACTOR VEHICLE 3': [np.nan] * 6,
+        'CONTRIBUTING FACTOR VEHICLE 4': [np.nan] * 6,
+        'CONTRIBUTING FACTOR VEHICLE 5': [np.nan] * 6,
+    })
+
+
+def vehicle_fixture() -> pd.DataFrame:
+    """Vehicles of four of the crashes, plus one without license status and one of a crash that isn't in the data
+
+    Returns:
+        pd.DataFrame: vehicles data source
+    """
+    return typed_table('vehicles', {
+        'COLLISION_ID': [1, 1, 2, 4, 5, 6, 99],
+        'DRIVER_LICENSE_STATUS': ['Licensed', 'Unlicensed', 'Permit', 'Licensed', 'Licensed', np.nan, 'Licensed'],
+        'CONTRIBUTING_FACTOR_1': ['Driver Inattention/Distraction', 'Unspecified', 'Alcohol Involvement', 'Unspecified',
+                                  'Alcohol Involvement', 'Driver Inexperience', 'Unspecified'],
+        'CONTRIBUTING_FACTOR_2': ['Unspecified', 'Unspecified', 'Unspecified', np.nan, np.nan, np.nan, np.nan],
+    })
+
+
+def person_fixture() -> pd.DataFrame:
+    """Five people: two drivers and a front passenger without safety equipment, a belted driver and a pedestrian
+
+    Returns:
+        pd.DataFrame: person data source
+    """
+    return typed_table('person', {
+        'PERSON_TYPE': ['Occupant', 'Occupant', 'Occupant', 'Pedestrian', 'Occupant'],
+        'PERSON_INJURY': ['Injured', 'Killed', 'Injured', 'Injured', 'Injured'],
+        'POSITION_IN_VEHICLE': ['Driver', 'Front passenger, if two or more persons, including the driver, are in the front seat',
+                                'Driver', np.nan, 'Driver'],
+        'SAFETY_EQUIPMENT': [np.nan, np.nan, 'Lap Belt & Harness', np.nan, np.nan],
+        'COMPLAINT': ['Whiplash', 'Internal', 'Fracture - Dislocation', 'Concussion', 'Fracture - Dislocation'],
+    })
+
+
+def fixture_source() -> InMemoryDataSource:
+    """Data source over the three fixtures, accepted by every analysis class as its data_source
+
+    Returns:
+        InMemoryDataSource: nothing is read from disk or cached
+    """
+    return InMemoryDataSource({'crashes': crash_fixture(), 'vehicles': vehicle_fixture(), 'person': person_fixture()})
@@ -0,0 +1,130 @@
+# Local stand-in for the paginated API of NYC Open Data, serving the collision fixtures so the download can be tested offline
+
+import argparse
+import gzip
+import json
+import re
+import threading
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pandas as pd
+
+DATASET_SOURCES = {'h9gi-nx95': 'crashes', 'bm4k-52h4': 'vehicles', 'f55k-p6yu': 'person'} # data source of each id of the portal
+
+
+def api_rows(data: pd.DataFrame) -> pd.DataFrame:
+    """Turns a data source as read from the csv export into the rows the API serves, with lower case fields and
+    timestamps instead of dates (CRASH DATE 09/11/2021 -> crash_date 2021-09-11T00:00:00.000) plus the row id of the portal
+
+    Args:
+        data (pd.DataFrame): rows of the data source
+
+    Returns:
+        pd.DataFrame: rows of the dataset in the API
+    """
+    rows = data.copy()
+    for column in rows.columns:
+        if column.endswith('DATE'):
+            dates = pd.to_datetime(rows[column], format='%m/%d/%Y')
+            rows[column] = dates.dt.strftime('%Y-%m-%dT00:00:00.000')
+    rows.columns = [column.lower().replace(' ', '_') for column in rows.columns]
+    rows.insert(0, ':id', ['row-' + str(position) for position in range(len(rows))])
+    return rows
+
+
+class OpenDataServer(ThreadingHTTPServer):
+    """Server answering the requests the download sends: counts of rows as json and pages of rows as gzip csv
+
+    Failures can be injected for some pages, each a list of the statuses answered to the next requests of the page.
+    Every request is recorded, so tests can check which pages were downloaded
+    """
+    daemon_threads = True
+
+    def __init__(self, datasets: dict, failures: dict = None, port: int = 0):
+        super().__init__(('127.0.0.1', port), OpenDataHandler)
+        self.datasets = {dataset_id: api_rows(datasets[source]) for dataset_id, source in DATASET_SOURCES.items()
+                         if source in datasets}
+        self.failures = failures or {} # (dataset id, offset) -> statuses of the next requests of that page
+        self.requests = [] # (dataset id, offset) of each page requested, None as offset for counts
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+    def stop(self):
+        """Stops serving and closes the listening socket
+        """
+        self.shutdown()
+        self.server_close()
+
+
+class OpenDataHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keeps connections open, as the portal does
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        match = re.fullmatch(r'/resource/([\w-]+)\.(csv|json)', url.path)
+        if match is None or match.group(1) not in self.server.datasets:
+            return self.answer(404, b'', 'text/plain')
+        dataset_id, file_format = match.groups()
+        rows = self.server.datasets[dataset_id]
+        offset = int(query.get('$offset', 0)) if file_format == 'csv' else None
+        with self.server.lock:
+            self.server.requests.append((dataset_id, offset))
+            statuses = self.server.failures.get((dataset_id, offset), [])
+            status = statuses.pop(0) if statuses else 200
+        if status != 200:
+            return self.answer(status, b'', 'text/plain')
+        if file_format == 'json': # only counts are asked for, e.g. $select=count(*) AS row_count
+            alias = query.get('$select', '').rsplit(' ', 1)[-1]
+            return self.answer(200, json.dumps([{alias: str(len(rows))}]).encode(), 'application/json')
+        page = rows.iloc[offset:offset + int(query.get('$limit', 1000))]
+        return self.answer(200, page.to_csv(index=False).encode(), 'text/csv')
+
+    def answer(self, status: int, body: bytes, content_type: str):
+        """Sends an answer, compressed when the request accepts it
+        """
+        if body and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            compressed = True
+        else:
+            compressed = False
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if compressed:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # keeps the output of the tests clean
+
+
+def start_open_data_server(datasets: dict, failures: dict = None) -> OpenDataServer:
+    """Starts a server on a free port in a background thread
+
+    Args:
+        datasets (dict): rows of each data source, as read from the csv export
+        failures (dict, optional): statuses answered to the next requests of some pages, by dataset id and offset
+
+    Returns:
+        OpenDataServer: running server, whose base_url is given to the download - stopped with stop()
+    """
+    server = OpenDataServer(datasets, failures)
+    threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    from collision_fixtures import crash_fixture, vehicle_fixture, person_fixture
+    parser = argparse.ArgumentParser(description='Serves the collision fixtures as the NYC Open Data API, e.g. for python src/open_data_ingest.py --base-url')
+    parser.add_argument('--port', type=int, default=8000, help='port the server listens on')
+    arguments = parser.parse_args()
+
+    server = OpenDataServer({'crashes': crash_fixture(), 'vehicles': vehicle_fixture(), 'person': person_fixture()}, port=arguments.port)
+    print('Serving on ' + server.base_url)
+    server.serve_forever()
@@ -2,6 +2,9 @@
 
 import sys
 import os
+import io
+import importlib.util
+import tempfile
 import unittest
 import pandas as pd
 import numpy as np
@@ -9,32 +12,181 @@ sys.path.append(os.path.abspath(os.path.dirname(__file__) + "/.."))
 from src.visualizations import seasonal_alcohol
 from src.visualizations import liscense_status_vis
 from src.visualizations import crash_by_period_vis
+from src.visualizations import position_lethality_vis
+from collision_fixtures import fixture_source, crash_fixture, vehicle_fixture, person_fixture # small in-memory datasets, the tests never read the 'dados' folder
+from open_data_server import start_open_data_server # local stand-in for the open data API
+from open_data_ingest import OpenDataIngest
+from data_cleansing.data_loader import CollisionDataLoader, InMemoryDataSource, SOURCE_FILES
+from data_cleansing.data_pre_processing import CrashLocationData, LiscenseStatusCollisionData, CrashByPeriodData
+from data_cleansing.query_backends import DuckDBBackend, PolarsBackend
+from data_cleansing.collision_hotspots import IntersectionHotspots
+from data_cleansing.collision_query import CollisionIndex
+from data_cleansing.zip_centroids import ZipCentroidIndex
 
 class TestSeasonalAlcohol(unittest.TestCase):
     def test_data_processing(self):
-        obj = seasonal_alcohol.SeasonalAlcoholColissions()
+        obj = seasonal_alcohol.SeasonalAlcoholColissions(fixture_source())
         df = pd.DataFrame({
         'A': np.random.randn(10),
         'B': np.random.randn(10)})
         obj.df = df
         self.assertEqual(obj.data_processing(),'Dataframe passed has inconsistent/unaccounted keys')
 
+    def test_months_with_both_kinds_of_accident(self):
+        processed_df = seasonal_alcohol.SeasonalAlcoholColissions(fixture_source()).data_processing()
+        # January only has an alcohol accident, so July is the only month left
+        self.assertEqual(processed_df['MONTH'].tolist(), ['July'])
+        self.assertEqual(processed_df[['Drug Accidents', 'Alcohol Accidents']].values.tolist(), [[1, 1]])
+
 class TestLicenseStatusVis(unittest.TestCase):
     def test_get_borough_collision_composition(self):
-        strange_obj = liscense_status_vis.LiscenseStatusTrends()
+        strange_obj = liscense_status_vis.LiscenseStatusTrends(fixture_source())
         df = pd.DataFrame({
         'A': np.random.randn(10),
         'B': np.random.randn(10)})
         strange_obj.collision_data = df
         self.assertEqual(strange_obj.get_borough_collision_composition(),'Dataframe passed has inconsistent/unaccounted keys')
 
+    def test_get_borough_liscense_composition(self):
+        composition = liscense_status_vis.LiscenseStatusTrends(fixture_source()).get_borough_liscense_composition()
+        # vehicles without license status, without a known crash or whose crash has no borough are left out
+        percentages = {(str(borough), str(status)): percentage for borough, status, percentage in composition.values}
+        self.assertEqual(percentages, {('BROOKLYN', 'Licensed'): 0.5, ('BROOKLYN', 'Unlicensed'): 0.5,
+                                       ('MANHATTAN', 'Licensed'): 1.0, ('QUEENS', 'Permit'): 1.0})
+
 class TestCrashByPeriodVis(unittest.TestCase):
     def test_get_contributing_factor_counts(self):
-        strange_obj = crash_by_period_vis.CrashByPeriodTrends()
+        strange_obj = crash_by_period_vis.CrashByPeriodTrends(data_source=fixture_source())
         accidents_data = pd.DataFrame({
         'A': np.random.randn(10),
         'B': np.random.randn(10)})
         strange_obj.accidents_data = accidents_data
         self.assertEqual(strange_obj.get_contributing_factor_counts(),'Dataframe passed has inconsistent/unaccounted keys')
 
-unittest.main(verbosity=2)
+    def test_unspecified_factors_are_ignored(self):
+        factor_counts = crash_by_period_vis.CrashByPeriodTrends(data_source=fixture_source()).get_contributing_factor_counts()
+        # crashes with an unspecified factor are dropped whole, the other 4 crashes have 5 factors in total
+        self.assertNotIn('Unspecified', factor_counts.columns)
+        self.assertEqual(factor_counts.values.sum(), 5)
+        self.assertEqual(factor_counts.loc['mid_day', 'Alcohol Involvement'], 1)
+        self.assertEqual(factor_counts.loc['mid_day', 'Drugs (illegal)'], 1) # spelling normalized by the collision schema
+
+class TestCarSeatDangers(unittest.TestCase):
+    def test_data_processing(self):
+        obj = position_lethality_vis.CarSeatDangers(fixture_source())
+        accident_count = obj.data_processing()
+        # only people without safety equipment inside a vehicle count, a death is always serious
+        self.assertEqual(obj.positions, ['Driver', 'Front Passenger'])
+        self.assertEqual(accident_count.tolist(), [[0, 1, 1], [1, 0, 0]])
+
+class TestIntersectionHotspots(unittest.TestCase):
+    def test_zip_located_crashes_are_not_hotspots(self):
+        crashes = crash_fixture()
+        latitudes, longitudes = ZipCentroidIndex(cache_path=None).query(crashes['ZIP CODE'].iloc[[1]]) # built in memory, the tests write nothing
+        # crash 2 happened right at the centroid of its zip code, crash 4 shares that zip but was only located by it
+        crashes.loc[1, ['LATITUDE', 'LONGITUDE', 'NUMBER OF PEDESTRIANS INJURED']] = [latitudes[0], longitudes[0], 1]
+        crashes.loc[3, ['ZIP CODE', 'LATITUDE', 'LONGITUDE', 'NUMBER OF PEDESTRIANS INJURED']] = [crashes.loc[1, 'ZIP CODE'], np.nan, np.nan, 5]
+        crashes.loc[5, ['LATITUDE', 'LONGITUDE', 'NUMBER OF PEDESTRIANS INJURED']] = [np.nan, np.nan, 9] # zip code only, alone in its cell
+        geo_data = CrashLocationData(InMemoryDataSource({'crashes': crashes})).full_geo_data
+        self.assertEqual(geo_data['COORDINATES FROM ZIP'].tolist(), [False, False, False, True, True])
+        hotspots = IntersectionHotspots(geo_data).top_cells().set_index('ON STREET NAME') # pairs are named in alphabetical order
+        self.assertEqual(sorted(hotspots.index), ['7 AVENUE', '90 STREET', 'ATLANTIC AVENUE'])
+        self.assertEqual(hotspots.loc['90 STREET', ['CRASHES', 'NUMBER OF PEDESTRIANS INJURED']].tolist(), [1, 1])
+
+class TestCollisionIndex(unittest.TestCase):
+    def test_boroughs_are_matched_in_any_case(self):
+        selected = CollisionIndex(fixture_source()).query(boroughs=[' brooklyn', 'Manhattan'])
+        self.assertEqual(sorted(selected.get_table('crashes', ['COLLISION_ID'])['COLLISION_ID']), [1, 3, 4, 6])
+
+    def test_unknown_borough_is_rejected(self):
+        with self.assertRaises(KeyError):
+            CollisionIndex(fixture_source()).query(boroughs=['BROOKLYN', 'QUEENZ'])
+
+class QueryBackendTest:
+    """Cleaning classes read through a query engine must give the same frames as the pandas loader, over the fixtures written as csv
+    """
+    backend = None
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        # missing values are written as some of the tokens pandas reads as missing, e.g. SAFETY_EQUIPMENT 'None' in the real data
+        crash_fixture().to_csv(os.path.join(self.directory.name, SOURCE_FILES['crashes']), index=False, na_rep='NA')
+        vehicle_fixture().to_csv(os.path.join(self.directory.name, SOURCE_FILES['vehicles']), index=False, na_rep='N/A')
+        person_fixture().to_csv(os.path.join(self.directory.name, SOURCE_FILES['person']), index=False, na_rep='None')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def assert_same_cleaning(self, cleaned_data):
+        pandas_loader = CollisionDataLoader(self.directory.name, use_cache=False)
+        engine_loader = CollisionDataLoader(self.directory.name, use_cache=False)
+        engine_loader.use_backend(self.backend())
+        expected = cleaned_data(pandas_loader)
+        cleaned = cleaned_data(engine_loader)
+        self.assertIsInstance(cleaned, pd.DataFrame)
+        pd.testing.assert_frame_equal(cleaned, expected)
+
+    def test_crash_location_data(self):
+        self.assert_same_cleaning(lambda loader: CrashLocationData(loader).full_geo_data)
+
+    def test_liscense_status_collision_data(self):
+        self.assert_same_cleaning(lambda loader: LiscenseStatusCollisionData(loader).complete_liscense_status_df)
+
+    def test_crash_by_period_data(self):
+        self.assert_same_cleaning(lambda loader: CrashByPeriodData(loader).complete_crash_period_data)
+
+    def test_car_seat_dangers(self):
+        # people without safety equipment are the ones kept, so 'None' must be missing here too
+        self.assert_same_cleaning(lambda loader: position_lethality_vis.CarSeatDangers(loader).replace_values())
+
+@unittest.skipUnless(importlib.util.find_spec('duckdb'), 'duckdb is not installed')
+class TestDuckDBBackend(QueryBackendTest, unittest.TestCase):
+    backend = DuckDBBackend
+
+@unittest.skipUnless(importlib.util.find_spec('polars'), 'polars is not installed')
+class TestPolarsBackend(QueryBackendTest, unittest.TestCase):
+    backend = PolarsBackend
+
+class TestOpenDataIngest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.loader = CollisionDataLoader(self.directory.name, use_cache=False)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def downloaded(self, source):
+        return pd.read_csv(self.loader.source_path(source), dtype=str, keep_default_na=False)
+
+    def exported(self, data):
+        # the fixture as the portal's csv export writes it
+        return pd.read_csv(io.StringIO(data.to_csv(index=False)), dtype=str, keep_default_na=False)
+
+    def test_pages_are_written_in_order(self):
+        # a throttled page is retried, pages arriving out of order are still appended in order
+        server = start_open_data_server({'crashes': crash_fixture(), 'vehicles': vehicle_fixture()},
+                                        failures={('h9gi-nx95', 2): [503, 429]})
+        try:
+            ingest = OpenDataIngest(['crashes', 'vehicles'], self.loader, server.base_url, page_size=2, concurrency=3, backoff_seconds=0.01)
+            self.assertEqual(ingest.run(), {'crashes': 6, 'vehicles': 7})
+        finally:
+            server.stop()
+        pd.testing.assert_frame_equal(self.downloaded('crashes'), self.exported(crash_fixture()))
+        pd.testing.assert_frame_equal(self.downloaded('vehicles'), self.exported(vehicle_fixture()))
+        self.assertFalse(os.path.exists(self.loader.source_path('crashes') + '.checkpoint.json'))
+
+    def test_interrupted_download_is_resumed(self):
+        server = start_open_data_server({'crashes': crash_fixture()}, failures={('h9gi-nx95', 4): [404]})
+        try:
+            ingest = OpenDataIngest(['crashes'], self.loader, server.base_url, page_size=2, concurrency=1, backoff_seconds=0.01)
+            self.assertIsInstance(ingest.run(), str) # missing page, the download stops after the first two pages
+            self.assertFalse(os.path.exists(self.loader.source_path('crashes')))
+            server.requests.clear()
+            self.assertEqual(ingest.run(), {'crashes': 6})
+        finally:
+            server.stop()
+        self.assertEqual(server.requests, [('h9gi-nx95', 4)]) # neither the count nor the pages written are requested again
+        pd.testing.assert_frame_equal(self.downloaded('crashes'), self.exported(crash_fixture()))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)